@@ -0,0 +1,52 @@
+"""Compare the time of a full sync of a currency network for different batch sizes and concurrency
+
+Runs CurrencyNetworkProxy.gen_graph_representation against the JSON-RPC stand-in of
+benchmarks/rpc_standin.py. A batch size and concurrency of 1 makes the same number of
+round trips as the sequential calls used before.
+
+Usage: python benchmarks/full_sync.py [number_of_users] [number_of_trustlines] [latency_ms]
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault('THREADING_BACKEND', 'gevent')
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from rpc_standin import CurrencyNetworkStandin, abi, network_address, serve  # noqa: E402
+from graph_storage import random_network  # noqa: E402
+from web3 import Web3, RPCProvider  # noqa: E402
+
+from relay.blockchain.currency_network_proxy import CurrencyNetworkProxy  # noqa: E402
+
+
+def main():
+    number_of_users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    number_of_trustlines = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    latency = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 1 / 1000
+    users, friendsdict = random_network(number_of_users, number_of_trustlines)
+    standin = CurrencyNetworkStandin(users, friendsdict, latency)
+    server = serve(standin)
+    web3 = Web3(RPCProvider('127.0.0.1', server.server_port))
+
+    print('{} users, {} trustlines, {} ms latency'.format(number_of_users, number_of_trustlines, latency * 1000))
+    print('batch size  concurrency  requests   time [s]')
+    expected = None
+    for batch_size, concurrency in [(1, 1), (50, 1), (200, 1), (200, 4), (1000, 4)]:
+        proxy = CurrencyNetworkProxy(web3, abi, network_address,
+                                     sync_batch_size=batch_size, sync_concurrency=concurrency)
+        standin.number_of_requests = 0
+        start = time.perf_counter()
+        graph_representation = proxy.gen_graph_representation()
+        duration = time.perf_counter() - start
+        if expected is None:
+            expected = graph_representation
+        assert graph_representation == expected
+        print('{:10}  {:11}  {:8}  {:9.3f}'.format(batch_size, concurrency, standin.number_of_requests, duration))
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Compare memory usage and path search latency of the graph storage backends
+
+Usage: python benchmarks/graph_storage.py [number_of_users] [number_of_trustlines] [number_of_queries]
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from relay.blockchain.currency_network_proxy import Trustline  # noqa: E402
+from relay.network_graph.graph import CurrencyNetworkGraph  # noqa: E402
+from relay.network_graph.storage import storage_backends  # noqa: E402
+
+
+def random_network(number_of_users, number_of_trustlines, seed=0):
+    rnd = random.Random(seed)
+    users = ['0x{:040X}'.format(rnd.getrandbits(160)) for _ in range(number_of_users)]
+    pairs = set()
+    while len(pairs) < number_of_trustlines:
+        a, b = sorted(rnd.sample(users, 2))
+        pairs.add((a, b))
+    friendsdict = {}
+    for a, b in pairs:
+        friendsdict.setdefault(a, []).append(Trustline(b,
+                                                       rnd.randint(0, 10**6),
+                                                       rnd.randint(0, 10**6),
+                                                       rnd.randint(0, 1000),
+                                                       rnd.randint(0, 1000),
+                                                       0,
+                                                       0,
+                                                       int(time.time()),
+                                                       rnd.randint(-10**5, 10**5)))
+    return users, friendsdict
+
+
+def measure(storage, users, friendsdict, number_of_queries):
+    tracemalloc.start()
+    start = time.perf_counter()
+    graph = CurrencyNetworkGraph(100, storage=storage)
+    graph.gen_network(friendsdict)
+    build_time = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rnd = random.Random(1)
+    queries = [(rnd.sample(users, 2), rnd.randint(1, 10**5)) for _ in range(number_of_queries)]
+    start = time.perf_counter()
+    for (source, target), value in queries:
+        graph.find_path(source, target, value)
+    query_time = time.perf_counter() - start
+    return memory, build_time, query_time
+
+
+def main():
+    number_of_users = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    number_of_trustlines = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    number_of_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    users, friendsdict = random_network(number_of_users, number_of_trustlines)
+    print('{} users, {} trustlines, {} path queries'.format(number_of_users, number_of_trustlines, number_of_queries))
+    print('{:10} {:>14} {:>12} {:>12} {:>14}'.format('storage', 'bytes/edge', 'memory MB', 'build s', 'ms/query'))
+    for storage in sorted(storage_backends):
+        memory, build_time, query_time = measure(storage, users, friendsdict, number_of_queries)
+        print('{:10} {:14.1f} {:12.1f} {:12.3f} {:14.2f}'.format(
+            storage,
+            memory / number_of_trustlines,
+            memory / 2**20,
+            build_time,
+            1000 * query_time / number_of_queries))
+
+
+if __name__ == '__main__':
+    main()
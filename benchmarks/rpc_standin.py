@@ -0,0 +1,138 @@
+"""A local JSON-RPC stand-in for an ethereum node serving one currency network
+
+Answers the eth_calls the relay makes to a currency network contract from an in-memory
+network, with a fixed latency per HTTP request to simulate the round trip to a real node.
+Single and batch requests are supported.
+
+Usage: python benchmarks/rpc_standin.py [number_of_users] [number_of_trustlines] [latency_ms] [port]
+"""
+import json
+import os
+import sys
+
+from gevent import monkey
+monkey.patch_all(thread=False)
+
+import gevent  # noqa: E402
+from gevent.pywsgi import WSGIServer  # noqa: E402
+from eth_abi import decode_abi, encode_abi  # noqa: E402
+from eth_utils import (decode_hex, encode_hex, function_signature_to_4byte_selector,  # noqa: E402
+                       to_checksum_address)
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from graph_storage import random_network  # noqa: E402
+
+network_address = '0x55bdaAf9f941A5BB3EacC8D876eeFf90b90ddac9'
+
+
+def _function(name, inputs, outputs):
+    return {'type': 'function', 'name': name, 'constant': True, 'payable': False, 'stateMutability': 'view',
+            'inputs': [{'name': 'arg{}'.format(i), 'type': type} for i, type in enumerate(inputs)],
+            'outputs': [{'name': '', 'type': type} for type in outputs]}
+
+
+# the part of the currency network abi used by the relay for the full sync
+abi = [
+    _function('name', [], ['string']),
+    _function('symbol', [], ['string']),
+    _function('decimals', [], ['uint8']),
+    _function('getUsers', [], ['address[]']),
+    _function('getFriends', ['address'], ['address[]']),
+    _function('getAccount', ['address', 'address'], ['int256'] * 8),
+]
+
+
+class CurrencyNetworkStandin(object):
+
+    def __init__(self, users, friendsdict, latency=0.):
+        self.latency = latency
+        self.users = [to_checksum_address(user) for user in users]
+        self.friends = {user: [] for user in self.users}
+        self.accounts = {}
+        for a, trustlines in friendsdict.items():
+            a = to_checksum_address(a)
+            for trustline in trustlines:
+                b = to_checksum_address(trustline.address)
+                self.friends[a].append(b)
+                self.friends[b].append(a)
+                self.accounts[a, b] = list(trustline[1:])
+        self.functions = {}
+        for function_abi in abi:
+            input_types = [input['type'] for input in function_abi['inputs']]
+            output_types = [output['type'] for output in function_abi['outputs']]
+            signature = '{}({})'.format(function_abi['name'], ','.join(input_types))
+            self.functions[function_signature_to_4byte_selector(signature)] = (
+                getattr(self, function_abi['name']), input_types, output_types)
+        self.number_of_requests = 0
+        self.number_of_calls = 0
+
+    def name(self):
+        return ['Stand-in network']
+
+    def symbol(self):
+        return ['SIN']
+
+    def decimals(self):
+        return [2]
+
+    def getUsers(self):
+        return [self.users]
+
+    def getFriends(self, user):
+        return [self.friends.get(to_checksum_address(user), [])]
+
+    def getAccount(self, a, b):
+        a, b = to_checksum_address(a), to_checksum_address(b)
+        if (b, a) not in self.accounts:
+            return self.accounts.get((a, b), [0] * 8)
+        (creditline_ba, creditline_ab, interest_ba, interest_ab,
+         fees_outstanding_b, fees_outstanding_a, m_time, balance_ab) = self.accounts[b, a]
+        return [creditline_ab, creditline_ba, interest_ab, interest_ba,
+                fees_outstanding_a, fees_outstanding_b, m_time, -balance_ab]
+
+    def eth_call(self, transaction, block='latest'):
+        data = decode_hex(transaction['data'])
+        function, input_types, output_types = self.functions[data[:4]]
+        self.number_of_calls += 1
+        return encode_hex(encode_abi(output_types, function(*decode_abi(input_types, data[4:]))))
+
+    def _handle(self, request):
+        try:
+            result = getattr(self, request['method'])(*request['params'])
+        except Exception as e:
+            return {'jsonrpc': '2.0', 'id': request.get('id'), 'error': {'code': -32000, 'message': str(e)}}
+        return {'jsonrpc': '2.0', 'id': request.get('id'), 'result': result}
+
+    def __call__(self, environ, start_response):
+        request = json.loads(environ['wsgi.input'].read().decode('utf-8'))
+        self.number_of_requests += 1
+        gevent.sleep(self.latency)
+        if isinstance(request, list):
+            response = [self._handle(entry) for entry in request]
+        else:
+            response = self._handle(request)
+        start_response('200 OK', [('Content-Type', 'application/json')])
+        return [json.dumps(response).encode('utf-8')]
+
+
+def serve(standin, port=0):
+    """starts serving standin in the background, returns the server with its port in server.server_port"""
+    server = WSGIServer(('127.0.0.1', port), standin, log=None)
+    server.start()
+    return server
+
+
+def main():
+    number_of_users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    number_of_trustlines = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    latency = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.
+    port = int(sys.argv[4]) if len(sys.argv) > 4 else 8545
+    users, friendsdict = random_network(number_of_users, number_of_trustlines)
+    server = serve(CurrencyNetworkStandin(users, friendsdict, latency), port)
+    print('Serving currency network {} on port {}'.format(network_address, server.server_port))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -9,7 +9,7 @@ from eth_utils import is_address, to_checksum_address, is_checksum_address
 
 from .resources import GraphDump, GraphImage, RequestEther, User, UserList, Network, NetworkList, \
     ContactList, TrustlineList, Trustline, Spendable, SpendableTo, MaxCapacityPath, Path, ReduceDebtPath, \
-    UserEventsNetwork, UserEvents, Relay, Balance, TransactionInfos, Block, EventsNetwork
+    UserEventsNetwork, UserEvents, Relay, Balance, TransactionInfos, Block, EventsNetwork, Metrics
 from .streams.app import WebSocketRPCHandler, MessagingWebSocketRPCHandler
 
 from .exchange.resources import OrderBook, OrderSubmission, ExchangeAddresses, UnwEthAddresses, OrderDetail, \
@@ -68,6 +68,7 @@ def ApiApp(trustlines):
     add_resource(Balance, '/users/<address:user_address>/balance')
 
     add_resource(Block, '/blocknumber')
+    add_resource(Metrics, '/metrics')
     add_resource(Relay, '/relay')
 
     if trustlines.enable_ether_faucet:
@@ -7,6 +7,7 @@ from eth_utils import to_checksum_address, is_hex
 from marshmallow import validate
 from relay.relay import TrustlinesRelay
 from relay.api import fields
+from relay.api.pagination import page_args, events_response
 from relay.api.exchange.schemas import OrderSchema
 from relay.exchange.order import Order
 from relay.exchange.orderbook import OrderInvalidException
@@ -187,6 +188,7 @@ class UserEventsExchange(Resource):
                               validate=validate.OneOf(ExchangeProxy.event_types),
                               missing=None)
     }
+    args.update(page_args)
 
     @use_args(args)
     def get(self, args, exchange_address: str, user_address: str):
@@ -197,7 +199,9 @@ class UserEventsExchange(Resource):
             events = self.trustlines.get_user_exchange_events(exchange_address,
                                                               user_address,
                                                               type=type,
-                                                              from_block=from_block)
+                                                              from_block=from_block,
+                                                              after=args['cursor'],
+                                                              limit=args['limit'])
         except TimeoutException:
             logger.warning(
                 "User exchange events: event_name=%s user_address=%s from_block=%s. could not get events in time",
@@ -205,7 +209,7 @@ class UserEventsExchange(Resource):
                 user_address,
                 from_block)
             abort(504, TIMEOUT_MESSAGE)
-        return UserExchangeEventSchema().dump(events, many=True).data
+        return events_response(events, lambda event: UserExchangeEventSchema().dump(event).data, args['limit'])
 
 
 class EventsExchange(Resource):
@@ -219,6 +223,7 @@ class EventsExchange(Resource):
                               validate=validate.OneOf(ExchangeProxy.event_types),
                               missing=None)
     }
+    args.update(page_args)
 
     @use_args(args)
     def get(self, args, exchange_address: str):
@@ -226,11 +231,15 @@ class EventsExchange(Resource):
         from_block = args['fromBlock']
         type = args['type']
         try:
-            events = self.trustlines.get_exchange_events(exchange_address, type=type, from_block=from_block)
+            events = self.trustlines.get_exchange_events(exchange_address,
+                                                         type=type,
+                                                         from_block=from_block,
+                                                         after=args['cursor'],
+                                                         limit=args['limit'])
         except TimeoutException:
             logger.warning(
                 "Exchange events: event_name=%s from_block=%s. could not get events in time",
                 type,
                 from_block)
             abort(504, TIMEOUT_MESSAGE)
-        return ExchangeEventSchema().dump(events, many=True).data
+        return events_response(events, lambda event: ExchangeEventSchema().dump(event).data, args['limit'])
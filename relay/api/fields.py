@@ -2,6 +2,8 @@ from webargs import ValidationError
 from marshmallow import fields
 from eth_utils import is_address, to_checksum_address
 
+from relay.blockchain.pagination import encode_cursor, decode_cursor
+
 
 class Address(fields.String):
 
@@ -47,3 +49,17 @@ class HexBytes(fields.String):
             raise ValidationError('Could not parse Hex number')
 
         return int_value
+
+
+class Cursor(fields.String):
+    """the opaque position of an event that a page of events starts after"""
+
+    def _serialize(self, value, attr, obj):
+        return encode_cursor(value)
+
+    def _deserialize(self, value, attr, data):
+        value = super()._deserialize(value, attr, data)
+        try:
+            return decode_cursor(value)
+        except ValueError:
+            raise ValidationError('Invalid cursor')
@@ -0,0 +1,60 @@
+"""paging and streaming of event lists
+
+The event resources accept limit and cursor arguments. A page holds up to
+limit events after the cursor, the cursor of the next page is sent in the
+X-Next-Cursor header if the page is full. The addresses of the contracts whose
+events could not be read in time are sent in the X-Timed-Out-Sources header,
+their events are missing from the page. Events that are not mined yet are
+left out of pages. Clients that accept application/x-ndjson get the events
+streamed as one json document per line, the events of a query without limit
+are then read from the database while they are sent.
+"""
+import json
+from typing import Any, Callable, Iterable, List  # noqa: F401
+
+from flask import Response, request, stream_with_context
+from marshmallow import validate
+from webargs import fields
+
+from relay.api import fields as custom_fields
+from relay.blockchain.events import BlockchainEvent  # noqa: F401
+from relay.blockchain.pagination import next_cursor
+
+MAX_LIMIT = 1000
+NDJSON_MIMETYPE = 'application/x-ndjson'
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+TIMED_OUT_SOURCES_HEADER = 'X-Timed-Out-Sources'
+
+page_args = {
+    'limit': fields.Int(required=False, missing=None, validate=validate.Range(min=1, max=MAX_LIMIT)),
+    'cursor': custom_fields.Cursor(required=False, missing=None),
+}
+
+
+def wants_ndjson() -> bool:
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def events_response(events: Iterable[BlockchainEvent],
+                    serialize: Callable[[BlockchainEvent], Any],
+                    limit: int = None,
+                    timed_out: List[str] = None):
+    """returns the response for a page of events, serialize dumps a single event
+
+    events has to be a list if limit is given. timed_out are the addresses of the contracts
+    whose events are missing
+    """
+    headers = {}
+    cursor = next_cursor(events, limit)
+    if cursor is not None:
+        headers[NEXT_CURSOR_HEADER] = cursor
+    if timed_out:
+        headers[TIMED_OUT_SOURCES_HEADER] = ','.join(timed_out)
+
+    if wants_ndjson():
+        def generate():
+            for event in events:
+                yield json.dumps(serialize(event)) + '\n'
+        return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE, headers=headers)
+
+    return [serialize(event) for event in events], 200, headers
@@ -8,6 +8,7 @@ from webargs import fields
 from webargs.flaskparser import use_args
 from marshmallow import validate
 
+from relay import metrics
 from relay.utils import sha3
 from relay.blockchain.currency_network_proxy import CurrencyNetworkProxy
 from relay.blockchain.unw_eth_proxy import UnwEthProxy
@@ -15,6 +16,7 @@ from relay.blockchain.unw_eth_events import UnwEthEvent
 from relay.blockchain.exchange_events import ExchangeEvent
 from relay.blockchain.currency_network_events import CurrencyNetworkEvent
 from relay.api import fields as custom_fields
+from relay.api.pagination import page_args, events_response
 from .schemas import (CurrencyNetworkEventSchema,
                       UserCurrencyNetworkEventSchema,
                       UserTokenEventSchema,
@@ -185,10 +187,15 @@ class MaxCapacityPath(Resource):
         target = args['to']
         max_hops = args['maxHops']
 
-        capacity, path = self.trustlines.currency_network_graphs[network_address].find_maximum_capacity_path(
-            source=source,
-            target=target,
-            max_hops=max_hops)
+        try:
+            (capacity, path), _ = self.trustlines.search_path(network_address,
+                                                              'find_maximum_capacity_path',
+                                                              source=source,
+                                                              target=target,
+                                                              max_hops=max_hops)
+        except TimeoutException:
+            logger.warning("Max capacity path: from=%s to=%s. could not find path in time", source, target)
+            abort(504, TIMEOUT_MESSAGE)
 
         return {'capacity': str(capacity),
                 'path': path}
@@ -205,6 +212,7 @@ class UserEventsNetwork(Resource):
                            validate=validate.OneOf(CurrencyNetworkProxy.event_types),
                            missing=None)
     }
+    args.update(page_args)
 
     @use_args(args)
     def get(self, args, network_address: str, user_address: str):
@@ -215,7 +223,9 @@ class UserEventsNetwork(Resource):
             events = self.trustlines.get_user_network_events(network_address,
                                                              user_address,
                                                              type=type,
-                                                             from_block=from_block)
+                                                             from_block=from_block,
+                                                             after=args['cursor'],
+                                                             limit=args['limit'])
         except TimeoutException:
             logger.warning(
                 "User network events: event_name=%s user_address=%s from_block=%s. could not get events in time",
@@ -223,7 +233,7 @@ class UserEventsNetwork(Resource):
                 user_address,
                 from_block)
             abort(504, TIMEOUT_MESSAGE)
-        return UserCurrencyNetworkEventSchema().dump(events, many=True).data
+        return events_response(events, lambda event: UserCurrencyNetworkEventSchema().dump(event).data, args['limit'])
 
 
 class UserEvents(Resource):
@@ -238,16 +248,19 @@ class UserEvents(Resource):
                                                    UnwEthProxy.event_types),
                            missing=None)
     }
+    args.update(page_args)
 
     @use_args(args)
     def get(self, args, user_address: str):
         type = args['type']
         from_block = args['fromBlock']
         try:
-            events = self.trustlines.get_user_events(user_address,
-                                                     type=type,
-                                                     from_block=from_block,
-                                                     timeout=self.trustlines.event_query_timeout)
+            events, timed_out = self.trustlines.get_user_events_partial(user_address,
+                                                                        type=type,
+                                                                        from_block=from_block,
+                                                                        timeout=self.trustlines.event_query_timeout,
+                                                                        after=args['cursor'],
+                                                                        limit=args['limit'])
         except TimeoutException:
             logger.warning(
                 "User events: event_name=%s user_address=%s from_block=%s. could not get events in time",
@@ -255,15 +268,21 @@ class UserEvents(Resource):
                 user_address,
                 from_block)
             abort(504, TIMEOUT_MESSAGE)
-        serialized_events = []
-        for event in events:
+
+        def serialize(event):
             if isinstance(event, CurrencyNetworkEvent):
-                serialized_events.append(UserCurrencyNetworkEventSchema().dump(event).data)
+                return UserCurrencyNetworkEventSchema().dump(event).data
             if isinstance(event, UnwEthEvent):
-                serialized_events.append(UserTokenEventSchema().dump(event).data)
+                return UserTokenEventSchema().dump(event).data
             if isinstance(event, ExchangeEvent):
-                serialized_events.append(ExchangeEventSchema().dump(event).data)
-        return serialized_events
+                return ExchangeEventSchema().dump(event).data
+        events = (event for event in events if isinstance(event, (CurrencyNetworkEvent, UnwEthEvent, ExchangeEvent)))
+        if args['limit'] is not None:
+            events = list(events)
+        return events_response(events,
+                               serialize,
+                               args['limit'],
+                               timed_out)
 
 
 class EventsNetwork(Resource):
@@ -277,6 +296,7 @@ class EventsNetwork(Resource):
                            validate=validate.OneOf(CurrencyNetworkProxy.event_types),
                            missing=None)
     }
+    args.update(page_args)
 
     @use_args(args)
     def get(self, args, network_address: str):
@@ -284,14 +304,18 @@ class EventsNetwork(Resource):
         from_block = args['fromBlock']
         type = args['type']
         try:
-            events = self.trustlines.get_network_events(network_address, type=type, from_block=from_block)
+            events = self.trustlines.get_network_events(network_address,
+                                                        type=type,
+                                                        from_block=from_block,
+                                                        after=args['cursor'],
+                                                        limit=args['limit'])
         except TimeoutException:
             logger.warning(
                 "Network events: event_name=%s from_block=%s. could not get events in time",
                 type,
                 from_block)
             abort(504, TIMEOUT_MESSAGE)
-        return CurrencyNetworkEventSchema().dump(events, many=True).data
+        return events_response(events, lambda event: CurrencyNetworkEventSchema().dump(event).data, args['limit'])
 
 
 class TransactionInfos(Resource):
@@ -340,6 +364,15 @@ class Block(Resource):
         return self.trustlines.node.blocknumber
 
 
+class Metrics(Resource):
+
+    def __init__(self, trustlines: TrustlinesRelay) -> None:
+        self.trustlines = trustlines
+
+    def get(self):
+        return metrics.collect()
+
+
 class RequestEther(Resource):
 
     def __init__(self, trustlines: TrustlinesRelay) -> None:
@@ -373,12 +406,25 @@ class Path(Resource):
         max_fees = args['maxFees']
         max_hops = args['maxHops']
 
-        cost, path = self.trustlines.currency_network_graphs[network_address].find_path(
-            source=source,
-            target=target,
-            value=value,
-            max_fees=max_fees,
-            max_hops=max_hops)
+        graph = self.trustlines.currency_network_graphs[network_address]
+        key = (source, target, value, max_hops, max_fees)
+        result = graph.path_cache.get(key)
+        if result is not None:
+            return result
+
+        try:
+            # the estimation of the gas may wait for the node, so remember the state the path was found in
+            (cost, path), version = self.trustlines.search_path(network_address,
+                                                                'find_path',
+                                                                source=source,
+                                                                target=target,
+                                                                value=value,
+                                                                max_fees=max_fees,
+                                                                max_hops=max_hops)
+        except TimeoutException:
+            logger.warning("Path: from=%s to=%s value=%s. could not find path in time", source, target, value)
+            abort(504, TIMEOUT_MESSAGE)
+        found_path = path
 
         if path:
             try:
@@ -392,12 +438,16 @@ class Path(Resource):
                 gas = 0
                 path = []
                 cost = 0
+                found_path = None  # the graph is out of date, do not cache
         else:
             gas = 0
 
-        return {'path': path,
-                'estimatedGas': gas,
-                'fees': cost}
+        result = {'path': path,
+                  'estimatedGas': gas,
+                  'fees': cost}
+        if found_path is not None:
+            graph.path_cache.put(key, result, found_path, version)
+        return result
 
 
 class ReduceDebtPath(Resource):
@@ -425,13 +475,19 @@ class ReduceDebtPath(Resource):
         max_fees = args['maxFees']
         max_hops = args['maxHops']
 
-        cost, path = self.trustlines.currency_network_graphs[network_address].find_path_triangulation(
-            source=source,
-            target_reduce=target_reduce,
-            target_increase=target_increase,
-            value=value,
-            max_fees=max_fees,
-            max_hops=max_hops)
+        try:
+            (cost, path), _ = self.trustlines.search_path(network_address,
+                                                          'find_path_triangulation',
+                                                          source=source,
+                                                          target_reduce=target_reduce,
+                                                          target_increase=target_increase,
+                                                          value=value,
+                                                          max_fees=max_fees,
+                                                          max_hops=max_hops)
+        except TimeoutException:
+            logger.warning("Reduce debt path: from=%s to=%s via=%s. could not find path in time",
+                           source, target_reduce, target_increase)
+            abort(504, TIMEOUT_MESSAGE)
 
         if path:
             try:
@@ -9,6 +9,7 @@ from webargs.flaskparser import use_args
 from marshmallow import validate
 from typing import Union  # noqa: F401
 from relay.relay import TrustlinesRelay
+from relay.api.pagination import page_args, events_response
 
 
 def abort_if_unknown_token(trustlines, token_address):
@@ -49,6 +50,7 @@ class UserEventsToken(Resource):
                            validate=validate.OneOf(UnwEthProxy.event_types + TokenProxy.event_types),
                            missing=None)
     }
+    args.update(page_args)
 
     @use_args(args)
     def get(self, args, token_address: str, user_address: str):
@@ -59,9 +61,11 @@ class UserEventsToken(Resource):
         events = self.trustlines.get_user_token_events(token_address,
                                                        user_address,
                                                        type=type,
-                                                       from_block=from_block)
+                                                       from_block=from_block,
+                                                       after=args['cursor'],
+                                                       limit=args['limit'])
 
-        return UserTokenEventSchema().dump(events, many=True).data
+        return events_response(events, lambda event: UserTokenEventSchema().dump(event).data, args['limit'])
 
 
 class EventsToken(Resource):
@@ -76,6 +80,7 @@ class EventsToken(Resource):
                                                    TokenProxy.event_types),
                            missing=None)
     }
+    args.update(page_args)
 
     @use_args(args)
     def get(self, args, token_address: str):
@@ -83,6 +88,10 @@ class EventsToken(Resource):
         from_block = args['fromBlock']
         type = args['type']
 
-        events = self.trustlines.get_token_events(token_address, type=type, from_block=from_block)
+        events = self.trustlines.get_token_events(token_address,
+                                                  type=type,
+                                                  from_block=from_block,
+                                                  after=args['cursor'],
+                                                  limit=args['limit'])
 
-        return TokenEventSchema().dump(events, many=True).data
+        return events_response(events, lambda event: TokenEventSchema().dump(event).data, args['limit'])
@@ -0,0 +1,74 @@
+"""process-wide cache of block timestamps
+
+Events only carry the number of their block, so every built event needs the
+timestamp of its block. The timestamps are cached for all proxies, the cache is
+filled with batched requests for all blocks of a result set and with every new
+block of the chain by the HeadTracker.
+"""
+import weakref
+from collections import OrderedDict
+from typing import Iterable, Optional  # noqa: F401
+
+from relay import metrics
+
+
+class BlockTimestampCache(object):
+
+    def __init__(self, web3, maxsize: int = 10000, batch_size: int = 200, concurrency: int = 4) -> None:
+        self._web3 = web3
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self._timestamps = OrderedDict()  # type: OrderedDict
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    def add(self, blocknumber: int, timestamp: int) -> None:
+        self._timestamps[blocknumber] = timestamp
+        self._timestamps.move_to_end(blocknumber)
+        while len(self._timestamps) > self.maxsize:
+            self._timestamps.popitem(last=False)
+
+    def get(self, blocknumber: int) -> int:
+        """returns the timestamp of the block, requesting it from the node if it is not cached"""
+        try:
+            timestamp = self._timestamps[blocknumber]
+        except KeyError:
+            metrics.increment('block_cache_misses')
+            timestamp = self._web3.eth.getBlock(blocknumber).timestamp
+            self.add(blocknumber, timestamp)
+            return timestamp
+        metrics.increment('block_cache_hits')
+        self._timestamps.move_to_end(blocknumber)
+        return timestamp
+
+    def prefetch(self, blocknumbers: Iterable[Optional[int]]) -> None:
+        """requests the timestamps of all blocks that are not cached with batched requests"""
+        missing = sorted({blocknumber for blocknumber in blocknumbers
+                          if blocknumber is not None and blocknumber not in self._timestamps})
+        if len(missing) > self.maxsize:
+            # they would evict each other before they are used
+            missing = missing[-self.maxsize:]
+        if len(missing) <= 1:
+            return
+        # imported here, so that events can be built without the libraries of the node connection
+        from .rpc_batch import BatchRPCClient
+        rpc = BatchRPCClient(self._web3.currentProvider, self.batch_size, self.concurrency)
+        blocks = rpc.request_many(('eth_getBlockByNumber', [hex(blocknumber), False]) for blocknumber in missing)
+        metrics.increment('block_cache_prefetched', len(missing))
+        for blocknumber, block in zip(missing, blocks):
+            if block is not None:
+                self.add(blocknumber, int(block['timestamp'], 16))
+
+
+_caches = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+
+
+def get_block_timestamp_cache(web3) -> BlockTimestampCache:
+    """returns the cache shared by everything using the node connection web3"""
+    try:
+        return _caches[web3]
+    except KeyError:
+        cache = _caches[web3] = BlockTimestampCache(web3)
+        return cache
@@ -1,14 +1,11 @@
 import logging
-import socket
 from collections import namedtuple
 from typing import List, Dict
 import functools
 import itertools
 
-import gevent
-
 import relay.concurrency_utils as concurrency_utils
-from .proxy import Proxy, reconnect_interval, sorted_events
+from .proxy import Proxy, sorted_events
 from relay.logger import get_logger
 
 from .events import BlockchainEvent
@@ -47,8 +44,11 @@ class CurrencyNetworkProxy(Proxy):
 
     standard_event_types = standard_event_types
 
-    def __init__(self, web3, abi, address: str) -> None:
+    def __init__(self, web3, abi, address: str, sync_batch_size: int = 200,
+                 sync_concurrency: int = 4) -> None:
         super().__init__(web3, abi, address)
+        self.sync_batch_size = sync_batch_size
+        self.sync_concurrency = sync_concurrency
         self.name = self._proxy.call().name().strip('\0')  # type: str
         self.decimals = self._proxy.call().decimals()  # typ: str
         self.symbol = self._proxy.call().symbol().strip('\0')  # type: str
@@ -70,47 +70,23 @@ class CurrencyNetworkProxy(Proxy):
         return self._proxy.call().spendableTo(a_address, b_address)
 
     def gen_graph_representation(self) -> Dict[str, List[Trustline]]:
-        """Returns the trustlines network as a dict address -> list of Friendships"""
-        result = {}
-        for user in self.users:
-            list = []
-            for friend in self.friends(user):
-                if user < friend:
-                    (creditline_ab,
-                     creditline_ba,
-                     interest_ab,
-                     interest_ba,
-                     fees_outstanding_a,
-                     fees_outstanding_b,
-                     mtime,
-                     balance_ab) = self.account(user, friend)
-                    list.append(Trustline(friend,
-                                          creditline_ab,
-                                          creditline_ba,
-                                          interest_ab,
-                                          interest_ba,
-                                          fees_outstanding_a,
-                                          fees_outstanding_b,
-                                          mtime,
-                                          balance_ab))
-            result[user] = list
+        """Returns the trustlines network as a dict address -> list of Friendships
+
+        The friends and accounts are requested with batched calls, see relay.blockchain.rpc_batch
+        """
+        # imported here, so that Trustline can be used without the libraries of the node connection
+        from .rpc_batch import BatchRPCClient
+        rpc = BatchRPCClient(self._web3.currentProvider, self.sync_batch_size, self.sync_concurrency)
+        users = self.users
+        friends = rpc.call_many(self._proxy, (('getFriends', (user,)) for user in users))
+        pairs = [(user, friend) for user, user_friends in zip(users, friends) for friend in user_friends
+                 if user < friend]
+        accounts = rpc.call_many(self._proxy, (('getAccount', pair) for pair in pairs))
+        result = {user: [] for user in users}  # type: Dict[str, List[Trustline]]
+        for (user, friend), account in zip(pairs, accounts):
+            result[user].append(Trustline(friend, *account))
         return result
 
-    def start_listen_on_full_sync(self, function, sync_interval: float):
-        def sync():
-            while True:
-                try:
-                    function(self.gen_graph_representation())
-                    gevent.sleep(sync_interval)
-                except socket.timeout as err:
-                    logger.warning('Full sync failed because of timeout, try again: ' + str(err))
-                    gevent.sleep(reconnect_interval)
-                except socket.error as err:
-                    logger.warning('Full sync failed because of error, try again: ' + str(err))
-                    gevent.sleep(reconnect_interval)
-
-        gevent.Greenlet.spawn(sync)
-
     def start_listen_on_balance(self, f) -> None:
         def log(log_entry):
             f(self._build_event(log_entry))
@@ -190,5 +166,20 @@ class CurrencyNetworkProxy(Proxy):
         results = concurrency_utils.joinall(queries, timeout=timeout)
         return sorted_events(list(itertools.chain.from_iterable(results)))
 
+    def get_graph_update_events(self,
+                                event_types: List[str],
+                                from_block: int,
+                                to_block: int,
+                                timeout: float = None
+                                ) -> List[BlockchainEvent]:
+        """returns the events of event_types in the block range in the order they happened"""
+        queries = [functools.partial(self.get_events,
+                                     type,
+                                     from_block=from_block,
+                                     to_block=to_block) for type in event_types]
+        results = concurrency_utils.joinall(queries, timeout=timeout)
+        return sorted(itertools.chain.from_iterable(results),
+                      key=lambda event: (event.blocknumber, event.log_index or 0))
+
     def estimate_gas_for_transfer(self, sender, receiver, value, max_fee, path):
         return self._proxy.estimateGas({'from': sender}).transfer(receiver, value, max_fee, path)
@@ -0,0 +1,103 @@
+"""process-wide cache of the decoded events of repeated queries
+
+Clients poll the same history of events again and again. An entry of the cache
+holds the events of one query, e.g. the events of one type of a contract with
+the user as one argument, from its first block up to the block it covers. A
+repeated query only fetches the events after that block.
+
+Only confirmed events are added to an entry, see BlockchainEvent.status, so the
+events of an entry never change. The cache holds up to maxsize events, the least
+recently used entries are evicted first.
+"""
+import bisect
+import weakref
+from collections import OrderedDict, namedtuple
+from typing import Callable, Hashable, List  # noqa: F401
+
+from relay import metrics
+from .events import BlockchainEvent, confirmation_depth  # noqa: F401
+
+Entry = namedtuple('Entry', ['first_block', 'covered_block', 'events', 'blocknumbers'])
+
+
+class EventRangeCache(object):
+
+    def __init__(self, maxsize: int = 100000) -> None:
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # type: OrderedDict
+        self._size = 0
+
+    def __len__(self):
+        """the number of cached events"""
+        return self._size
+
+    def query(self,
+              key: Hashable,
+              from_block: int,
+              current_blocknumber: int,
+              fetch: Callable[[int], List[BlockchainEvent]]) -> List[BlockchainEvent]:
+        """returns the events of the query identified by key from from_block on
+
+        fetch(from_block) returns the events of the query from its argument on in the
+        order of the chain, it is only called for the blocks the entry does not cover.
+        """
+        if self.maxsize <= 0:
+            return fetch(from_block)
+        entry = self._entries.get(key)
+        if entry is None or not entry.first_block <= from_block <= entry.covered_block + 1:
+            metrics.increment('event_cache_misses')
+            events = fetch(from_block)
+            # fetch yields, another query of the key may have replaced the entry meanwhile
+            if self._entries.get(key) is entry and (entry is None or from_block < entry.first_block):
+                self._put(key, Entry(from_block, -1, [], []), current_blocknumber, events)
+            return events
+        metrics.increment('event_cache_hits')
+        self._entries.move_to_end(key)
+        cached = entry.events[bisect.bisect_left(entry.blocknumbers, from_block):]
+        new_events = fetch(entry.covered_block + 1)
+        if self._entries.get(key) is entry:
+            self._put(key, entry, current_blocknumber, new_events)
+        return cached + new_events
+
+    def _remove(self, key) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry.events)
+
+    def _put(self, key, entry, current_blocknumber, new_events) -> None:
+        """replaces the entry of key by entry with the confirmed events of new_events, which follow
+        the covered block of entry
+
+        The lists of an entry are never mutated, a query may still slice those of the entry it read.
+        """
+        confirmed_block = current_blocknumber - confirmation_depth
+        if confirmed_block <= entry.covered_block or confirmed_block < entry.first_block:
+            return
+        confirmed = [event for event in new_events
+                     if event.blocknumber is not None and event.blocknumber <= confirmed_block]
+        self._remove(key)
+        self._entries[key] = Entry(entry.first_block,
+                                   confirmed_block,
+                                   entry.events + confirmed,
+                                   entry.blocknumbers + [event.blocknumber for event in confirmed])
+        self._size += len(entry.events) + len(confirmed)
+        while self._size > self.maxsize and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted.events)
+            metrics.increment('event_cache_evictions')
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+
+_caches = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+
+
+def get_event_cache(web3) -> EventRangeCache:
+    """returns the cache shared by everything using the node connection web3"""
+    try:
+        return _caches[web3]
+    except KeyError:
+        cache = _caches[web3] = EventRangeCache()
+        return cache
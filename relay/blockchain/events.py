@@ -1,4 +1,8 @@
 from ..events import Event
+from . import head_tracker
+
+# the number of blocks on top of the block of an event after which it is confirmed
+confirmation_depth = 5
 
 
 class BlockchainEvent(Event):
@@ -7,15 +11,21 @@ class BlockchainEvent(Event):
         super().__init__(timestamp)
         self._web3_event = web3_event
         self.blocknumber = web3_event.get('blockNumber', None)
+        self.transaction_index = web3_event.get('transactionIndex', None)
+        self.log_index = web3_event.get('logIndex', None)
         self._current_blocknumber = current_blocknumber
         self.transaction_id = web3_event.get('transactionHash')
         self.type = web3_event.get('event')
 
     @property
     def status(self) -> str:
+        """the status relative to the followed head of the chain, or else to the head the event was built at"""
+        current_blocknumber = head_tracker.current_blocknumber()
+        if current_blocknumber is None:
+            current_blocknumber = self._current_blocknumber
         if self.blocknumber is None:
             return 'sent'
-        elif (self._current_blocknumber - self.blocknumber) < 5:
+        elif (current_blocknumber - self.blocknumber) < confirmation_depth:
             return 'pending'
         else:
             return 'confirmed'
@@ -0,0 +1,108 @@
+"""follows the head of the chain
+
+One filter for new blocks keeps the number and timestamp of the latest block, so
+that they do not have to be requested for every query. The timestamps of the new
+blocks are also added to the block timestamp cache.
+"""
+import logging
+import socket
+import weakref
+from typing import Optional  # noqa: F401
+
+import gevent
+
+from relay import metrics
+from relay.logger import get_logger
+from .block_cache import get_block_timestamp_cache
+
+logger = get_logger('head tracker', logging.DEBUG)
+
+reconnect_interval = 3  # 3s
+
+
+class HeadTracker(object):
+
+    def __init__(self, web3) -> None:
+        self._web3 = web3
+        self._block_cache = get_block_timestamp_cache(web3)
+        self._blocknumber = None  # type: int
+        self._timestamp = None  # type: int
+        self.tracking = False
+
+    @property
+    def blocknumber(self) -> int:
+        """the number of the latest block, requested from the node if the head is not followed"""
+        if not self.tracking or self._blocknumber is None:
+            self.update()
+        return self._blocknumber
+
+    @property
+    def timestamp(self) -> int:
+        """the timestamp of the latest block, requested from the node if the head is not followed"""
+        if not self.tracking or self._timestamp is None:
+            self.update()
+        return self._timestamp
+
+    def update(self) -> None:
+        block = self._web3.eth.getBlock('latest')
+        self._add_block(block.number, block.timestamp)
+
+    def _add_block(self, blocknumber: int, timestamp: int) -> None:
+        self._block_cache.add(blocknumber, timestamp)
+        if self._blocknumber is None or blocknumber >= self._blocknumber:
+            self._blocknumber = blocknumber
+            self._timestamp = timestamp
+
+    def _on_new_block(self, block_hash) -> None:
+        block = self._web3.eth.getBlock(block_hash)
+        self._add_block(block.number, block.timestamp)
+
+    def _watch_new_blocks(self):
+        while True:
+            try:
+                filter = self._web3.eth.filter('latest')
+                filter.watch(self._on_new_block)
+                logger.info('Connected to filter for new blocks')
+                # blocks could have been missed before the filter was created
+                self.update()
+                return filter
+            except (socket.error, ValueError) as err:
+                logger.warning('Error in filter creation for new blocks, try to reconnect: ' + str(err))
+                gevent.sleep(reconnect_interval)
+
+    def start(self) -> None:
+        """starts following the head of the chain, it is used as the head for the status of all events"""
+        global _tracker
+
+        def on_exception(filter):
+            logger.warning('Filter for new blocks disconnected, trying to reconnect')
+            self.tracking = False
+            gevent.sleep(reconnect_interval)
+            filter = self._watch_new_blocks()
+            self.tracking = True
+            filter.link_exception(on_exception)
+        filter = self._watch_new_blocks()
+        self.tracking = True
+        filter.link_exception(on_exception)
+        _tracker = self
+        metrics.register_gauge('head_blocknumber', lambda: self._blocknumber)
+
+
+_trackers = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+_tracker = None  # type: HeadTracker
+
+
+def get_head_tracker(web3) -> HeadTracker:
+    """returns the tracker shared by everything using the node connection web3"""
+    try:
+        return _trackers[web3]
+    except KeyError:
+        tracker = _trackers[web3] = HeadTracker(web3)
+        return tracker
+
+
+def current_blocknumber() -> Optional[int]:
+    """returns the number of the latest block if a started tracker follows the head, otherwise None"""
+    if _tracker is None or not _tracker.tracking:
+        return None
+    return _tracker._blocknumber
@@ -1,5 +1,8 @@
 from collections import namedtuple
 
+from .block_cache import get_block_timestamp_cache
+from .head_tracker import get_head_tracker
+
 
 TxInfos = namedtuple('TxInfos', 'balance, nonce, gas_price')
 
@@ -8,6 +11,8 @@ class Node:
 
     def __init__(self, web3):
         self._web3 = web3
+        self._block_cache = get_block_timestamp_cache(web3)
+        self._head_tracker = get_head_tracker(web3)
 
     def relay_tx(self, rawtxn):
         return self._web3.eth.sendRawTransaction(rawtxn)
@@ -22,7 +27,7 @@ class Node:
 
     @property
     def blocknumber(self):
-        return self._web3.eth.blockNumber
+        return self._head_tracker.blocknumber
 
     def balance(self, address):
         wei = self._web3.eth.getBalance(address)
@@ -39,4 +44,4 @@ class Node:
             return None
 
     def get_block_timestamp(self, block_number):
-        return self._web3.eth.getBlock(block_number).timestamp
+        return self._block_cache.get(block_number)
@@ -0,0 +1,58 @@
+"""keyset pagination of events
+
+Events are ordered by their position (blockNumber, transactionIndex, logIndex).
+A page holds the events after the position of a cursor, so pages stay stable
+while new events are added at the head of the chain. The cursor is opaque to
+clients, it is the encoded position of the last event of the previous page.
+Events that are not mined yet have no position, they are left out of pages.
+"""
+import base64
+import math
+from typing import List, Optional, Tuple  # noqa: F401
+
+from .events import BlockchainEvent
+
+Position = Tuple[int, int, int]
+
+
+def event_position(event: BlockchainEvent) -> Tuple:
+    """the position of the event in the chain, events that are not mined yet come last"""
+    if event.blocknumber is None:
+        return (math.inf, 0, 0)
+    return (event.blocknumber, event.transaction_index or 0, event.log_index or 0)
+
+
+def encode_cursor(position: Position) -> str:
+    return base64.urlsafe_b64encode('{}:{}:{}'.format(*position).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Position:
+    """returns the position of the cursor, raises ValueError for an invalid cursor"""
+    try:
+        blocknumber, transaction_index, log_index = (
+            int(part) for part in base64.urlsafe_b64decode(cursor.encode()).decode().split(':'))
+    except (ValueError, UnicodeError, TypeError):
+        raise ValueError('Invalid cursor: {}'.format(cursor))
+    return blocknumber, transaction_index, log_index
+
+
+def page_events(events: List[BlockchainEvent],
+                after: Position = None,
+                limit: int = None) -> List[BlockchainEvent]:
+    """returns up to limit of the mined events after the position in the order of their positions"""
+    events = sorted((event for event in events if event.blocknumber is not None), key=event_position)
+    if after is not None:
+        events = [event for event in events if event_position(event) > after]
+    if limit is not None:
+        events = events[:limit]
+    return events
+
+
+def next_cursor(events: List[BlockchainEvent], limit: int = None) -> Optional[str]:
+    """returns the cursor of the page after events, or None if there are no more events"""
+    if limit is None or len(events) < limit:
+        return None
+    mined = [event for event in events if event.blocknumber is not None]
+    if not mined:
+        return None
+    return encode_cursor(event_position(mined[-1]))
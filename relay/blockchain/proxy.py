@@ -2,13 +2,16 @@ import logging
 import math
 import time
 import functools
-from typing import List, Dict, Callable, Any  # noqa: F401
+from typing import List, Dict, Callable, Any, Tuple  # noqa: F401
 
 import gevent
 import itertools
 import socket
 
 import relay.concurrency_utils as concurrency_utils
+from .block_cache import get_block_timestamp_cache
+from .event_cache import get_event_cache
+from .head_tracker import get_head_tracker
 from .events import BlockchainEvent
 from relay.logger import get_logger
 
@@ -21,6 +24,9 @@ updateBlock = 'pending'
 
 reconnect_interval = 3  # 3s
 
+# identical queries of all proxies that run at the same time share one query
+_event_queries = concurrency_utils.SingleFlight('event_queries')
+
 
 class Proxy(object):
     event_builders = {}  # type: Dict[str, Callable[[Any, int, int], BlockchainEvent]]
@@ -30,13 +36,24 @@ class Proxy(object):
         self._web3 = web3
         self._proxy = web3.eth.contract(abi=abi, address=address)
         self.address = address
+        self._block_cache = get_block_timestamp_cache(web3)
+        self._event_cache = get_event_cache(web3)
+        self._head_tracker = get_head_tracker(web3)
+        self._reconnect_listeners = []  # type: List[Tuple[Callable[[], None], Callable[[], None]]]
+        self._event_listeners = {}  # type: Dict[str, List[Callable[[Any], None]]]
+        self._event_abis_by_topic = {}  # type: Dict[str, Any]
+        self._get_event_data = None  # type: Callable[[Any, Any], Any]
+        self._event_source = None  # type: Any
+        self._event_store = None  # type: Any
 
-    def _watch_filter(self, eventname: str, function, params=None):
+    def _watch_filter(self):
         while True:
             try:
-                filter = self._proxy.on(eventname, params)
-                filter.watch(function)
-                logger.info('Connected to filter for {}:{}'.format(self.address, eventname))
+                filter = self._web3.eth.filter({'address': self.address,
+                                                'fromBlock': updateBlock,
+                                                'toBlock': updateBlock})
+                filter.watch(self._dispatch_log)
+                logger.info('Connected to filter for {}'.format(self.address))
                 return filter
             except socket.timeout as err:
                 logger.warning('Timeout in filter creation, try to reconnect: ' + str(err))
@@ -48,35 +65,151 @@ class Proxy(object):
                 logger.warning('ValueError in filter creation, try to reconnect:' + str(err))
                 gevent.sleep(reconnect_interval)
 
-    def start_listen_on(self, eventname: str, function, params=None) -> None:
+    def _dispatch_log(self, log_entry) -> None:
+        """decodes a log of the contract by its topic and calls the functions listening on its event"""
+        topics = log_entry.get('topics')
+        if not topics:
+            return
+        event_abi = self._event_abis_by_topic.get(topics[0].lower())
+        if event_abi is None or event_abi['name'] not in self._event_listeners:
+            return
+        event = self._get_event_data(event_abi, log_entry)
+        for function in self._event_listeners[event_abi['name']]:
+            function(event)
+
+    def _dispatch_event(self, event) -> None:
+        """calls the functions listening on the event, which was already decoded by the event source"""
+        blocknumber = event.get('blockNumber')
+        timestamp = event.get('timestamp')
+        if blocknumber is not None and timestamp is not None:
+            self._block_cache.add(blocknumber, timestamp)
+        for function in self._event_listeners.get(event.get('event'), []):
+            function(event)
+
+    def listen_on_event_source(self, event_source) -> None:
+        """receives the live events from event_source instead of a filter of the node
+
+        It has to be called before the first listener is started.
+        """
+        assert not self._event_listeners, 'Listeners already receive the events of a filter'
+        self._event_source = event_source
+
+    def use_event_store(self, event_store) -> None:
+        """answers the event queries up to the block synced by the relay.event_store.EventStore from it"""
+        self._event_store = event_store
+
+    def start_listen_on(self, eventname: str, function) -> None:
+        """calls function with every new event of eventname
+
+        All events of the contract are received with a single filter, which is created with the first listener
+        """
+        if self._event_listeners:
+            self._event_listeners.setdefault(eventname, []).append(function)
+            return
+        self._event_listeners[eventname] = [function]
+        if self._event_source is not None:
+            self._event_source.add_listener(self.address, self._dispatch_event)
+            return
+        # imported here, so that the proxies can be imported without the libraries of the node connection
+        from eth_utils import encode_hex, event_abi_to_log_topic
+        from web3.utils.events import get_event_data
+        self._get_event_data = get_event_data
+        self._event_abis_by_topic = {encode_hex(event_abi_to_log_topic(abi)).lower(): abi
+                                     for abi in self._proxy.abi
+                                     if abi.get('type') == 'event' and not abi.get('anonymous')}
+
         def on_exception(filter):
             logger.warning('Filter {} disconnected, trying to reconnect'.format(filter.filter_id))
+            for on_disconnect, _ in self._reconnect_listeners:
+                on_disconnect()
             gevent.sleep(reconnect_interval)
-            filter = self._watch_filter(eventname, function, params)
+            filter = self._watch_filter()
             filter.link_exception(on_exception)
-        if params is None:
-            params = {}
-        params.setdefault('fromBlock', updateBlock)
-        params.setdefault('toBlock', updateBlock)
-        filter = self._watch_filter(eventname, function, params)
+            for _, on_reconnect in self._reconnect_listeners:
+                on_reconnect()
+        filter = self._watch_filter()
         filter.link_exception(on_exception)
 
-    def get_events(self, event_name, filter_=None, from_block=0, timeout: float = None) -> List[BlockchainEvent]:
+    def start_listen_on_reconnect(self, on_disconnect: Callable[[], None], on_reconnect: Callable[[], None]) -> None:
+        """calls on_disconnect if the filter of start_listen_on disconnects and on_reconnect when it is connected again
+
+        Events that happened in between were missed by the filter
+        """
+        self._reconnect_listeners.append((on_disconnect, on_reconnect))
+
+    def get_events(self, event_name, filter_=None, from_block=0, timeout: float = None,
+                   to_block=queryBlock) -> List[BlockchainEvent]:
+        """returns the events of event_name matching filter_ in the block range
+
+        The confirmed events of queries up to the latest block are cached, see relay.blockchain.event_cache.
+        Identical queries that run at the same time are coalesced.
+        """
         if event_name not in self.event_builders.keys():
             raise ValueError('Unknown eventname {}'.format(event_name))
 
         if filter_ is None:
             filter_ = {}
 
+        key = (self.address, event_name, tuple(sorted(filter_.items())), from_block, to_block)
+        return _event_queries.do(key, functools.partial(self._get_cached_events,
+                                                        event_name,
+                                                        filter_,
+                                                        from_block,
+                                                        timeout=timeout,
+                                                        to_block=to_block))
+
+    def _get_cached_events(self, event_name, filter_, from_block=0, timeout: float = None,
+                           to_block=queryBlock) -> List[BlockchainEvent]:
+        if to_block == queryBlock:
+            return self._event_cache.query((self.address, event_name, tuple(sorted(filter_.items()))),
+                                           from_block,
+                                           self.current_blocknumber(),
+                                           functools.partial(self._get_events,
+                                                             event_name,
+                                                             filter_,
+                                                             timeout=timeout,
+                                                             to_block=to_block))
+        return self._get_events(event_name, filter_, from_block, timeout=timeout, to_block=to_block)
+
+    def _get_events(self, event_name, filter_, from_block=0, timeout: float = None,
+                    to_block=queryBlock) -> List[BlockchainEvent]:
+        stored_events = []  # type: List[BlockchainEvent]
+        synced_block = self._event_store.synced_block(self.address) if self._event_store is not None else None
+        if synced_block is not None and from_block <= synced_block:
+            stored_to_block = synced_block
+            if isinstance(to_block, int):
+                stored_to_block = min(to_block, synced_block)
+            stored_events = self._get_stored_events(event_name, filter_, from_block, stored_to_block)
+            if stored_to_block == to_block:
+                return stored_events
+            # only the blocks since are read from the node
+            from_block = synced_block + 1
+
         params = {
             'filter': filter_,
             'fromBlock': from_block,
-            'toBlock': queryBlock
+            'toBlock': to_block
         }
 
-        queries = [lambda: self._proxy.pastEvents(event_name, params).get(False)]
-        results = concurrency_utils.joinall(queries, timeout=timeout)
-        return sorted_events(self._build_events(results[0]))
+        def query():
+            with concurrency_utils.query_limiter.slot():
+                return self._proxy.pastEvents(event_name, params).get(False)
+        results = concurrency_utils.joinall([query], timeout=timeout)
+        return sorted_events(stored_events + self._build_events(results[0]))
+
+    def _get_stored_events(self, event_name, filter_, from_block: int, to_block: int) -> List[BlockchainEvent]:
+        """returns the events of event_name matching filter_ from the event store"""
+        user_address = next(iter(filter_.values()), None)
+        events = [event
+                  for event in self._event_store.get_events(self.address,
+                                                            [event_name],
+                                                            user_address=user_address,
+                                                            from_block=from_block,
+                                                            to_block=to_block)
+                  if all(_same_value(event['args'].get(name), value) for name, value in filter_.items())]
+        current_blocknumber = self.current_blocknumber()
+        return [self.event_builders[event['event']](event, current_blocknumber, event['timestamp'])
+                for event in events]
 
     def get_all_events(self,
                        filter_=None,
@@ -90,8 +223,12 @@ class Proxy(object):
         results = concurrency_utils.joinall(queries, timeout=timeout)
         return sorted_events(list(itertools.chain.from_iterable(results)))
 
+    def current_blocknumber(self) -> int:
+        return self._head_tracker.blocknumber
+
     def _build_events(self, events: List[Any]):
-        current_blocknumber = self._web3.eth.blockNumber
+        current_blocknumber = self.current_blocknumber()
+        self._block_cache.prefetch(event.get('blockNumber') for event in events)
         return [self._build_event(event, current_blocknumber) for event in events]
 
     def _build_event(self, event: Any, current_blocknumber: int = None) -> BlockchainEvent:
@@ -104,12 +241,19 @@ class Proxy(object):
 
     def _get_block_timestamp(self, blocknumber: int) -> int:
         if blocknumber is not None:
-            timestamp = self._web3.eth.getBlock(blocknumber).timestamp
+            timestamp = self._block_cache.get(blocknumber)
         else:
             timestamp = time.time()
         return timestamp
 
 
+def _same_value(a, b) -> bool:
+    """compares event arguments, addresses are compared independent of their checksum"""
+    if isinstance(a, str) and isinstance(b, str):
+        return a.lower() == b.lower()
+    return a == b
+
+
 def sorted_events(events: List[BlockchainEvent]) -> List[BlockchainEvent]:
     def key(event):
         if event.blocknumber is None:
@@ -0,0 +1,69 @@
+"""JSON-RPC batch requests to the node
+
+Sends many requests in few round trips: the requests are split into batches of
+`batch_size`, of which up to `concurrency` are in flight at the same time.
+"""
+import json
+from typing import Any, Iterable, List, Tuple  # noqa: F401
+
+from gevent.pool import Pool
+from eth_abi import decode_abi
+from eth_utils import decode_hex
+from web3.utils.abi import BASE_RETURN_NORMALIZERS, get_abi_output_types, map_abi_data
+from web3.utils.compat import make_post_request
+
+
+class BatchRPCClient(object):
+
+    def __init__(self, provider, batch_size: int, concurrency: int) -> None:
+        """uses the endpoint and the connection settings of provider, a web3 HTTPProvider"""
+        self.provider = provider
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+
+    def _post(self, batch: List[Tuple[str, list]]) -> List[Any]:
+        request = [{'jsonrpc': '2.0', 'id': id, 'method': method, 'params': params}
+                   for id, (method, params) in enumerate(batch)]
+        raw_response = make_post_request(self.provider.endpoint_uri,
+                                         json.dumps(request).encode('utf-8'),
+                                         **self.provider.get_request_kwargs())
+        if isinstance(raw_response, bytes):
+            raw_response = raw_response.decode('utf-8')
+        response = json.loads(raw_response)
+        if isinstance(response, dict):  # the whole batch was rejected
+            raise ValueError(response.get('error', response))
+        results = [None] * len(batch)  # responses can come in any order
+        for entry in response:
+            if 'error' in entry:
+                raise ValueError(entry['error'])
+            results[entry['id']] = entry['result']
+        return results
+
+    def request_many(self, requests: Iterable[Tuple[str, list]]) -> List[Any]:
+        """sends (method, params) requests and returns their results in the same order
+
+        Raises ValueError if the node returns an error for any of them
+        """
+        requests = list(requests)
+        batches = [requests[i:i + self.batch_size] for i in range(0, len(requests), self.batch_size)]
+        results = []  # type: List[Any]
+        for batch_results in Pool(self.concurrency).imap(self._post, batches):
+            results.extend(batch_results)
+        return results
+
+    def call_many(self, contract, calls: Iterable[Tuple[str, tuple]], block='latest') -> List[Any]:
+        """calls (function name, args) of contract with eth_call and returns the decoded results"""
+        calls = list(calls)
+        requests = [('eth_call', [{'to': contract.address, 'data': contract.encodeABI(function_name, args)}, block])
+                    for function_name, args in calls]
+        return [_decode_result(contract, function_name, args, result)
+                for (function_name, args), result in zip(calls, self.request_many(requests))]
+
+
+def _decode_result(contract, function_name: str, args: tuple, result: str) -> Any:
+    # same as web3.contract.call_contract_function
+    output_types = get_abi_output_types(contract._find_matching_fn_abi(function_name, args))
+    output_data = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, decode_abi(output_types, decode_hex(result)))
+    if len(output_data) == 1:
+        return output_data[0]
+    return output_data
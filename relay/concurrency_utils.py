@@ -1,6 +1,23 @@
-from typing import Callable, List, Any, Iterable
+"""running functions concurrently in greenlets
+
+A TaskGroup runs functions with a deadline. The greenlets of a task group inherit
+its deadline, so that the task groups of nested calls never wait longer than the
+outer ones. Greenlets that miss the deadline are killed, nobody waits for them.
+
+Greenlets spawned with `spawn` also inherit the request of the current greenlet,
+the greenlet that started the work, e.g. the one handling an api request. The
+FairLimiter shares its slots between the requests.
+"""
+import time
+import weakref
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, List, Any, Iterable, Optional  # noqa: F401
 
 import gevent
+from gevent.event import Event
+
+from relay import metrics
 
 
 class TimeoutException(Exception):
@@ -8,11 +25,101 @@ class TimeoutException(Exception):
     pass
 
 
+# the deadlines of the greenlets spawned by task groups in time.monotonic() seconds
+_deadlines = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+# the greenlets that started the work of the spawned greenlets
+_requests = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+
+# the results of the functions that finished in time by their keys and the keys of the others
+PartialResults = namedtuple('PartialResults', ['results', 'timed_out'])
+
+
+def current_deadline() -> Optional[float]:
+    """returns the deadline of the current greenlet, or None if it has none"""
+    return _deadlines.get(gevent.getcurrent())
+
+
+@contextmanager
+def deadline_after(timeout: float = None):
+    """gives the current greenlet a deadline at most timeout seconds from now while in the context"""
+    current = gevent.getcurrent()
+    previous = _deadlines.get(current)
+    if timeout is not None:
+        _deadlines[current] = min(previous or float('inf'), time.monotonic() + timeout)
+    try:
+        yield
+    finally:
+        if previous is None:
+            _deadlines.pop(current, None)
+        else:
+            _deadlines[current] = previous
+
+
+def current_request() -> Hashable:
+    """returns the greenlet that started the work of the current greenlet"""
+    current = gevent.getcurrent()
+    return _requests.get(current, current)
+
+
+def spawn(function: Callable, *args, deadline: float = None, **kwargs) -> gevent.Greenlet:
+    """spawns a greenlet that inherits the request and the deadline of the current greenlet
+
+    The greenlet gets deadline instead, if it is given.
+    """
+    if deadline is None:
+        deadline = current_deadline()
+    greenlet = gevent.Greenlet(function, *args, **kwargs)
+    _requests[greenlet] = current_request()
+    if deadline is not None:
+        _deadlines[greenlet] = deadline
+    greenlet.start()
+    return greenlet
+
+
+class TaskGroup(object):
+    """Runs functions in greenlets with a common deadline
+
+    The deadline is timeout seconds from now, but not later than the deadline of the
+    current greenlet. Without both there is no deadline.
+    """
+
+    def __init__(self, timeout: float = None) -> None:
+        deadline = current_deadline()
+        if timeout is not None:
+            deadline = min(deadline or float('inf'), time.monotonic() + timeout)
+        self.deadline = deadline
+        self.greenlets = []  # type: List[gevent.Greenlet]
+
+    def spawn(self, function: Callable, *args, **kwargs) -> gevent.Greenlet:
+        greenlet = spawn(function, *args, deadline=self.deadline, **kwargs)
+        self.greenlets.append(greenlet)
+        return greenlet
+
+    def join(self, raise_error: bool = True) -> List[gevent.Greenlet]:
+        """waits for the greenlets up to the deadline, kills the others and returns them
+
+        With raise_error, the first error of a greenlet is raised
+        """
+        timeout = None
+        if self.deadline is not None:
+            timeout = max(self.deadline - time.monotonic(), 0)
+        try:
+            finished = gevent.joinall(self.greenlets, timeout=timeout, raise_error=raise_error)
+        except BaseException:
+            gevent.killall([greenlet for greenlet in self.greenlets if not greenlet.ready()], block=False)
+            raise
+        timed_out = [greenlet for greenlet in self.greenlets if greenlet not in finished]
+        if timed_out:
+            metrics.increment('task_group_timeouts', len(timed_out))
+            gevent.killall(timed_out, block=False)
+        return timed_out
+
+
 def joinall(functions: Iterable[Callable], timeout: float = None) -> List[Any]:
     """
     Executes functions by spawning gevent greenlets and waiting for them
-    to finish up to `timeout` seconds.
-    If timing out, a TimeoutException is thrown
+    to finish up to `timeout` seconds, or up to the deadline of the current greenlet.
+    If timing out, the greenlets that did not finish are killed and a TimeoutException is thrown
     Args:
         functions: The functions to execute each in a greenlet
         timeout: Seconds to wait until timing out
@@ -20,9 +127,158 @@ def joinall(functions: Iterable[Callable], timeout: float = None) -> List[Any]:
     Returns: The results of the executed functions
 
     """
-    spawned_greenlets = [gevent.spawn(fun) for fun in functions]
-    finished_greenlets = gevent.joinall(greenlets=spawned_greenlets, timeout=timeout, raise_error=True)
-    if len(finished_greenlets) < len(spawned_greenlets):
+    group = TaskGroup(timeout)
+    spawned_greenlets = [group.spawn(fun) for fun in functions]
+    if group.join():
         raise TimeoutException('Could not finish all jobs before the timeout')
 
     return [g.value for g in spawned_greenlets if g.value is not None]  # Use spawned greenlets to preserve order
+
+
+def joinall_partial(functions: Dict[Hashable, Callable], timeout: float = None) -> PartialResults:
+    """
+    Executes functions like joinall, but returns the results of the functions that finished in time
+    by their keys together with the keys of the functions that timed out, instead of raising a TimeoutException
+    """
+    group = TaskGroup(timeout)
+    spawned_greenlets = {key: group.spawn(function) for key, function in functions.items()}
+    timed_out = group.join()
+    return PartialResults({key: greenlet.value for key, greenlet in spawned_greenlets.items()
+                           if greenlet not in timed_out},
+                          [key for key, greenlet in spawned_greenlets.items() if greenlet in timed_out])
+
+
+class SingleFlight(object):
+    """Coalesces identical concurrent calls
+
+    The first call of a key runs the function in its own greenlet, every call of
+    the same key until it finished waits for it and gets the same result or exception.
+    A call waits at most until the deadline of its greenlet and then raises TimeoutException,
+    the greenlet is not killed together with a waiting caller. The calls are counted
+    in the metrics `<name>_calls` and `<name>_coalesced`.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._flights = {}  # type: Dict[Hashable, gevent.Greenlet]
+
+    def __len__(self):
+        """the number of calls in flight"""
+        return len(self._flights)
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            metrics.increment(self.name + '_calls')
+
+            def run():
+                try:
+                    return function()
+                finally:
+                    del self._flights[key]
+            flight = self._flights[key] = spawn(run)
+        else:
+            metrics.increment(self.name + '_coalesced')
+        deadline = current_deadline()
+        if deadline is not None:
+            flight.join(timeout=max(deadline - time.monotonic(), 0))
+            if not flight.ready():
+                raise TimeoutException('{} did not finish before the deadline'.format(self.name))
+        return flight.get()
+
+
+class FairLimiter(object):
+    """Limits the number of concurrent calls and shares them fairly between requests
+
+    If all size slots are in use, the calls wait in one queue per request. A freed slot
+    is handed to the queues in turn, so that a request with many calls can not starve
+    the others. A call waits at most until the deadline of its greenlet and then raises
+    TimeoutException. The waits are counted in the metrics `<name>_waits`,
+    `<name>_wait_seconds` and `<name>_timeouts`.
+    """
+
+    def __init__(self, size: int = 20, name: str = 'limiter') -> None:
+        self.size = size
+        self.name = name
+        self.in_use = 0
+        self._waiting = OrderedDict()  # type: OrderedDict
+
+    @property
+    def number_of_waiting(self) -> int:
+        return sum(len(waiters) for waiters in self._waiting.values())
+
+    def register_gauges(self) -> None:
+        metrics.register_gauge(self.name + '_in_use', lambda: self.in_use)
+        metrics.register_gauge(self.name + '_waiting', lambda: self.number_of_waiting)
+
+    @contextmanager
+    def slot(self):
+        """holds a slot while in the context, waits for a free slot first"""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self) -> None:
+        """waits for a free slot and takes it, it has to be given back with release"""
+        if self.in_use < self.size and not self._waiting:
+            self.in_use += 1
+        else:
+            self._wait()
+
+    def release(self) -> None:
+        self._release()
+
+    def _wait(self) -> None:
+        request = current_request()
+        waiter = Event()
+        self._waiting.setdefault(request, deque()).append(waiter)
+        deadline = current_deadline()
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        start = time.monotonic()
+        metrics.increment(self.name + '_waits')
+        try:
+            acquired = waiter.wait(timeout)
+        except BaseException:
+            acquired = waiter.is_set()
+            if acquired:
+                # the slot was handed over while the greenlet was killed
+                self._release()
+            else:
+                self._remove(request, waiter)
+            raise
+        finally:
+            metrics.increment(self.name + '_wait_seconds', time.monotonic() - start)
+        if not acquired:
+            self._remove(request, waiter)
+            metrics.increment(self.name + '_timeouts')
+            raise TimeoutException('No free slot of {} before the deadline'.format(self.name))
+
+    def _remove(self, request, waiter) -> None:
+        waiters = self._waiting.get(request)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(waiter)
+        except ValueError:
+            pass
+        if not waiters:
+            del self._waiting[request]
+
+    def _release(self) -> None:
+        """hands the slot to the next call of the next request, or frees it"""
+        if self._waiting and self.in_use <= self.size:
+            request, waiters = next(iter(self._waiting.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                self._waiting.move_to_end(request)
+            else:
+                del self._waiting[request]
+            waiter.set()
+        else:
+            self.in_use -= 1
+
+
+# limits the queries of events to the node and to the database, the size is configured by the relay
+query_limiter = FairLimiter(name='query_limiter')
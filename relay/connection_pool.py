@@ -0,0 +1,125 @@
+"""gevent aware pool of database connections"""
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict  # noqa: F401
+
+import gevent.queue
+
+from relay import metrics
+from relay.concurrency_utils import TimeoutException
+from relay.logger import get_logger
+
+logger = get_logger('connection pool', logging.DEBUG)
+
+# put into the idle connections when a connection is discarded, the greenlet getting it opens a new one
+_NEW_CONNECTION = object()
+
+
+class ConnectionPool(object):
+    """Keeps up to size connections open and hands them out to one greenlet at a time
+
+    Connections are opened on demand. If all are in use, a greenlet waits up to timeout
+    seconds for one to be returned before a TimeoutException is raised. A connection
+    that was idle for more than health_check_interval seconds is checked with a
+    trivial query before it is handed out, broken connections are replaced.
+    """
+
+    def __init__(self, connect: Callable[[], Any], size: int = 10, timeout: float = 10,
+                 health_check_interval: float = 30, name: str = 'pool') -> None:
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.name = name
+        self._idle = gevent.queue.LifoQueue()
+        self._last_used = {}  # type: Dict[int, float]
+        self.number_of_connections = 0
+        self.in_use = 0
+        metrics.register_gauge(name + '_connections', lambda: self.number_of_connections)
+        metrics.register_gauge(name + '_connections_in_use', lambda: self.in_use)
+
+    @contextmanager
+    def connection(self):
+        conn = self._get()
+        try:
+            yield conn
+        finally:
+            self._put(conn)
+
+    def _get(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except gevent.queue.Empty:
+                if self.number_of_connections < self.size:
+                    return self._open()
+                conn = self._wait()
+            if conn is _NEW_CONNECTION:
+                if self.number_of_connections < self.size:
+                    return self._open()
+                continue
+            if self._is_healthy(conn):
+                self.in_use += 1
+                return conn
+            self._discard(conn)
+
+    def _open(self):
+        self.number_of_connections += 1
+        try:
+            conn = self._connect()
+        except Exception:
+            self._release()
+            raise
+        self.in_use += 1
+        return conn
+
+    def _wait(self):
+        metrics.increment(self.name + '_waits')
+        start = time.time()
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except gevent.queue.Empty:
+            metrics.increment(self.name + '_timeouts')
+            raise TimeoutException('No connection of {} available after {}s'.format(self.name, self.timeout))
+        finally:
+            metrics.increment(self.name + '_wait_seconds', time.time() - start)
+
+    def _is_healthy(self, conn) -> bool:
+        if getattr(conn, 'closed', False):
+            return False
+        if time.time() - self._last_used.get(id(conn), 0) < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+        except Exception as e:
+            logger.warning('Health check of connection failed: {}'.format(e))
+            return False
+        return True
+
+    def _put(self, conn) -> None:
+        self.in_use -= 1
+        try:
+            # do not hand out a connection within a transaction
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        self._last_used[id(conn)] = time.time()
+        self._idle.put(conn)
+
+    def _discard(self, conn) -> None:
+        self._release()
+        self._last_used.pop(id(conn), None)
+        metrics.increment(self.name + '_discarded')
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _release(self) -> None:
+        """frees the capacity of a connection and wakes a greenlet waiting for one"""
+        self.number_of_connections -= 1
+        self._idle.put(_NEW_CONNECTION)
@@ -1,18 +1,22 @@
 """provide access to the ethindex database"""
 
-import itertools
+import functools
 import logging
 import collections
 import psycopg2
 import psycopg2.extras
-from typing import List, Any
+from typing import Any, Callable, Iterable, List, Optional, Tuple
 from relay.blockchain import currency_network_events
 from relay.blockchain import token_events
 from relay.blockchain import unw_eth_events
 from relay.blockchain import exchange_events
 from relay.blockchain.events import BlockchainEvent, TLNetworkEvent
+from relay.blockchain import head_tracker
 import relay.blockchain.token_proxy
-from relay.blockchain.proxy import sorted_events
+from relay.blockchain.pagination import Position
+from relay import concurrency_utils
+from relay.connection_pool import ConnectionPool
+from relay.ethindex_sync_head import get_sync_head
 
 # proxy.get_all_events just asks for these network events. so we need the list
 # here.
@@ -20,15 +24,94 @@ from relay.blockchain.proxy import sorted_events
 
 logger = relay.logger.get_logger('ethindex_db', level=logging.DEBUG)
 
+# number of rows that are fetched from the server side cursor at once
+fetch_size = 1000
+
+# identical queries of all EthindexDB instances that run at the same time share one query
+_event_queries = concurrency_utils.SingleFlight('ethindex_queries')
+
+
+def _map_rows(function: Callable[[Any], Any], rows: Iterable[Any]) -> Iterable[Any]:
+    """applies function to the rows, lazily if they are read while they are consumed"""
+    if isinstance(rows, list):
+        return [function(row) for row in rows]
+    return map(function, rows)
+
+
+def _number_of_rows(rows: Iterable[Any]):
+    return len(rows) if isinstance(rows, list) else 'streamed'
+
+
+def _with_user(events: Iterable[BlockchainEvent], user_address: str) -> Iterable[BlockchainEvent]:
+    def set_user(event):
+        if not isinstance(event, TLNetworkEvent):
+            raise ValueError('Expected a TLNetworkEvent')
+        event.user = user_address
+        return event
+    return _map_rows(set_user, events)
+
 
 def connect(dsn):
     return psycopg2.connect(dsn, cursor_factory=psycopg2.extras.RealDictCursor)
 
 
+def create_pool(dsn, size: int = 10, timeout: float = 10) -> ConnectionPool:
+    """creates the pool of connections shared by all EthindexDB instances"""
+    return ConnectionPool(functools.partial(connect, dsn), size=size, timeout=timeout, name='ethindex_pool')
+
+
 # EventsQuery is used to store a where block together with required parameters
 # EthindexDB._run_events_query uses this to build and run a complete query.
 EventsQuery = collections.namedtuple("EventsQuery", ["where_block", "params"])
 
+# ContractEvents selects the events of contracts of one kind, the event_builders
+# and from_to_types are the ones of the module of the kind, e.g.
+# relay.blockchain.currency_network_events
+ContractEvents = collections.namedtuple(
+    "ContractEvents", ["addresses", "event_types", "event_builders", "from_to_types"])
+
+
+def contract_events_query(contract_address: str, event_types: List[str], from_block: int = 0) -> EventsQuery:
+    """builds a query for all events of event_types of the contract"""
+    return EventsQuery(
+        """blockNumber>=%s
+           AND address=%s
+           AND eventName IN %s""",
+        (from_block, contract_address, tuple(event_types)))
+
+
+def user_events_query(user_address: str,
+                      contract_events: List[ContractEvents],
+                      from_block: int = 0) -> Optional[EventsQuery]:
+    """builds a query for all events of the user in one statement
+
+    The event types of a kind of contract are grouped by the names of their
+    from and to arguments, so that every group needs one condition only.
+    """
+    contract_conditions = []
+    params = [from_block]  # type: List[Any]
+    for selection in contract_events:
+        if not selection.addresses or not selection.event_types:
+            continue
+        event_types_by_args = collections.OrderedDict()  # type: collections.OrderedDict
+        for event_type in selection.event_types:
+            from_to = tuple(selection.from_to_types[event_type])
+            event_types_by_args.setdefault(from_to, []).append(event_type)
+        event_conditions = []
+        params.append(tuple(selection.addresses))
+        for (_from, _to), event_types in event_types_by_args.items():
+            event_conditions.append(
+                "(eventName IN %s AND (args->>'{_from}'=%s OR args->>'{_to}'=%s))".format(_from=_from, _to=_to))
+            params.extend([tuple(event_types), user_address, user_address])
+        contract_conditions.append("(address IN %s AND ({}))".format(" OR ".join(event_conditions)))
+    if not contract_conditions:
+        return None
+    return EventsQuery(
+        """blockNumber>=%s
+           AND ({})
+        """.format("\n                OR ".join(contract_conditions)),
+        tuple(params))
+
 
 class EventBuilder:
     """Event Builder builds BlockchainEvents from web3 like events We use
@@ -40,7 +123,7 @@ class EventBuilder:
     """
 
     def __init__(self, _event_builders=None) -> None:
-        self.event_builders = _event_builders
+        self.event_builders = _event_builders or {}
 
     def build_events(self, events: List[Any], current_blocknumber: int):
         return [self._build_event(event, current_blocknumber) for event in events]
@@ -78,6 +161,38 @@ order_by_default_sort_order = \
     """
 
 
+def events_query_string(events_query: EventsQuery, after: Position = None, limit: int = None) -> Tuple[str, tuple]:
+    """returns the complete query on the events table and its parameters
+
+    Only the rows after the position after are selected, up to limit rows.
+    """
+    where_block = events_query.where_block
+    params = tuple(events_query.params)
+    if after is not None:
+        where_block = "({}) AND (blockNumber, transactionIndex, logIndex) > (%s, %s, %s)".format(where_block)
+        params += tuple(after)
+    query_string = "{select_star_from_events} WHERE {where_block} {order_by_default_sort_order}".format(
+        select_star_from_events=select_star_from_events,
+        where_block=where_block,
+        order_by_default_sort_order=order_by_default_sort_order)
+    if limit is not None:
+        query_string += " LIMIT %s"
+        params += (limit,)
+    return query_string, params
+
+
+# the event types that set the state of trustlines, with the key of the state that
+# each of them sets, the latest event of every key is the current state
+latest_graph_update_keys = [
+    (currency_network_events.TrustlineUpdateEventType,
+     "LEAST(e.args->>'_creditor', e.args->>'_debtor'), GREATEST(e.args->>'_creditor', e.args->>'_debtor')"),
+    (currency_network_events.CreditlineUpdateEventType,
+     "e.args->>'_creditor', e.args->>'_debtor'"),
+    (currency_network_events.BalanceUpdateEventType,
+     "LEAST(e.args->>'_from', e.args->>'_to'), GREATEST(e.args->>'_from', e.args->>'_to')"),
+]
+
+
 class EthindexDB:
     """EthIndexDB provides a partly compatible interface for the
        relay.blockchain.currency_network_proxy.CurrencyNetworkProxy,
@@ -91,8 +206,8 @@ class EthindexDB:
     we allow to pass a default address in.
     """
 
-    def __init__(self, conn, standard_event_types, event_builders, from_to_types, address=None):
-        self.conn = conn
+    def __init__(self, pool, standard_event_types=None, event_builders=None, from_to_types=None, address=None):
+        self.pool = pool
         self.default_address = address
         self.standard_event_types = standard_event_types
         self.event_builder = EventBuilder(event_builders)
@@ -106,13 +221,13 @@ class EthindexDB:
         return self.event_builder.build_events(rows, self._get_current_blocknumber())
 
     def _get_current_blocknumber(self):
-        with self.conn.cursor() as cur:
-            cur.execute("""select * from sync where syncid='default'""")
-            row = cur.fetchone()
-            if row:
-                return row["last_block_number"]
-            else:
-                raise RuntimeError("Could not determine current block number")
+        blocknumber = head_tracker.current_blocknumber()
+        if blocknumber is not None:
+            return blocknumber
+        blocknumber = get_sync_head(self.pool).blocknumber
+        if blocknumber is None:
+            raise RuntimeError("Could not determine current block number")
+        return blocknumber
 
     def _get_addr(self, address):
         """all the methods here take an address argument
@@ -129,26 +244,57 @@ class EthindexDB:
         assert r, "no standard event passed in and no default events given"
         return r
 
-    def _run_events_query(self, events_query: EventsQuery) -> List[BlockchainEvent]:
-        """run a query on the events table"""
-        query_string = "{select_star_from_events} WHERE {where_block} {order_by_default_sort_order}".format(
-            select_star_from_events=select_star_from_events,
-            where_block=events_query.where_block,
-            order_by_default_sort_order=order_by_default_sort_order)
-
-        with self.conn as conn:
-            with conn.cursor() as cur:
-                cur.execute(query_string, events_query.params)
-                rows = cur.fetchall()
-                return self._build_events(rows)
+    def _run_events_query(self,
+                          events_query: EventsQuery,
+                          after: Position = None,
+                          limit: int = None) -> Iterable[BlockchainEvent]:
+        """run a query on the events table, see _query_events"""
+        rows = self._query_events(events_query, after=after, limit=limit)
+        current_blocknumber = self._get_current_blocknumber()
+        return _map_rows(lambda row: self.event_builder._build_event(row, current_blocknumber), rows)
+
+    def _query_events(self, events_query: EventsQuery, after: Position = None, limit: int = None) -> Iterable[Any]:
+        """run a query on the events table and return the rows
+
+        The rows are read with a server side cursor in chunks of fetch_size, so that
+        the result set is never held twice by the driver and in python. The rows of a
+        page, i.e. of a query with a limit, are returned as a list, identical pages
+        that are queried at the same time share the rows of one query. The rows of a
+        query without limit are returned as an iterator that reads the next chunk
+        when it is consumed, so that the whole history is never held at once. It
+        holds its connection until it is exhausted or closed.
+        """
+        query_string, params = events_query_string(events_query, after=after, limit=limit)
+        if limit is None:
+            return self._iter_rows(query_string, params)
+
+        def query():
+            with concurrency_utils.query_limiter.slot(), self.pool.connection() as conn, conn:
+                with conn.cursor(name="events_query") as cur:
+                    cur.itersize = fetch_size
+                    cur.execute(query_string, params)
+                    return list(cur)
+        return _event_queries.do((self.pool, query_string, params), query)
+
+    def _iter_rows(self, query_string: str, params: tuple) -> Iterable[Any]:
+        with concurrency_utils.query_limiter.slot(), self.pool.connection() as conn, conn:
+            with conn.cursor(name="events_query") as cur:
+                cur.execute(query_string, params)
+                while True:
+                    rows = cur.fetchmany(fetch_size)
+                    if not rows:
+                        return
+                    yield from rows
 
     def get_network_events(
             self,
             event_name: str,
             user_address: str = None,
             from_block: int = 0,
-            timeout: float = None
-    ) -> List[BlockchainEvent]:
+            timeout: float = None,
+            after: Position = None,
+            limit: int = None,
+    ) -> Iterable[BlockchainEvent]:
         """Function for compatibility with relay.blockchain.CurrencyNetworkProxy.
         Will be removed after a refactoring
         """
@@ -157,6 +303,8 @@ class EthindexDB:
             user_address,
             from_block,
             timeout,
+            after=after,
+            limit=limit,
         )
 
     def get_unw_eth_events(
@@ -165,13 +313,17 @@ class EthindexDB:
             user_address: str = None,
             from_block: int = 0,
             timeout: float = None,
-    ) -> List[BlockchainEvent]:
+            after: Position = None,
+            limit: int = None,
+    ) -> Iterable[BlockchainEvent]:
         """Function for compatibility with relay.blockchain.UnwEthProxy. Will be removed after a refactoring"""
         return self.get_user_events(
             event_name,
             user_address,
             from_block,
             timeout,
+            after=after,
+            limit=limit,
         )
 
     def get_token_events(
@@ -180,13 +332,17 @@ class EthindexDB:
             user_address: str = None,
             from_block: int = 0,
             timeout: float = None,
-    ) -> List[BlockchainEvent]:
+            after: Position = None,
+            limit: int = None,
+    ) -> Iterable[BlockchainEvent]:
         """Function for compatibility with relay.blockchain.TokenProxy. Will be removed after a refactoring"""
         return self.get_user_events(
             event_name,
             user_address,
             from_block,
             timeout,
+            after=after,
+            limit=limit,
         )
 
     def get_exchange_events(
@@ -195,13 +351,17 @@ class EthindexDB:
             user_address: str = None,
             from_block: int = 0,
             timeout: float = None,
-    ) -> List[BlockchainEvent]:
+            after: Position = None,
+            limit: int = None,
+    ) -> Iterable[BlockchainEvent]:
         """Function for compatibility with relay.blockchain.ExchangeProxy. Will be removed after a refactoring"""
         return self.get_user_events(
             event_name,
             user_address,
             from_block,
             timeout,
+            after=after,
+            limit=limit,
         )
 
     def get_user_events(
@@ -210,70 +370,79 @@ class EthindexDB:
         user_address: str = None,
         from_block: int = 0,
         timeout: float = None,
+        after: Position = None,
+        limit: int = None,
         contract_address: str = None,
-    ) -> List[BlockchainEvent]:
+    ) -> Iterable[BlockchainEvent]:
         contract_address = self._get_addr(contract_address)
         if user_address is None:
             return self.get_events(event_name, from_block=from_block, timeout=timeout,
-                                   contract_address=contract_address)
-        query = EventsQuery(
-            """blockNumber>=%s
-               AND eventName=%s
-               AND address=%s
-               AND (args->>'{_from}'=%s or args->>'{_to}'=%s)
-            """.format(_from=self.from_to_types[event_name][0],
-                       _to=self.from_to_types[event_name][1]),
-            (from_block, event_name, contract_address, user_address, user_address))
-
-        events = self._run_events_query(query)
+                                   after=after, limit=limit, contract_address=contract_address)
+        query = user_events_query(
+            user_address,
+            [ContractEvents([contract_address], [event_name], self.event_builder.event_builders, self.from_to_types)],
+            from_block)
+
+        events = self._run_events_query(query, after=after, limit=limit)
 
         logger.debug("get_user_events(%s, %s, %s, %s, %s) -> %s rows",
-                     event_name, user_address, from_block, timeout, contract_address, len(events))
+                     event_name, user_address, from_block, timeout, contract_address, _number_of_rows(events))
 
-        for event in events:
-            if isinstance(event, TLNetworkEvent):
-                event.user = user_address
-            else:
-                raise ValueError('Expected a TLNetworkEvent')
-        return events
+        return _with_user(events, user_address)
 
     def get_all_unw_eth_events(self,
                                user_address: str = None,
                                from_block: int = 0,
-                               timeout: float = None) -> List[BlockchainEvent]:
+                               timeout: float = None,
+                               after: Position = None,
+                               limit: int = None) -> Iterable[BlockchainEvent]:
         return self.get_all_contract_events(unw_eth_events.standard_event_types,
                                             user_address,
                                             from_block,
-                                            timeout)
+                                            timeout,
+                                            after=after,
+                                            limit=limit)
 
     def get_all_token_events(self,
                              user_address: str = None,
                              from_block: int = 0,
-                             timeout: float = None) -> List[BlockchainEvent]:
+                             timeout: float = None,
+                             after: Position = None,
+                             limit: int = None) -> Iterable[BlockchainEvent]:
         return self.get_all_contract_events(token_events.standard_event_types,
                                             user_address,
                                             from_block,
-                                            timeout)
+                                            timeout,
+                                            after=after,
+                                            limit=limit)
 
     def get_all_network_events(self,
                                user_address: str = None,
                                from_block: int = 0,
-                               timeout: float = None
-                               ) -> List[BlockchainEvent]:
+                               timeout: float = None,
+                               after: Position = None,
+                               limit: int = None,
+                               ) -> Iterable[BlockchainEvent]:
         return self.get_all_contract_events(currency_network_events.standard_event_types,
                                             user_address,
                                             from_block,
-                                            timeout)
+                                            timeout,
+                                            after=after,
+                                            limit=limit)
 
     def get_all_exchange_events(self,
                                 user_address: str = None,
                                 from_block: int = 0,
-                                timeout: float = None
-                                ) -> List[BlockchainEvent]:
+                                timeout: float = None,
+                                after: Position = None,
+                                limit: int = None,
+                                ) -> Iterable[BlockchainEvent]:
         return self.get_all_contract_events(exchange_events.standard_event_types,
                                             user_address,
                                             from_block,
-                                            timeout)
+                                            timeout,
+                                            after=after,
+                                            limit=limit)
 
     def get_all_contract_events(
         self,
@@ -281,37 +450,91 @@ class EthindexDB:
         user_address: str = None,
         from_block: int = 0,
         timeout: float = None,
+        after: Position = None,
+        limit: int = None,
         contract_address: str = None,
-    ) -> List[BlockchainEvent]:
-        # XXX The following code should be replaced with a proper SQL query.
-        # The reason it isn't already a SQL query, is that we need to
-        # dynamically create that query.
+    ) -> Iterable[BlockchainEvent]:
         contract_address = self._get_addr(contract_address)
-        results = [self.get_user_events(event_type,
-                                        user_address=user_address,
-                                        from_block=from_block,
-                                        timeout=timeout,
-                                        contract_address=contract_address)
-                   for event_type in event_types]
-        return sorted_events(list(itertools.chain.from_iterable(results)))
+        if user_address is None:
+            return self.get_all_events(from_block=from_block,
+                                       timeout=timeout,
+                                       after=after,
+                                       limit=limit,
+                                       contract_address=contract_address,
+                                       standard_event_types=event_types)
+        return self.get_contracts_user_events(
+            user_address,
+            [ContractEvents([contract_address], event_types, self.event_builder.event_builders, self.from_to_types)],
+            from_block=from_block,
+            timeout=timeout,
+            after=after,
+            limit=limit)
+
+    def get_contracts_user_events(
+        self,
+        user_address: str,
+        contract_events: List[ContractEvents],
+        from_block: int = 0,
+        timeout: float = None,
+        after: Position = None,
+        limit: int = None,
+    ) -> Iterable[BlockchainEvent]:
+        """returns the events of the user of all selected contracts, queried with a
+        single statement and ordered by the database"""
+        query = user_events_query(user_address, contract_events, from_block)
+        if query is None:
+            return []
+        # event names are not unique between the kinds of contracts
+        builder_by_address = {}
+        for selection in contract_events:
+            builder = EventBuilder(selection.event_builders)
+            for address in selection.addresses:
+                builder_by_address[address] = builder
+
+        rows = self._query_events(query, after=after, limit=limit)
+        current_blocknumber = self._get_current_blocknumber()
+        events = _map_rows(lambda row: builder_by_address[row["address"]]._build_event(row, current_blocknumber),
+                           rows)
+
+        logger.debug("get_contracts_user_events(%s, %s, %s, %s) -> %s rows",
+                     user_address, contract_events, from_block, timeout, _number_of_rows(events))
+
+        return _with_user(events, user_address)
+
+    def get_contracts_with_user_events(self, user_address: str, addresses: List[str]) -> Tuple[List[str], int]:
+        """returns the contracts of addresses with events of the user and the block up to which they are read
+
+        The user is looked up in all arguments of from_to_types, with the indexes of relay.ethindex_schema.
+        """
+        argument_names = sorted({name for from_to in self.from_to_types.values() for name in from_to})
+        conditions = " OR ".join("args->>'{}'=%s".format(name) for name in argument_names)
+        with self.pool.connection() as conn, conn:
+            with conn.cursor() as cur:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                cur.execute("""select * from sync where syncid='default'""")
+                row = cur.fetchone()
+                if not row:
+                    raise RuntimeError("Could not determine the block synced by ethindex")
+                cur.execute("SELECT DISTINCT address FROM events WHERE address IN %s AND ({})".format(conditions),
+                            (tuple(addresses),) + (user_address,) * len(argument_names))
+                contracts = [contract_row["address"] for contract_row in cur.fetchall()]
+        return contracts, row["last_block_number"]
 
     def get_events(
         self,
         event_name,
         from_block=0,
         timeout: float = None,
+        after: Position = None,
+        limit: int = None,
         contract_address: str = None,
-    ) -> List[BlockchainEvent]:
+    ) -> Iterable[BlockchainEvent]:
         contract_address = self._get_addr(contract_address)
-        query = EventsQuery(
-            """blockNumber>=%s
-               AND eventName=%s
-               AND address=%s""",
-            (from_block, event_name, contract_address))
-        events = self._run_events_query(query)
+        query = contract_events_query(contract_address, [event_name], from_block)
+        events = self._run_events_query(query, after=after, limit=limit)
 
         logger.debug("get_events(%s, %s, %s, %s) -> %s rows",
-                     event_name, from_block, timeout, contract_address, len(events))
+                     event_name, from_block, timeout, contract_address, _number_of_rows(events))
 
         return events
 
@@ -319,19 +542,47 @@ class EthindexDB:
             self,
             from_block: int = 0,
             timeout: float = None,
+            after: Position = None,
+            limit: int = None,
             contract_address: str = None,
             standard_event_types=None,
-    ) -> List[BlockchainEvent]:
+    ) -> Iterable[BlockchainEvent]:
         contract_address = self._get_addr(contract_address)
         standard_event_types = self._get_standard_event_types(standard_event_types)
-        query = EventsQuery(
-            """blockNumber>=%s
-               AND address=%s
-               AND eventName in %s""",
-            (from_block, contract_address, tuple(standard_event_types)))
+        query = contract_events_query(contract_address, standard_event_types, from_block)
 
-        events = self._run_events_query(query)
+        events = self._run_events_query(query, after=after, limit=limit)
         logger.debug("get_all_events(%s, %s, %s) -> %s rows",
-                     from_block, timeout, contract_address, len(events))
+                     from_block, timeout, contract_address, _number_of_rows(events))
 
         return events
+
+    def get_latest_graph_update_events(self, contract_address: str = None) -> Tuple[List[BlockchainEvent], int]:
+        """returns the latest events of the network that set the state of every trustline and the block
+        up to which they are read
+
+        These are the latest TrustlineUpdate and BalanceUpdate of every pair of users and the latest
+        CreditlineUpdate of every creditor and debtor. All queries read the same snapshot of the database,
+        which is synced up to the returned block.
+        """
+        contract_address = self._get_addr(contract_address)
+        rows = []  # type: List[Any]
+        with self.pool.connection() as conn, conn:
+            with conn.cursor() as cur:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                cur.execute("""select * from sync where syncid='default'""")
+                row = cur.fetchone()
+                if not row:
+                    raise RuntimeError("Could not determine the block synced by ethindex")
+                blocknumber = row["last_block_number"]
+                for event_type, distinct_on in latest_graph_update_keys:
+                    cur.execute(
+                        """SELECT DISTINCT ON ({distinct_on}) *
+                           FROM ({select_star_from_events} WHERE address=%s AND eventName=%s AND blockNumber<=%s) e
+                           ORDER BY {distinct_on}, "blockNumber" DESC, "transactionIndex" DESC, "logIndex" DESC
+                        """.format(distinct_on=distinct_on, select_star_from_events=select_star_from_events),
+                        (contract_address, event_type, blocknumber))
+                    rows.extend(cur.fetchall())
+        logger.debug("get_latest_graph_update_events(%s) -> %s rows up to block %s",
+                     contract_address, len(rows), blocknumber)
+        return self._build_events(rows), blocknumber
@@ -0,0 +1,150 @@
+"""indexes of the ethindex events table used by the relay
+
+The events table is written by ethindex, but it is only read by the relay, so the
+relay defines the indexes its queries need:
+
+- one composite index for the events of a contract, which is also in the order of
+  the events, so that pages of events can be read without sorting
+- one expression index per argument name that holds a user address in any event,
+  the user events query combines them for the from and to arguments
+
+The indexes are created concurrently, so that ethindex can keep writing events
+while they are built. A trigger on the sync table notifies the relay about every
+synced block, see relay.ethindex_sync_head. check_query_plans explains every shape of query the relay
+runs and warns if one of them would need a sequential scan of the events table.
+"""
+import collections
+import logging
+from typing import Any, Iterable, List  # noqa: F401
+
+from relay.blockchain import currency_network_events
+from relay.blockchain import exchange_events
+from relay.blockchain import token_events
+from relay.blockchain import unw_eth_events
+from relay import ethindex_db
+from relay import ethindex_sync_head
+from relay.logger import get_logger
+
+logger = get_logger('ethindex_schema', logging.DEBUG)
+
+Index = collections.namedtuple("Index", ["name", "definition"])
+
+events_modules = [currency_network_events, token_events, unw_eth_events, exchange_events]
+
+# a valid address, the planner should not know any rows of it
+sample_address = '0x' + 40 * '0'
+
+
+def user_argument_names() -> List[str]:
+    """returns the names of all event arguments that hold a user address"""
+    return sorted({name
+                   for module in events_modules
+                   for from_to in module.from_to_types.values()
+                   for name in from_to})
+
+
+def indexes() -> List[Index]:
+    result = [Index("events_address_eventname_position_idx",
+                    "events (address, eventName, blockNumber, transactionIndex, logIndex)"),
+              Index("events_address_position_idx",
+                    "events (address, blockNumber, transactionIndex, logIndex)")]
+    for name in user_argument_names():
+        result.append(Index("events_args_{}_idx".format(name.lstrip('_')),
+                            "events ((args->>'{}'), address, blockNumber)".format(name)))
+    return result
+
+
+def _existing_indexes(conn) -> dict:
+    """returns whether the existing indexes of the events table are valid by their names"""
+    with conn.cursor() as cur:
+        cur.execute("""SELECT c.relname AS name, i.indisvalid AS valid
+                       FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                       WHERE i.indrelid = 'events'::regclass""")
+        return {row["name"]: row["valid"] for row in cur.fetchall()}
+
+
+def create_sync_notify_trigger(conn) -> None:
+    """creates the trigger that notifies the channel of the sync head about every synced block"""
+    with conn.cursor() as cur:
+        cur.execute("""CREATE OR REPLACE FUNCTION relay_notify_sync() RETURNS trigger AS $$
+                       BEGIN
+                         PERFORM pg_notify('{channel}', NEW.last_block_number::text);
+                         RETURN NEW;
+                       END;
+                       $$ LANGUAGE plpgsql""".format(channel=ethindex_sync_head.channel))
+        cur.execute("DROP TRIGGER IF EXISTS {} ON sync".format(ethindex_sync_head.trigger_name))
+        cur.execute("""CREATE TRIGGER {} AFTER INSERT OR UPDATE ON sync
+                       FOR EACH ROW WHEN (NEW.syncid = 'default') EXECUTE PROCEDURE relay_notify_sync()""".format(
+            ethindex_sync_head.trigger_name))
+
+
+def migrate(conn) -> List[str]:
+    """creates the sync notify trigger and the missing indexes and returns the names of the created indexes
+
+    conn has to be in autocommit mode, indexes can not be created concurrently
+    within a transaction. An index whose concurrent build failed is invalid, it
+    is dropped and built again.
+    """
+    create_sync_notify_trigger(conn)
+    existing = _existing_indexes(conn)
+    created = []
+    for index in indexes():
+        valid = existing.get(index.name)
+        if valid:
+            continue
+        with conn.cursor() as cur:
+            if valid is not None:
+                logger.warning("Index %s is invalid, dropping it", index.name)
+                cur.execute("DROP INDEX CONCURRENTLY IF EXISTS {}".format(index.name))
+            logger.info("Creating index %s on %s", index.name, index.definition)
+            cur.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {}".format(index.name, index.definition))
+        created.append(index.name)
+    return created
+
+
+def query_shapes() -> List[Any]:
+    """returns a sample query with its parameters for every shape of query run by EthindexDB"""
+    shapes = []
+    for module in events_modules:
+        all_events = ethindex_db.contract_events_query(sample_address, module.standard_event_types)
+        user_events = ethindex_db.user_events_query(
+            sample_address,
+            [ethindex_db.ContractEvents([sample_address, sample_address],
+                                        module.standard_event_types,
+                                        module.event_builders,
+                                        module.from_to_types)])
+        for name, events_query in [('{} events'.format(module.__name__), all_events),
+                                   ('{} user events'.format(module.__name__), user_events)]:
+            shapes.append((name, ethindex_db.events_query_string(events_query)))
+            shapes.append((name + ' page', ethindex_db.events_query_string(events_query, after=(1, 0, 0), limit=100)))
+    live_events = ethindex_db.EventsQuery("address IN %s", ((sample_address, sample_address),))
+    shapes.append(('live events', ethindex_db.events_query_string(live_events, after=(1, 0, 0), limit=1000)))
+    return shapes
+
+
+def _scanned_relations(plan) -> Iterable[Any]:
+    """yields the node type and relation of every node of the plan that scans a relation"""
+    if 'Relation Name' in plan:
+        yield plan['Node Type'], plan['Relation Name']
+    for subplan in plan.get('Plans', []):
+        yield from _scanned_relations(subplan)
+
+
+def check_query_plans(conn) -> List[str]:
+    """explains every shape of query and returns the names of those that need a sequential scan of events
+
+    Sequential scans are disabled while explaining, so the planner only plans one
+    if no index can be used, independent of the current size of the table.
+    """
+    sequential = []
+    for name, (query_string, params) in query_shapes():
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL enable_seqscan = off")
+                cur.execute("EXPLAIN (FORMAT JSON) " + query_string, params)
+                row = cur.fetchone()
+        plan = row['QUERY PLAN'][0]['Plan']
+        if ('Seq Scan', 'events') in _scanned_relations(plan):
+            logger.warning("Query for %s needs a sequential scan of the events table, indexes are missing", name)
+            sequential.append(name)
+    return sequential
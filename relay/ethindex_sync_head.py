@@ -0,0 +1,141 @@
+"""follows the last block synced by ethindex
+
+Every built result set of events needs the current block number. Instead of
+reading the sync table for every query, the block number is cached for all
+EthindexDB instances. It is updated from notifications on a LISTEN channel,
+which the trigger created by relay.ethindex_schema.migrate sends whenever
+ethindex updates the sync table. While no notifications arrive, the sync table
+is polled every fallback_interval seconds in case one was lost, or every
+poll_interval seconds if the trigger does not exist.
+"""
+import logging
+import socket
+import weakref
+from typing import Callable, List, Optional  # noqa: F401
+
+import gevent
+import gevent.socket
+
+from relay import metrics
+from relay.logger import get_logger
+
+logger = get_logger('ethindex sync head', logging.DEBUG)
+
+channel = 'ethindex_sync'
+trigger_name = 'relay_notify_sync'
+reconnect_interval = 3  # 3s
+
+
+class SyncHead(object):
+
+    def __init__(self, pool, poll_interval: float = 1, fallback_interval: float = 30) -> None:
+        self._pool = pool
+        self.poll_interval = poll_interval
+        self.fallback_interval = fallback_interval
+        self.has_trigger = False
+        self._blocknumber = None  # type: Optional[int]
+        self._greenlet = None  # type: gevent.Greenlet
+        self._listeners = []  # type: List[Callable[[int], None]]
+        self.listening = False
+
+    @property
+    def blocknumber(self) -> Optional[int]:
+        """the last block synced by ethindex, read from the sync table if it is not followed"""
+        if not self.listening or self._blocknumber is None:
+            self.update()
+        return self._blocknumber
+
+    def update(self) -> None:
+        with self._pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""select * from sync where syncid='default'""")
+                row = cur.fetchone()
+        if row:
+            self._set_blocknumber(row["last_block_number"])
+
+    def add_listener(self, function: Callable[[int], None]) -> None:
+        """calls function with the new block number whenever ethindex synced a new block"""
+        self._listeners.append(function)
+
+    def _set_blocknumber(self, blocknumber: int) -> None:
+        if self._blocknumber is None or blocknumber > self._blocknumber:
+            self._blocknumber = blocknumber
+            for function in self._listeners:
+                function(blocknumber)
+
+    def _wait(self, conn, timeout: float) -> bool:
+        """waits up to timeout seconds for notifications and returns whether there were any"""
+        try:
+            gevent.socket.wait_read(conn.fileno(), timeout=timeout)
+        except socket.timeout:
+            return False
+        conn.poll()
+        notified = False
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            notified = True
+            try:
+                self._set_blocknumber(int(notify.payload))
+            except ValueError:
+                self.update()
+        return notified
+
+    def _listen(self, conn) -> None:
+        # notifications are only delivered outside of transactions
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("LISTEN {}".format(channel))
+            cur.execute("SELECT 1 FROM pg_trigger WHERE tgname = %s", (trigger_name,))
+            self.has_trigger = cur.fetchone() is not None
+        self.listening = True
+        if self.has_trigger:
+            logger.info('Listening for ethindex sync updates')
+            interval = self.fallback_interval
+        else:
+            logger.warning('The trigger {} on the sync table does not exist, polling the sync table every {}s. '
+                           'Set ethindexCreateIndexes to create it'.format(trigger_name, self.poll_interval))
+            interval = self.poll_interval
+        # updates could have been missed before listening
+        self.update()
+        while True:
+            if not self._wait(conn, interval):
+                self.update()
+
+    def _run(self, connect: Callable) -> None:
+        while True:
+            conn = None
+            try:
+                conn = connect()
+                self._listen(conn)
+            except Exception as err:
+                logger.warning('Listening for ethindex sync updates failed, trying to reconnect: {}'.format(err))
+            finally:
+                self.listening = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            gevent.sleep(reconnect_interval)
+
+    def start(self, connect: Callable) -> None:
+        """starts following the sync head with a dedicated connection created by connect"""
+        self._greenlet = gevent.spawn(self._run, connect)
+        metrics.register_gauge('ethindex_sync_head', lambda: self._blocknumber)
+
+    def stop(self) -> None:
+        if self._greenlet is not None:
+            self._greenlet.kill()
+            self._greenlet = None
+
+
+_sync_heads = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+
+
+def get_sync_head(pool) -> SyncHead:
+    """returns the sync head shared by everything using the connections of pool"""
+    try:
+        return _sync_heads[pool]
+    except KeyError:
+        sync_head = _sync_heads[pool] = SyncHead(pool)
+        return sync_head
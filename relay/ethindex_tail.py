@@ -0,0 +1,110 @@
+"""live events from the ethindex events table
+
+EventTail is an alternative to the filters of the node for the live events of
+the contracts. It reads the events that ethindex wrote after its cursor, the
+(blockNumber, transactionIndex, logIndex) position of the last delivered event,
+and delivers them in the order of the chain. It starts at the block after the
+sync head and reads new events whenever the sync head advances, or every
+poll_interval seconds.
+
+As the cursor only advances with delivered events, no events are missed if the
+database can not be reached for a while. Only the blocks up to the sync head
+are read, so blocks are only read after ethindex synced them completely, and no
+events are written behind the cursor later. delivered_block is the block up to
+which all events were delivered, it lags behind the node if ethindex does.
+"""
+import logging
+import sys
+from typing import Any, Callable, Dict, List  # noqa: F401
+
+import gevent
+from gevent.event import Event
+
+from relay import metrics
+from relay.blockchain.pagination import Position  # noqa: F401
+from relay.logger import get_logger
+
+logger = get_logger('ethindex tail', logging.DEBUG)
+
+reconnect_interval = 3  # 3s
+
+
+class EventTail(object):
+
+    def __init__(self, pool, sync_head, batch_size: int = 1000, poll_interval: float = 1) -> None:
+        self._pool = pool
+        self._sync_head = sync_head
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.cursor = None  # type: Position
+        # the block up to which all events were delivered
+        self.delivered_block = None  # type: int
+        self._listeners = {}  # type: Dict[str, List[Callable[[Any], None]]]
+        self._new_block = Event()
+        self._greenlet = None  # type: gevent.Greenlet
+        sync_head.add_listener(lambda blocknumber: self._new_block.set())
+
+    def add_listener(self, address: str, function: Callable[[Any], None]) -> None:
+        """calls function with every new event of the contract at address"""
+        self._listeners.setdefault(address, []).append(function)
+
+    def _fetch(self, addresses: List[str], to_block: int) -> List[Any]:
+        """returns the next batch of events of the addresses after the cursor up to to_block"""
+        # imported here, so that the events can be dispatched without the postgres driver
+        from relay import ethindex_db
+        query_string, params = ethindex_db.events_query_string(
+            ethindex_db.EventsQuery("address IN %s AND blockNumber<=%s", (tuple(addresses), to_block)),
+            after=self.cursor,
+            limit=self.batch_size)
+        with self._pool.connection() as conn, conn:
+            with conn.cursor() as cur:
+                cur.execute(query_string, params)
+                return cur.fetchall()
+
+    def _dispatch(self, event) -> None:
+        for function in self._listeners.get(event["address"], []):
+            try:
+                function(event)
+            except Exception:
+                logger.critical("Error while handling event {}".format(event.get("transactionHash")),
+                                exc_info=sys.exc_info())
+
+    def poll(self) -> int:
+        """delivers all new events up to the sync head and returns how many were delivered"""
+        blocknumber = self._sync_head.blocknumber
+        if blocknumber is None:
+            return 0
+        if self.cursor is None:
+            self.cursor = (blocknumber + 1, -1, -1)
+        delivered = 0
+        while self._listeners:
+            events = self._fetch(list(self._listeners), blocknumber)
+            for event in events:
+                self._dispatch(event)
+                self.cursor = (event["blockNumber"], event["transactionIndex"], event["logIndex"])
+            delivered += len(events)
+            metrics.increment('ethindex_tail_events', len(events))
+            if len(events) < self.batch_size:
+                break
+        self.delivered_block = blocknumber
+        return delivered
+
+    def _run(self) -> None:
+        while True:
+            self._new_block.clear()
+            try:
+                self.poll()
+            except Exception as err:
+                logger.warning('Reading new events from ethindex failed, trying again: {}'.format(err))
+                gevent.sleep(reconnect_interval)
+                continue
+            self._new_block.wait(self.poll_interval)
+
+    def start(self) -> None:
+        self._greenlet = gevent.spawn(self._run)
+        metrics.register_gauge('ethindex_tail_blocknumber', lambda: self.cursor[0] if self.cursor else None)
+
+    def stop(self) -> None:
+        if self._greenlet is not None:
+            self._greenlet.kill()
+            self._greenlet = None
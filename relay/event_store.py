@@ -0,0 +1,230 @@
+"""a local store of the events of the contracts for the relay without ethindex
+
+Without ethindex, every query for the events of a user makes the node scan the
+logs of the contract from block 0, once for every argument that could hold the
+user. The EventStore keeps the events in an embedded SQLite database instead,
+together with the users of every event, indexed by (user, contract, block).
+
+EventStoreSync fills the store with the events of every added proxy: it
+backfills the events from block 0 once and then stores the events of every new
+block as soon as it has `confirmations` blocks on top, so that the store never
+holds events of blocks that are replaced later. The store remembers the block up
+to which it holds all events of a contract. Proxies answer event queries up to
+that block from the store and only ask the node for the few blocks since.
+"""
+import json
+import logging
+import socket
+import sqlite3
+from collections.abc import Mapping
+from typing import Any, Dict, List, Optional  # noqa: F401
+
+import gevent
+
+from relay import metrics
+from relay.logger import get_logger
+
+logger = get_logger('event store', logging.DEBUG)
+
+schema = [
+    """CREATE TABLE IF NOT EXISTS events (
+           address TEXT NOT NULL,
+           blockNumber INTEGER NOT NULL,
+           transactionIndex INTEGER NOT NULL,
+           logIndex INTEGER NOT NULL,
+           eventName TEXT NOT NULL,
+           transactionHash TEXT,
+           blockHash TEXT,
+           timestamp INTEGER,
+           args TEXT NOT NULL,
+           PRIMARY KEY (address, blockNumber, transactionIndex, logIndex)
+       ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS user_events (
+           user TEXT NOT NULL,
+           address TEXT NOT NULL,
+           blockNumber INTEGER NOT NULL,
+           transactionIndex INTEGER NOT NULL,
+           logIndex INTEGER NOT NULL,
+           PRIMARY KEY (user, address, blockNumber, transactionIndex, logIndex)
+       ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS synced (
+           address TEXT PRIMARY KEY,
+           blockNumber INTEGER NOT NULL
+       )""",
+]
+
+select_events = """SELECT e.address, e.blockNumber, e.transactionIndex, e.logIndex, e.eventName,
+                          e.transactionHash, e.blockHash, e.timestamp, e.args
+                   FROM events e"""
+
+
+def _hex(value):
+    if isinstance(value, bytes):
+        return '0x' + value.hex()
+    return value
+
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return _hex(value)
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError('Can not store {!r}'.format(value))
+
+
+def _row_to_event(row) -> Dict[str, Any]:
+    """returns the event of the row in the form of web3"""
+    return {'address': row[0],
+            'blockNumber': row[1],
+            'transactionIndex': row[2],
+            'logIndex': row[3],
+            'event': row[4],
+            'transactionHash': row[5],
+            'blockHash': row[6],
+            'timestamp': row[7],
+            'args': json.loads(row[8])}
+
+
+def _users(event) -> List[str]:
+    """returns the users of the event, the values of its from and to arguments"""
+    users = []  # type: List[str]
+    for attribute in ('from_', 'to'):
+        try:
+            user = getattr(event, attribute)
+        except (AttributeError, KeyError):
+            continue
+        if isinstance(user, str) and user not in users:
+            users.append(user)
+    return users
+
+
+class EventStore(object):
+
+    def __init__(self, path: str = ':memory:') -> None:
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            for statement in schema:
+                self._conn.execute(statement)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def synced_block(self, address: str) -> Optional[int]:
+        """returns the block up to which all events of the contract at address are stored"""
+        row = self._conn.execute("SELECT blockNumber FROM synced WHERE address=?", (address,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def add_events(self, address: str, events: List[Any], synced_block: int) -> None:
+        """stores the events of the contract at address, which are all of its events up to synced_block
+
+        events are BlockchainEvents, the users of an event are read from its from and to arguments.
+        """
+        with self._conn:
+            for event in events:
+                web3_event = event._web3_event
+                key = (address, event.blocknumber, event.transaction_index or 0, event.log_index or 0)
+                self._conn.execute(
+                    """INSERT OR REPLACE INTO events
+                       (address, blockNumber, transactionIndex, logIndex, eventName,
+                        transactionHash, blockHash, timestamp, args)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    key + (event.type,
+                           _hex(web3_event.get('transactionHash')),
+                           _hex(web3_event.get('blockHash')),
+                           event.timestamp,
+                           json.dumps(web3_event.get('args'), default=_encode)))
+                for user in _users(event):
+                    self._conn.execute("INSERT OR REPLACE INTO user_events VALUES (?, ?, ?, ?, ?)",
+                                       (user.lower(),) + key)
+            self._conn.execute("INSERT OR REPLACE INTO synced VALUES (?, ?)", (address, synced_block))
+        metrics.increment('event_store_events', len(events))
+
+    def get_addresses_of_user(self, user_address: str) -> List[str]:
+        """returns the addresses of the contracts with stored events of the user"""
+        rows = self._conn.execute("SELECT DISTINCT address FROM user_events WHERE user=?", (user_address.lower(),))
+        return [row[0] for row in rows]
+
+    def get_events(self,
+                   address: str,
+                   event_types: List[str],
+                   user_address: str = None,
+                   from_block: int = 0,
+                   to_block: int = None) -> List[Dict[str, Any]]:
+        """returns the stored events of event_types of the contract in the form of web3, in the order of the chain
+
+        With a user_address, only the events in which the user is the from or to party are returned.
+        """
+        if not event_types:
+            return []
+        conditions = ["e.address=?", "e.blockNumber>=?",
+                      "e.eventName IN ({})".format(", ".join("?" * len(event_types)))]
+        params = [address, from_block] + list(event_types)  # type: List[Any]
+        if to_block is not None:
+            conditions.append("e.blockNumber<=?")
+            params.append(to_block)
+        if user_address is None:
+            query = select_events
+        else:
+            query = select_events + """ JOIN user_events u
+                ON u.address=e.address AND u.blockNumber=e.blockNumber
+                AND u.transactionIndex=e.transactionIndex AND u.logIndex=e.logIndex"""
+            conditions = ["u.user=?", "u.address=?", "u.blockNumber>=?"] + conditions
+            params = [user_address.lower(), address, from_block] + params
+        query += " WHERE {} ORDER BY e.blockNumber, e.transactionIndex, e.logIndex".format(" AND ".join(conditions))
+        return [_row_to_event(row) for row in self._conn.execute(query, params)]
+
+
+class EventStoreSync(object):
+    """stores the events of the proxies in an EventStore
+
+    A sync step reads up to max_blocks blocks, so that the backfill is stored in parts.
+    """
+
+    def __init__(self, event_store: EventStore, confirmations: int = 12,
+                 interval: float = 15, max_blocks: int = 100000) -> None:
+        self.event_store = event_store
+        self.confirmations = confirmations
+        self.interval = interval
+        self.max_blocks = max_blocks
+        self._proxies = []  # type: List[Any]
+
+    def add_proxy(self, proxy) -> None:
+        """stores the events of the proxy from now on, its event queries are answered by the store"""
+        proxy.use_event_store(self.event_store)
+        self._proxies.append(proxy)
+
+    def sync_step(self, proxy, to_block: int) -> bool:
+        """stores the events of the next blocks of proxy up to to_block, returns whether there are more"""
+        synced_block = self.event_store.synced_block(proxy.address)
+        from_block = 0 if synced_block is None else synced_block + 1
+        if from_block > to_block:
+            return False
+        last_block = min(to_block, from_block + self.max_blocks - 1)
+        events = []  # type: List[Any]
+        for event_type in proxy.event_types:
+            events.extend(proxy.get_events(event_type, from_block=from_block, to_block=last_block))
+        self.event_store.add_events(proxy.address, events, last_block)
+        logger.debug('Stored {} events of {} from block {} to {}'.format(
+            len(events), proxy.address, from_block, last_block))
+        return last_block < to_block
+
+    def sync(self) -> None:
+        """stores the events of all proxies up to the confirmed head"""
+        for proxy in list(self._proxies):
+            to_block = proxy.current_blocknumber() - self.confirmations
+            while self.sync_step(proxy, to_block):
+                # let the requests of the api run during a backfill
+                gevent.sleep(0)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.sync()
+            except (socket.error, ValueError, sqlite3.Error) as err:
+                logger.warning('Storing new events failed, trying again: {}'.format(err))
+            gevent.sleep(self.interval)
+
+    def start(self) -> None:
+        gevent.spawn(self._run)
@@ -0,0 +1,36 @@
+"""in-process metrics of the relay server
+
+Counters only ever increase, gauges are set to the current value. Both are
+identified by name and served together at the /metrics endpoint.
+"""
+from typing import Callable, Dict, Union  # noqa: F401
+
+Number = Union[int, float]
+
+_counters = {}  # type: Dict[str, Number]
+_gauges = {}  # type: Dict[str, Callable[[], Number]]
+
+
+def increment(name: str, value: Number = 1) -> None:
+    _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: Number) -> None:
+    _gauges[name] = lambda: value
+
+
+def register_gauge(name: str, function: Callable[[], Number]) -> None:
+    """registers a function that is called to get the value of a gauge on every collect"""
+    _gauges[name] = function
+
+
+def collect() -> Dict[str, Number]:
+    result = dict(_counters)
+    for name, function in _gauges.items():
+        result[name] = function()
+    return result
+
+
+def reset() -> None:
+    _counters.clear()
+    _gauges.clear()
@@ -5,16 +5,36 @@ import networkx as nx
 import math
 
 
-def find_path(G, source, target, get_fee, value, max_hops=None, max_fees=None, ignore=None):
+def find_path(G, source, target, get_fee, value, max_hops=None, max_fees=None, ignore=None,
+              bidirectional=False, lower_bound=None):
+    """
+    Searches from source to target, ordered by the number of hops and then by the fees
+
+    The edge costs depend on the value that has to be transfered, which makes the
+    search one-sided. The following options only cut off parts of the graph that can
+    not be on any path from source to target, so they do not change the result:
+
+    bidirectional: first checks with a bidirectional breadth first search whether target
+        is reachable at all within max_hops
+    lower_bound: function returning a lower bound of the hops from a node to target,
+        e.g. from relay.network_graph.landmarks. Nodes that can not reach target within
+        max_hops are not expanded.
+    """
     G_adj = G.adj
 
+    if bidirectional:
+        hops = bidirectional_hop_distance(G_adj, source, target, get_fee, value, max_hops=max_hops, ignore=ignore)
+        if hops is None:
+            raise nx.NetworkXNoPath(
+                "node %s not reachable from %s" % (source, target))
+
     paths = {source: [source]}  # dictionary of paths
 
     push = heappush
     pop = heappop
     dist = {}  # dictionary of final distances
     dist_hop = {}  # dictionary of final distances in terms of hops
-    seen = {source: value}
+    seen = {source: (0, value)}  # best (hops, distance) pushed so far
     c = count()
     fringe = []  # use heapq with (distance,label) tuples
     push(fringe, (0, value, next(c), source))
@@ -40,12 +60,17 @@ def find_path(G, source, target, get_fee, value, max_hops=None, max_fees=None, i
             if max_hops is not None:
                 if n + 1 > max_hops:
                     continue
+            if lower_bound is not None:
+                hops_left = lower_bound(u)
+                if hops_left == math.inf or (max_hops is not None and n + 1 + hops_left > max_hops):
+                    continue
             if u in dist:
                 if (n+1, vu_dist) < (dist_hop[u], dist[u]):
                     raise ValueError('Contradictory paths found:',
                                      'negative weights?')
-            elif u not in seen or vu_dist < seen[u]:
-                seen[u] = vu_dist
+            elif u not in seen or (n+1, vu_dist) < seen[u]:
+                # compare hops first, the path must belong to the entry that is popped first
+                seen[u] = (n+1, vu_dist)
                 push(fringe, (n+1, vu_dist, next(c), u))
                 paths[u] = paths[v] + [u]
     try:
@@ -55,7 +80,69 @@ def find_path(G, source, target, get_fee, value, max_hops=None, max_fees=None, i
             "node %s not reachable from %s" % (source, target))
 
 
-def find_maximum_capacity_path(G, source, target, max_hops=None):
+def bidirectional_hop_distance(G_adj, source, target, get_fee, value, max_hops=None, ignore=None):
+    """
+    Returns the minimal number of hops from source to target over edges that can carry value,
+    or None if there is no such path within max_hops
+
+    Direction and fees are the same as in find_path. As the fees only increase the value
+    that has to be transfered, an edge that can not carry value can not be on any path.
+    Both sides are searched breadth first, expanding the smaller frontier.
+    """
+    if source == target:
+        return 0
+    forward = {source: 0}
+    backward = {target: 0}
+    forward_frontier = [source]
+    backward_frontier = [target]
+    forward_hops = backward_hops = 0
+    while forward_frontier and backward_frontier:
+        if max_hops is not None and forward_hops + backward_hops >= max_hops:
+            return None
+        hops = None
+        next_frontier = []
+        if len(forward_frontier) <= len(backward_frontier):
+            forward_hops += 1
+            for v in forward_frontier:
+                for u, e in G_adj[v].items():
+                    if u in forward or u == ignore or get_fee(v, u, e, value) is None:
+                        continue
+                    if u in backward and (hops is None or forward_hops + backward[u] < hops):
+                        hops = forward_hops + backward[u]
+                    forward[u] = forward_hops
+                    next_frontier.append(u)
+            forward_frontier = next_frontier
+        else:
+            backward_hops += 1
+            for u in backward_frontier:
+                for v, e in G_adj[u].items():
+                    if v in backward or v == ignore or get_fee(v, u, e, value) is None:
+                        continue
+                    if v in forward and (hops is None or backward_hops + forward[v] < hops):
+                        hops = backward_hops + forward[v]
+                    backward[v] = backward_hops
+                    next_frontier.append(v)
+            backward_frontier = next_frontier
+        if hops is not None:
+            if max_hops is not None and hops > max_hops:
+                return None
+            return hops
+    return None
+
+
+def _get_capacity(u, v, data):  # gets the capacity from u to v
+    if (u < v):
+        return data['creditline_ba'] + data['balance_ab']
+    return data['creditline_ab'] - data['balance_ab']
+
+
+def _get_balance(a, b, data):  # gets the balance from the view of a
+    if a < b:
+        return data['balance_ab']
+    return -data['balance_ab']
+
+
+def find_maximum_capacity_path(G, source, target, max_hops=None, get_capacity=_get_capacity):
     """
     The logic is the same as dijkstra's Algorithm
     We visit nodes with the maximum capacity untill we reach the destination.
@@ -72,11 +159,6 @@ def find_maximum_capacity_path(G, source, target, max_hops=None):
     c = count()
     fringe = []  # use heapq with (distance,label) tuples
 
-    def get_capacity(u, v, data):  # gets the capacity from u to v
-        if (u < v):
-            return data['creditline_ba'] + data['balance_ab']
-        return data['creditline_ab'] - data['balance_ab']
-
     capacity[source] = math.inf
     paths[source] = [source]
     push(fringe, (-math.inf, next(c), source, 0))  # (-capacity, counter, node, hops)
@@ -109,12 +191,7 @@ def find_maximum_capacity_path(G, source, target, max_hops=None):
         u = source
 
         for v in paths[target][1:]:
-            if u < v:
-                capacity = get_capacity(u, v, G[u][v])
-            else:
-                capacity = get_capacity(u, v, G[v][u])
-
-            capacities.append(capacity)
+            capacities.append(get_capacity(u, v, G_adj[u][v]))
             u = v
 
         return (seen[target], paths[target], capacities)
@@ -124,7 +201,8 @@ def find_maximum_capacity_path(G, source, target, max_hops=None):
             "node %s not reachable from %s" % (source, target))
 
 
-def find_path_triangulation(G, source, target_reduce, target_increase, get_fee, value, max_hops=None, max_fees=None):
+def find_path_triangulation(G, source, target_reduce, target_increase, get_fee, value, max_hops=None, max_fees=None,
+                            get_balance=_get_balance):
     """
     target_reduce is the node we want to reduce our credit with
     target_increase is the node which will result with an increased debt
@@ -133,22 +211,18 @@ def find_path_triangulation(G, source, target_reduce, target_increase, get_fee,
     to be called in the right order with source as source and target as target, contrary to find_path
     value must be >0
     """
+    G_adj = G.adj
+
     def get_fee_wrapper(b, a, value):
-        # used to get the data from the graph in the right order and query the fees
-        if b < a:
-            output = get_fee(b, a, G[b][a], value)
-        else:
-            output = get_fee(b, a, G[a][b], value)
+        # used to get the data from the graph and query the fees
+        output = get_fee(b, a, G_adj[b][a], value)
         if output is None:
             raise nx.NetworkXNoPath("node %s not reachable from %s" % (a, b))
         return output
 
     def verify_balance_greater_than_value(a, b, value):
         # used to verify that we reduce the amount source owes to target_reduce and do not misuse the function
-        if a < b:
-            return -G[a][b]['balance_ab'] >= value
-        else:
-            return G[b][a]['balance_ab'] >= value
+        return -get_balance(a, b, G_adj[a][b]) >= value
 
     # verification that the funtion is used properly
     if value <= 0:
@@ -157,7 +231,6 @@ def find_path_triangulation(G, source, target_reduce, target_increase, get_fee,
         raise nx.NetworkXNoPath(
             "The balance of target_reduce is lower than value %d" % value)
 
-    G_adj = G.adj
     neighbors = [x[0] for x in G_adj[source].items()]
 
     if target_reduce not in neighbors:
@@ -3,17 +3,18 @@ import io
 
 import networkx as nx
 
+from relay import metrics
+
 from .dijkstra_weighted import find_path, find_path_triangulation, find_maximum_capacity_path
 from .fees import new_balance, imbalance_fee, estimate_fees_from_capacity
+from .landmarks import Landmarks
+from .path_cache import PathCache
+from .storage import (create_storage, creditline_ab, creditline_ba, interest_ab, interest_ba,  # noqa: F401
+                      fees_outstanding_a, fees_outstanding_b, m_time, balance_ab)
+
 
-creditline_ab = 'creditline_ab'
-creditline_ba = 'creditline_ba'
-interest_ab = 'interest_ab'
-interest_ba = 'interest_ba'
-fees_outstanding_a = 'fees_outstanding_a'
-fees_outstanding_b = 'fees_outstanding_b'
-m_time = 'm_time'
-balance_ab = 'balance_ab'
+# the fields found paths depend on, these are kept up to date by the events
+path_fields = (creditline_ab, creditline_ba, balance_ab)
 
 
 class Account(object):
@@ -148,28 +149,127 @@ class AccountSummary(object):
 
 
 class CurrencyNetworkGraph(object):
-    """The whole graph of a Token Network"""
+    """The whole graph of a Token Network
+
+    The trustlines are kept in a storage backend, see relay.network_graph.storage
+
+    find_path can be sped up without changing its results with
+        bidirectional_search: check reachability of the target with a bidirectional search first
+        number_of_landmarks: use hop distances to that many landmarks as lower bound, see
+            relay.network_graph.landmarks
+
+    path_cache holds up to path_cache_size results of path searches, every change of a
+    trustline drops the results that depend on it
 
-    def __init__(self, capacity_imbalance_fee_divisor=0):
+    Functions registered with on_new_user are called with every address that gets its
+    first trustline in the graph
+
+    pin returns a version of the graph that stays the same while the graph changes
+    """
+
+    def __init__(self, capacity_imbalance_fee_divisor=0, storage='networkx', bidirectional_search=False,
+                 number_of_landmarks=0, path_cache_size=0):
         self.capacity_imbalance_fee_divisor = capacity_imbalance_fee_divisor
-        self.graph = nx.Graph()
+        self.storage = storage
+        self.graph = create_storage(storage)
+        self.bidirectional_search = bidirectional_search
+        self.number_of_landmarks = number_of_landmarks
+        self._landmarks = None
+        self.path_cache = PathCache(path_cache_size)
+        self._user_listeners = []
+        self._pinned = None
 
     def gen_network(self, friendsdict):
-        self.graph.clear()
+        """brings the graph in line with friendsdict, the full representation of the network
+
+        Only the trustlines that differ are changed, so the graph stays usable and the cached
+        paths of unchanged trustlines stay valid. Returns the drift, the number of trustlines
+        that had to be added, removed or had wrong creditlines or balance, which is also
+        counted in the graph_sync_drift metric. The other fields are not kept up to date
+        by the events and are updated without counting.
+        """
+        trustlines = {}
         for address, friendships in friendsdict.items():
             for friendship in friendships:
                 assert address < friendship.address
-                self.graph.add_edge(address,
-                                    friendship.address,
-                                    creditline_ab=friendship.creditline_ab,
-                                    creditline_ba=friendship.creditline_ba,
-                                    interest_ab=friendship.interest_ab,
-                                    interest_ba=friendship.interest_ba,
-                                    fees_outstanding_a=friendship.fees_outstanding_a,
-                                    fees_outstanding_b=friendship.fees_outstanding_b,
-                                    m_time=friendship.m_time,
-                                    balance_ab=friendship.balance_ab,
-                                    )
+                trustlines[address, friendship.address] = {
+                    creditline_ab: friendship.creditline_ab,
+                    creditline_ba: friendship.creditline_ba,
+                    interest_ab: friendship.interest_ab,
+                    interest_ba: friendship.interest_ba,
+                    fees_outstanding_a: friendship.fees_outstanding_a,
+                    fees_outstanding_b: friendship.fees_outstanding_b,
+                    m_time: friendship.m_time,
+                    balance_ab: friendship.balance_ab,
+                }
+
+        drift = 0
+        removed = [(a, b) for a, b, _ in self.graph.edges() if (min(a, b), max(a, b)) not in trustlines]
+        for a, b in removed:
+            self.path_cache.invalidate_edge(a, b)
+            self.graph.remove_edge(a, b)
+            drift += 1
+        isolated = [address for address in self.graph.nodes() if not self.graph.neighbors(address)]
+        for address in isolated:
+            self.graph.remove_node(address)
+        if isolated:
+            # node ids can be reused by the storage, so the landmarks have to be recomputed
+            self._landmarks = None
+
+        for (a, b), data in trustlines.items():
+            if self.graph.has_edge(a, b):
+                edge = self.graph.edge(a, b)
+                drifted = any(edge[field] != data[field] for field in path_fields)
+                if drifted:
+                    self.path_cache.invalidate_edge(a, b)
+                edge.update(data)
+            else:
+                self._get_or_create_account(a, b).data.update(data)
+                drifted = True
+            if drifted:
+                drift += 1
+
+        metrics.increment('graph_sync_drift', drift)
+        return drift
+
+    def load_edges(self, addresses, edge_a, edge_b, columns):
+        """replaces all trustlines with the edges in columnar form, see relay.network_graph.storage"""
+        self.graph.load_edges(addresses, edge_a, edge_b, columns)
+        self.path_cache.clear()
+        self._landmarks = None
+        for address in addresses:
+            self._notify_new_user(address)
+
+    def on_new_user(self, function):
+        """calls function(address) for every address that becomes a user of the graph from now on"""
+        self._user_listeners.append(function)
+
+    def _notify_new_user(self, address):
+        for function in self._user_listeners:
+            function(address)
+
+    def pin(self):
+        """returns a version of the graph that does not change with it
+
+        Readers in another thread pin a version for the duration of their query, e.g. the
+        serialization of the replicas of relay.network_graph.path_workers. Readers in greenlets
+        do not pin, they read the graph directly: the path searches and the accessors never
+        yield, so no event handler can change the graph in the middle of them. A reader that
+        yields while reading has to pin.
+
+        With the compact storage pinning is O(1) and the first change of an edge after that
+        only copies the chunk of the edge, see CompactGraphStorage, so readers can pin once
+        per query. The networkx storage copies the whole graph on every pin, with it
+        versions should be pinned rarely. The version searches without landmarks or path cache.
+        """
+        frozen = self.graph.freeze()
+        if self._pinned is None or self._pinned.graph is not frozen:
+            pinned = CurrencyNetworkGraph(self.capacity_imbalance_fee_divisor,
+                                          storage=self.storage,
+                                          bidirectional_search=self.bidirectional_search)
+            pinned.graph = frozen
+            self._pinned = pinned
+        return self._pinned
 
     @property
     def users(self):
@@ -177,83 +277,68 @@ class CurrencyNetworkGraph(object):
 
     @property
     def money_created(self):
-        return sum([abs(edge[2]) for edge in self.graph.edges(data=balance_ab)])
+        return sum([abs(balance) for balance in self.graph.values(balance_ab)])
 
     @property
     def total_creditlines(self):
-        return sum([edge[2] for edge in self.graph.edges(data=creditline_ab)])\
-               + sum([edge[2] for edge in self.graph.edges(data=creditline_ba)])
+        return sum(self.graph.values(creditline_ab)) + sum(self.graph.values(creditline_ba))
 
     def get_friends(self, address):
         if address in self.graph:
-            return self.graph[address].keys()
+            return self.graph.neighbors(address)
         else:
             return []
 
+    def _get_or_create_account(self, a, b):
+        self.path_cache.invalidate_edge(a, b)
+        if not self.graph.has_edge(a, b):
+            new_users = [address for address in (a, b) if address not in self.graph]
+            self.graph.add_edge(a, b)
+            for address in new_users:
+                self._notify_new_user(address)
+            if self._landmarks is not None:
+                self._landmarks.add_edge(self.graph.adj, self.graph.node(a), self.graph.node(b))
+        return Account(self.graph.edge(a, b), a, b)
+
+    def _get_lower_bound(self, target):
+        """returns the landmark lower bound of the hops to target or None if landmarks are not used"""
+        if self.number_of_landmarks <= 0:
+            return None
+        if self._landmarks is None:
+            self._landmarks = Landmarks(self.graph.adj,
+                                        (self.graph.node(address) for address in self.graph.nodes()),
+                                        self.number_of_landmarks)
+        return self._landmarks.lower_bound(target)
+
     def update_creditline(self, creditor, debtor, creditline):
         """to update the creditline, used to react on changes on the blockchain"""
-        if not self.graph.has_edge(creditor, debtor):
-            self.graph.add_edge(creditor,
-                                debtor,
-                                creditline_ab=0,
-                                creditline_ba=0,
-                                interest_ab=0,
-                                interest_ba=0,
-                                fees_outstanding_a=0,
-                                fees_outstanding_b=0,
-                                m_time=0,
-                                balance_ab=0)
-        account = Account(self.graph[creditor][debtor], creditor, debtor)
+        account = self._get_or_create_account(creditor, debtor)
         account.creditline = creditline
 
     def update_trustline(self, creditor, debtor, creditline_given, creditline_received):
         """to update the creditlines, used to react on changes on the blockchain"""
-        if not self.graph.has_edge(creditor, debtor):
-            self.graph.add_edge(creditor,
-                                debtor,
-                                creditline_ab=0,
-                                creditline_ba=0,
-                                interest_ab=0,
-                                interest_ba=0,
-                                fees_outstanding_a=0,
-                                fees_outstanding_b=0,
-                                m_time=0,
-                                balance_ab=0)
-        account = Account(self.graph[creditor][debtor], creditor, debtor)
+        account = self._get_or_create_account(creditor, debtor)
         account.creditline = creditline_given
         account.reverse_creditline = creditline_received
 
     def update_balance(self, a, b, balance):
         """to update the balance, used to react on changes on the blockchain"""
-        if not self.graph.has_edge(a, b):
-            self.graph.add_edge(a,
-                                b,
-                                creditline_ab=0,
-                                creditline_ba=0,
-                                interest_ab=0,
-                                interest_ba=0,
-                                fees_outstanding_a=0,
-                                fees_outstanding_b=0,
-                                m_time=0,
-                                balance_ab=0)
-        account = Account(self.graph[a][b], a, b)
+        account = self._get_or_create_account(a, b)
         account.balance = balance
 
     def get_account_sum(self, a, b=None):
         if b is None:
             account_summary = AccountSummary(0, 0, 0)
             for b in self.get_friends(a):
-                account = Account(self.graph[a][b], a, b)
-                accountr = Account(self.graph[b][a], b, a)
+                account = Account(self.graph.edge(a, b), a, b)
                 account_summary.balance += account.balance
                 account_summary.creditline_given += account.creditline
-                account_summary.creditline_received += accountr.creditline
+                account_summary.creditline_received += account.reverse_creditline
             return account_summary
         else:
             if self.graph.has_edge(a, b):
-                account = Account(self.graph[a][b], a, b)
-                accountr = Account(self.graph[b][a], b, a)
-                return AccountSummary(account.balance, account.creditline, accountr.creditline)
+                account = Account(self.graph.edge(a, b), a, b)
+                return AccountSummary(account.balance, account.creditline, account.reverse_creditline)
             else:
                 return AccountSummary(0, 0, 0)
 
@@ -261,12 +346,13 @@ class CurrencyNetworkGraph(object):
         """draw graph to a file called filename"""
         def mapping(address):
             return address[2:6] if len(address) > 6 else address[2:]
-        for u, v, d in self.graph.edges(data=True):
-            self.graph.node[u]['width'] = 0.6
-            self.graph.node[u]['height'] = 0.4
+        graph = self.graph.to_networkx()
+        for u, v, d in graph.edges(data=True):
+            graph.nodes[u]['width'] = 0.6
+            graph.nodes[u]['height'] = 0.4
             d['color'] = 'blue'
             d['len'] = 1.4
-        g = nx.relabel_nodes(self.graph, mapping)
+        g = nx.relabel_nodes(graph, mapping)
         a = nx.drawing.nx_agraph.to_agraph(g)
         a.graph_attr['label'] = 'Trustlines Network'
         a.layout()
@@ -277,7 +363,7 @@ class CurrencyNetworkGraph(object):
         fieldnames = ['Address A', 'Address B', 'Balance AB', 'Creditline AB', 'Creditline BA']
         writer = csv.DictWriter(output, fieldnames=fieldnames)
         writer.writeheader()
-        for u, v, d in self.graph.edges(data=True):
+        for u, v, d in self.graph.edges():
             account = Account(d, u, v)
             writer.writerow({'Address A': account.a,
                              'Address B': account.b,
@@ -286,23 +372,6 @@ class CurrencyNetworkGraph(object):
                              'Creditline BA': account.reverse_creditline})
         return output.getvalue()
 
-    def _cost_func_fast_reverse(self, b, a, data, value):
-        # this func should be as fast as possible, as it's called often
-        # don't use Account which allocs memory
-        if a < b:
-            pre_balance = data[balance_ab]
-            creditline = data[creditline_ba]
-        else:
-            pre_balance = -data[balance_ab]
-            creditline = data[creditline_ab]
-        post_balance = new_balance(self.capacity_imbalance_fee_divisor, pre_balance, value)
-        assert post_balance <= pre_balance
-        if -post_balance > creditline:
-            return None  # no valid path
-        cost = imbalance_fee(self.capacity_imbalance_fee_divisor, pre_balance, value)
-        assert cost >= 0
-        return cost
-
     def find_path(self, source, target, value=None, max_hops=None, max_fees=None):
         """
         find path between source and target
@@ -314,15 +383,17 @@ class CurrencyNetworkGraph(object):
             value = 1
         try:
             cost, path = find_path(self.graph,
-                                   target, source,
-                                   self._cost_func_fast_reverse,
+                                   self.graph.node(target), self.graph.node(source),
+                                   self.graph.fee_function(self.capacity_imbalance_fee_divisor),
                                    value,
                                    max_hops=max_hops,
-                                   max_fees=max_fees)
+                                   max_fees=max_fees,
+                                   bidirectional=self.bidirectional_search,
+                                   lower_bound=self._get_lower_bound(self.graph.node(source)))
         except (nx.NetworkXNoPath, KeyError):  # key error for if source or target is not in graph
             cost, path = 0, []
             # cost is the total fee, not the actual amount to be transfered
-        return cost, list(reversed(path))
+        return cost, self._addresses(reversed(path))
 
     def find_path_triangulation(self, source, target_reduce, target_increase,
                                 value=None, max_hops=None, max_fees=None):
@@ -336,16 +407,17 @@ class CurrencyNetworkGraph(object):
             value = 1
         try:
             cost, path = find_path_triangulation(self.graph,
-                                                 source,
-                                                 target_reduce,
-                                                 target_increase,
-                                                 self._cost_func_fast_reverse,
+                                                 self.graph.node(source),
+                                                 self.graph.node(target_reduce),
+                                                 self.graph.node(target_increase),
+                                                 self.graph.fee_function(self.capacity_imbalance_fee_divisor),
                                                  value,
                                                  max_hops=max_hops,
-                                                 max_fees=max_fees)
+                                                 max_fees=max_fees,
+                                                 get_balance=self.graph.balance)
         except (nx.NetworkXNoPath, KeyError):  # key error for if source or target is not in graph
             cost, path = 0, []  # cost is the total fee, not the actual amount to be transfered
-        return cost, list(path)
+        return cost, self._addresses(path)
 
     def find_maximum_capacity_path(self, source, target, max_hops=None):
         """
@@ -362,9 +434,10 @@ class CurrencyNetworkGraph(object):
         """
         try:
             min_capacity, path, path_capacities = find_maximum_capacity_path(self.graph,
-                                                                             source,
-                                                                             target,
-                                                                             max_hops=max_hops)
+                                                                             self.graph.node(source),
+                                                                             self.graph.node(target),
+                                                                             max_hops=max_hops,
+                                                                             get_capacity=self.graph.capacity)
         except (nx.NetworkXNoPath, KeyError):  # key error for if source or target is not in graph
             min_capacity, path, path_capacities = 0, [], []
 
@@ -373,7 +446,11 @@ class CurrencyNetworkGraph(object):
         if sendable <= 0:
             return 0, []
 
-        return sendable, list(path)
+        return sendable, self._addresses(path)
+
+    def _addresses(self, path):
+        """translates a path found in the storage adjacency to addresses"""
+        return [self.graph.address(node) for node in path]
 
     def estimate_sendable_from_capacity(self, capacity, path_capacities):
         """
@@ -400,7 +477,8 @@ class CurrencyNetworkGraph(object):
 
     def transfer(self, source, target, value):
         """simulate transfer off chain"""
-        account = Account(self.graph[source][target], source, target)
+        self.path_cache.invalidate_edge(source, target)
+        account = Account(self.graph.edge(source, target), source, target)
         fee = imbalance_fee(self.capacity_imbalance_fee_divisor, account.balance, value)
         account.balance = new_balance(self.capacity_imbalance_fee_divisor, account.balance, value)
         return fee
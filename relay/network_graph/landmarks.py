@@ -0,0 +1,92 @@
+"""Landmark based lower bounds for the path searches (ALT)
+
+For a few landmark nodes the hop distances to all other nodes are precomputed on
+the undirected graph of all trustlines. By the triangle inequality
+|d(L, v) - d(L, t)| is a lower bound for the hops between v and t. As a path can
+only use existing trustlines, this is also a lower bound for the hops of any path
+found by dijkstra_weighted.find_path.
+
+Adding a trustline can shorten distances, which has to be reported with
+`add_edge`. Removing one can only make the stored distances too small, so the
+bound stays valid until the landmarks are recomputed.
+"""
+import math
+from collections import deque
+
+
+def _breadth_first_distances(G_adj, start):
+    distances = {start: 0}
+    queue = deque([start])
+    while queue:
+        v = queue.popleft()
+        hops = distances[v] + 1
+        for u in G_adj[v]:
+            if u not in distances:
+                distances[u] = hops
+                queue.append(u)
+    return distances
+
+
+class Landmarks(object):
+
+    def __init__(self, G_adj, nodes, number_of_landmarks):
+        """chooses landmarks spread over the graph, starting with the node with the most neighbors
+
+        Every further landmark is the node farthest away from the landmarks chosen so far
+        """
+        self.landmarks = []
+        self.distances = []
+        nodes = list(nodes)
+        if not nodes or number_of_landmarks <= 0:
+            return
+        landmark = max(nodes, key=lambda node: len(G_adj[node]))
+        closest = {}
+        while len(self.landmarks) < number_of_landmarks:
+            distances = _breadth_first_distances(G_adj, landmark)
+            self.landmarks.append(landmark)
+            self.distances.append(distances)
+            for node, hops in distances.items():
+                if hops < closest.get(node, math.inf):
+                    closest[node] = hops
+            landmark, hops = max(closest.items(), key=lambda item: item[1])
+            if hops == 0:
+                break  # every reachable node is already a landmark
+
+    def add_edge(self, G_adj, a, b):
+        """updates the distances after an edge between a and b was added"""
+        for distances in self.distances:
+            for start, other in ((a, b), (b, a)):
+                if start not in distances:
+                    continue
+                hops = distances[start] + 1
+                if hops >= distances.get(other, math.inf):
+                    continue
+                distances[other] = hops
+                queue = deque([other])
+                while queue:
+                    v = queue.popleft()
+                    hops = distances[v] + 1
+                    for u in G_adj[v]:
+                        if hops < distances.get(u, math.inf):
+                            distances[u] = hops
+                            queue.append(u)
+
+    def lower_bound(self, target):
+        """returns a function giving a lower bound of the hops from a node to target
+
+        math.inf means that the node is not connected to target
+        """
+        distances_to_target = [(distances, distances.get(target)) for distances in self.distances]
+
+        def hops_to_target(node):
+            bound = 0
+            for distances, target_hops in distances_to_target:
+                hops = distances.get(node)
+                if hops is None and target_hops is None:
+                    continue
+                if hops is None or target_hops is None:
+                    return math.inf
+                bound = max(bound, abs(hops - target_hops))
+            return bound
+
+        return hops_to_target
@@ -0,0 +1,112 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Set, Tuple  # noqa: F401
+
+from relay import metrics
+
+
+def edge_key(a, b):
+    if a < b:
+        return a, b
+    return b, a
+
+
+class PathCache(object):
+    """Bounded LRU cache of path results, invalidated by changes of the edges of the path
+
+    The fees of a path only depend on the edges on that path, so a cached path stays
+    correct as long as none of its edges changes. A cached result without path
+    depends on the whole graph and is dropped on every change.
+
+    Changes are counted by a version. A result computed at some version is only
+    stored if none of its edges changed in the meantime, so results of searches that
+    ran concurrently with an update are not cached.
+    """
+
+    def __init__(self, maxsize: int = 1000) -> None:
+        self.maxsize = maxsize
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # type: OrderedDict
+        self._keys_by_edge = {}  # type: Dict[Tuple[str, str], Set[Hashable]]
+        self._keys_without_path = set()  # type: Set[Hashable]
+        self._edge_versions = {}  # type: Dict[Tuple[str, str], int]
+        self._cleared_version = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations}
+
+    def get(self, key: Hashable) -> Any:
+        """returns the cached result for key or None"""
+        try:
+            result, _ = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            metrics.increment('path_cache_misses')
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        metrics.increment('path_cache_hits')
+        return result
+
+    def put(self, key: Hashable, result: Any, path, version: int) -> None:
+        """caches result for key, which depends on the edges of path and was computed at version"""
+        if self.maxsize <= 0 or version < self._cleared_version:
+            return
+        edges = [edge_key(a, b) for a, b in zip(path, path[1:])]
+        if edges:
+            if any(self._edge_versions.get(edge, 0) > version for edge in edges):
+                return
+        elif version < self.version:
+            return
+        self._remove(key)
+        self._entries[key] = (result, edges)
+        for edge in edges:
+            self._keys_by_edge.setdefault(edge, set()).add(key)
+        if not edges:
+            self._keys_without_path.add(key)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_edge(self, a, b) -> None:
+        """drops all results depending on the edge between a and b"""
+        self.version += 1
+        edge = edge_key(a, b)
+        self._edge_versions[edge] = self.version
+        keys = self._keys_by_edge.pop(edge, set()) | self._keys_without_path
+        self._invalidate(keys)
+
+    def clear(self) -> None:
+        """drops all results, used if the whole graph changed"""
+        self.version += 1
+        self._cleared_version = self.version
+        self._edge_versions.clear()
+        self._invalidate(list(self._entries))
+
+    def _invalidate(self, keys) -> None:
+        for key in keys:
+            if self._remove(key):
+                self.invalidations += 1
+                metrics.increment('path_cache_invalidations')
+
+    def _remove(self, key: Hashable) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        _, edges = entry
+        for edge in edges:
+            keys = self._keys_by_edge.get(edge)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_edge[edge]
+        self._keys_without_path.discard(key)
+        return True
@@ -0,0 +1,232 @@
+"""running path searches in worker processes
+
+The path searches of CurrencyNetworkGraph are pure Python loops. Run in a
+greenlet, a slow search blocks the hub and with it every other request, the
+websocket sends and the event listeners. A PathSearchPool runs the searches in
+worker processes instead while the calling greenlet waits for the result.
+
+Every worker holds replicas of the graphs, loaded from snapshots, see
+relay.network_graph.snapshot. The snapshot of a graph is taken again when the
+graph changed, but at most every replica_interval seconds, and is only sent to a
+worker whose replica is older. It is written from a pinned version of the graph
+in a thread, so the hub keeps running while a big graph is serialized. The
+graphs need the compact storage, with which pinning a version is O(1). The
+results of a search reflect the graph at the version of its replica, which is
+returned with the result.
+
+The searches wait for a free worker in a FairLimiter, so that the workers are
+shared between the requests, and at most until the deadline of the greenlet. A
+worker whose search missed the deadline or whose greenlet was killed is
+terminated and replaced, so that no worker keeps computing a result nobody
+waits for. The replacement is started in a thread, its slot stays taken until it
+is ready. A worker that cannot be started after restart_attempts tries is given
+up and its slot stays taken, once no worker is left searches fail right away.
+"""
+import functools
+import logging
+import multiprocessing
+import time
+from typing import Any, Dict, List, Tuple  # noqa: F401
+
+import gevent
+from gevent.socket import wait_read
+
+from relay import metrics
+from relay.concurrency_utils import FairLimiter, SingleFlight, TimeoutException, current_deadline, deadline_after
+from relay.logger import get_logger
+from . import snapshot
+from .graph import CurrencyNetworkGraph
+
+logger = get_logger('path workers', logging.DEBUG)
+
+search_methods = ('find_path', 'find_path_triangulation', 'find_maximum_capacity_path')
+
+
+def _serve(conn) -> None:
+    """answers the path searches sent over conn until it is closed, runs in the worker process"""
+    replicas = {}  # type: Dict[str, CurrencyNetworkGraph]
+    while True:
+        try:
+            network_address, options, data, method, kwargs = conn.recv()
+        except EOFError:
+            return
+        try:
+            if data is not None:
+                graph = CurrencyNetworkGraph(**options)
+                snapshot.loads(graph, data)
+                replicas[network_address] = graph
+            result = getattr(replicas[network_address], method)(**kwargs)
+        except Exception as err:
+            conn.send((False, err))
+        else:
+            conn.send((True, result))
+
+
+class _Worker(object):
+
+    def __init__(self, context) -> None:
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        # the versions of the replicas of the worker by network address
+        self.versions = {}  # type: Dict[str, int]
+
+    def call(self, request, timeout: float = None) -> Tuple[bool, Any]:
+        # the worker reads the request as soon as it arrives, so sending blocks only briefly
+        self.conn.send(request)
+        wait_read(self.conn.fileno(), timeout=timeout, timeout_exc=TimeoutException('Path search timed out'))
+        return self.conn.recv()
+
+    def terminate(self, timeout: float = 5) -> None:
+        """terminates the process and waits until it exited, this blocks, e.g. run it in a thread"""
+        self.conn.close()
+        self.process.terminate()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+class _Replica(object):
+
+    def __init__(self, version: int, data: bytes, created: float) -> None:
+        self.version = version
+        self.data = data
+        self.created = created
+
+
+class PathSearchPool(object):
+    """runs the path searches of CurrencyNetworkGraphs in `processes` worker processes
+
+    A search waits at most timeout seconds in total, or less if the deadline of the greenlet
+    is earlier, and then raises TimeoutException. It raises TimeoutException right away if
+    no worker could be started.
+    """
+
+    # seconds between the tries to start a worker
+    restart_interval = 1
+
+    def __init__(self, processes: int = 2, replica_interval: float = 5, timeout: float = None,
+                 restart_attempts: int = 3) -> None:
+        self.processes = processes
+        self.replica_interval = replica_interval
+        self.timeout = timeout
+        self.restart_attempts = restart_attempts
+        # the number of workers that could not be started again
+        self.failed_workers = 0
+        self._context = multiprocessing.get_context('spawn')
+        self._limiter = FairLimiter(processes, name='path_workers')
+        self._idle = []  # type: List[_Worker]
+        self._replicas = {}  # type: Dict[str, _Replica]
+        self._replica_flights = SingleFlight('path_workers_replica')
+
+    def start(self) -> None:
+        self._idle = [_Worker(self._context) for _ in range(self.processes)]
+        self._limiter.register_gauges()
+
+    def close(self) -> None:
+        for worker in self._idle:
+            worker.terminate()
+        self._idle = []
+
+    def _replace(self, worker: _Worker) -> None:
+        """replaces the worker with a new one and then gives its slot back
+
+        Terminating and starting processes blocks, so both are done in threads of the hub.
+        If no new worker can be started, the slot is kept taken.
+        """
+        threadpool = gevent.get_hub().threadpool
+        threadpool.apply(worker.terminate)
+        for attempt in range(1, self.restart_attempts + 1):
+            try:
+                new_worker = threadpool.apply(_Worker, (self._context,))
+            except Exception:
+                if attempt < self.restart_attempts:
+                    logger.warning('Starting a path worker failed, trying again', exc_info=True)
+                    gevent.sleep(self.restart_interval)
+                    continue
+                self.failed_workers += 1
+                metrics.increment('path_workers_failures')
+                logger.exception('Giving up starting a path worker after {} tries, {} of {} workers left'.format(
+                    self.restart_attempts, self.processes - self.failed_workers, self.processes))
+                if self.failed_workers >= self.processes:
+                    # wakes the waiting searches, they fail as no worker is left
+                    self._limiter.release()
+                return
+            break
+        metrics.increment('path_workers_restarts')
+        self._idle.append(new_worker)
+        self._limiter.release()
+
+    def search(self, network_address: str, graph: CurrencyNetworkGraph, method: str, **kwargs) -> Tuple[Any, int]:
+        """runs graph.method(**kwargs) in a worker, returns its result and the version of the graph it ran on
+
+        The version is the one of graph.path_cache at which the replica was taken.
+        """
+        if method not in search_methods:
+            raise ValueError('Not a path search: {}'.format(method))
+        if graph.storage != 'compact':
+            raise ValueError('Path workers need the compact graph storage, not {}'.format(graph.storage))
+        if self.failed_workers >= self.processes:
+            raise TimeoutException('No path worker is running')
+        # taking the replica and waiting for a worker count towards the timeout
+        with deadline_after(self.timeout):
+            deadline = current_deadline()
+            replica = self._get_replica(network_address, graph)
+            self._limiter.acquire()
+        if not self._idle:
+            self._limiter.release()
+            raise TimeoutException('No path worker is running')
+        worker = self._idle.pop()
+        start = time.monotonic()
+        answered = False
+        try:
+            if worker.versions.get(network_address) == replica.version:
+                data = None
+            else:
+                data = replica.data
+            request = (network_address, self._graph_options(graph), data, method, kwargs)
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            success, result = worker.call(request, timeout)
+            answered = True
+            worker.versions[network_address] = replica.version
+        finally:
+            metrics.increment('path_workers_searches')
+            metrics.increment('path_workers_seconds', time.monotonic() - start)
+            if answered:
+                self._idle.append(worker)
+                self._limiter.release()
+            else:
+                # timed out or cancelled, the worker may still compute the result
+                logger.debug('Replacing a path worker after an unfinished {} in {}'.format(method, network_address))
+                gevent.spawn(self._replace, worker)
+        if not success:
+            raise result
+        return result, replica.version
+
+    def _get_replica(self, network_address: str, graph: CurrencyNetworkGraph) -> _Replica:
+        """returns the replica of the graph, takes a new one if the graph changed and the replica is old enough"""
+        replica = self._replicas.get(network_address)
+        if replica is None or (replica.version != graph.path_cache.version and
+                               time.monotonic() - replica.created >= self.replica_interval):
+            replica = self._replica_flights.do(network_address,
+                                               functools.partial(self._take_replica, network_address, graph))
+        return replica
+
+    def _take_replica(self, network_address: str, graph: CurrencyNetworkGraph) -> _Replica:
+        version = graph.path_cache.version
+        created = time.monotonic()
+        pinned = graph.pin()
+        # the block number of the snapshot is not used by the workers
+        data = gevent.get_hub().threadpool.apply(snapshot.dumps, (pinned, 0))
+        replica = self._replicas[network_address] = _Replica(version, data, created)
+        metrics.increment('path_workers_replicas')
+        return replica
+
+    @staticmethod
+    def _graph_options(graph: CurrencyNetworkGraph) -> Dict[str, Any]:
+        return {'capacity_imbalance_fee_divisor': graph.capacity_imbalance_fee_divisor,
+                'storage': graph.storage,
+                'bidirectional_search': graph.bidirectional_search,
+                'number_of_landmarks': graph.number_of_landmarks}
@@ -0,0 +1,178 @@
+"""Snapshots of a CurrencyNetworkGraph on disk
+
+A snapshot holds all trustlines of a graph in the columnar form of
+CompactGraphStorage together with the block number up to which the graph
+reflects the events of its currency network. After loading a snapshot, only the
+events since that block have to be replayed.
+
+The file is made of
+- a header: magic, version, block number, number of addresses and of edges
+- the addresses, separated by newlines
+- the two endpoints of every edge as arrays of unsigned 32 bit node ids
+- one column per edge field: the name of the field and either an array of signed
+  64 bit integers or, if a value does not fit into 64 bits, the decimal values
+  separated by spaces
+
+All numbers are little endian. The arrays are loaded with array.frombytes, so
+no value is parsed one by one unless it needs more than 64 bits.
+"""
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, List, Tuple  # noqa: F401
+
+from .storage import fields
+
+magic = b'TLGS'
+version = 1
+
+_header = struct.Struct('<4sHQII')
+_length = struct.Struct('<I')
+
+_int64 = b'q'
+_decimal = b'd'
+
+_min_int64 = -2 ** 63
+_max_int64 = 2 ** 63 - 1
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode: str, data: bytes) -> array:
+    values = array(typecode)
+    if len(data) % values.itemsize:
+        raise SnapshotError('Truncated array')
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _column_bytes(values: List[int]) -> bytes:
+    if all(_min_int64 <= value <= _max_int64 for value in values):
+        return _int64 + _to_bytes(array('q', values))
+    return _decimal + ' '.join(str(value) for value in values).encode('ascii')
+
+
+def _column_values(data: bytes, number_of_edges: int) -> List[int]:
+    kind, data = data[:1], data[1:]
+    if kind == _int64:
+        values = _from_bytes('q', data).tolist()
+    elif kind == _decimal:
+        values = list(map(int, data.split())) if data else []
+    else:
+        raise SnapshotError('Unknown column kind: {}'.format(kind))
+    if len(values) != number_of_edges:
+        raise SnapshotError('Column has {} values for {} edges'.format(len(values), number_of_edges))
+    return values
+
+
+def dumps(graph, blocknumber: int) -> bytes:
+    """returns the snapshot of graph, a CurrencyNetworkGraph, that reflects the events up to blocknumber"""
+    ids = {}  # type: Dict[str, int]
+    addresses = []  # type: List[str]
+    edge_a = array('I')
+    edge_b = array('I')
+    columns = {field: [] for field in fields}  # type: Dict[str, List[int]]
+    for a, b, data in graph.graph.edges():
+        if a > b:
+            a, b = b, a
+        for address, endpoints in ((a, edge_a), (b, edge_b)):
+            if address not in ids:
+                ids[address] = len(addresses)
+                addresses.append(address)
+            endpoints.append(ids[address])
+        for field in fields:
+            columns[field].append(data[field])
+
+    parts = [_header.pack(magic, version, blocknumber, len(addresses), len(edge_a))]
+
+    def add(data):
+        parts.append(_length.pack(len(data)))
+        parts.append(data)
+
+    add('\n'.join(addresses).encode('ascii'))
+    add(_to_bytes(edge_a))
+    add(_to_bytes(edge_b))
+    for field in fields:
+        add(field.encode('ascii'))
+        add(_column_bytes(columns[field]))
+    return b''.join(parts)
+
+
+def loads(graph, data: bytes) -> int:
+    """replaces the trustlines of graph with those of the snapshot and returns its block number
+
+    Raises SnapshotError if data is not a valid snapshot
+    """
+    view = memoryview(data)
+    try:
+        snapshot_magic, snapshot_version, blocknumber, number_of_addresses, number_of_edges = \
+            _header.unpack_from(view)
+    except struct.error:
+        raise SnapshotError('Truncated header')
+    if snapshot_magic != magic:
+        raise SnapshotError('Not a graph snapshot')
+    if snapshot_version != version:
+        raise SnapshotError('Unsupported snapshot version: {}'.format(snapshot_version))
+    offset = _header.size
+    parts = []
+    while offset < len(view):
+        try:
+            length, = _length.unpack_from(view, offset)
+        except struct.error:
+            raise SnapshotError('Truncated snapshot')
+        offset += _length.size
+        if offset + length > len(view):
+            raise SnapshotError('Truncated snapshot')
+        parts.append(bytes(view[offset:offset + length]))
+        offset += length
+    if len(parts) < 3 or len(parts) % 2 == 0:
+        raise SnapshotError('Incomplete snapshot')
+
+    addresses = parts[0].decode('ascii').split('\n') if parts[0] else []
+    edge_a = _from_bytes('I', parts[1])
+    edge_b = _from_bytes('I', parts[2])
+    if len(addresses) != number_of_addresses or len(edge_a) != number_of_edges or len(edge_b) != number_of_edges:
+        raise SnapshotError('Snapshot does not match its header')
+    if number_of_edges and max(max(edge_a), max(edge_b)) >= number_of_addresses:
+        raise SnapshotError('Edge of an unknown address')
+    columns = {}
+    for name, column in zip(parts[3::2], parts[4::2]):
+        field = name.decode('ascii')
+        # fields unknown to this version of the storage are skipped
+        if field in fields:
+            columns[field] = _column_values(column, number_of_edges)
+
+    graph.load_edges(addresses, edge_a, edge_b, columns)
+    return blocknumber
+
+
+def save(graph, blocknumber: int, path: str) -> None:
+    """writes the snapshot of graph to path, the file at path is replaced atomically"""
+    data = dumps(graph, blocknumber)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def load(graph, path: str) -> int:
+    """loads the snapshot at path into graph and returns its block number
+
+    Raises OSError if the file can not be read and SnapshotError if it is not a valid snapshot
+    """
+    with open(path, 'rb') as file:
+        return loads(graph, file.read())
@@ -0,0 +1,545 @@
+"""Storage backends for the trustlines of a CurrencyNetworkGraph
+
+A storage keeps the nodes and the edge data of a currency network. The path
+searches in dijkstra_weighted only need an adjacency (`adj`), so every storage
+exposes one together with the accessors the searches use to read the edge
+data. Nodes in `adj` may be something else than addresses, use `node` and
+`address` to translate between the two.
+
+`freeze` returns a version of a storage that does not change with it, for
+readers that need one consistent state.
+"""
+import copy
+from array import array
+from collections.abc import MutableMapping
+from typing import Dict, List, Optional, Set  # noqa: F401
+
+import networkx as nx
+
+from .fees import new_balance, imbalance_fee
+
+creditline_ab = 'creditline_ab'
+creditline_ba = 'creditline_ba'
+interest_ab = 'interest_ab'
+interest_ba = 'interest_ba'
+fees_outstanding_a = 'fees_outstanding_a'
+fees_outstanding_b = 'fees_outstanding_b'
+m_time = 'm_time'
+balance_ab = 'balance_ab'
+
+fields = (creditline_ab,
+          creditline_ba,
+          interest_ab,
+          interest_ba,
+          fees_outstanding_a,
+          fees_outstanding_b,
+          m_time,
+          balance_ab)
+
+
+def _zero_edge_data():
+    return {field: 0 for field in fields}
+
+
+# the values of a ChunkedList are stored in chunks of chunk_size values
+chunk_shift = 10
+chunk_size = 1 << chunk_shift
+chunk_mask = chunk_size - 1
+
+
+class ChunkedList(object):
+    """A list of values stored in chunks of chunk_size values
+
+    The chunks are lists, or arrays of typecode if one is given. A copy shares all
+    chunks with the list, both copy a chunk before they change it the first time, so
+    copying is O(number of chunks) and the first change of a value after that is
+    O(chunk_size). Item i is in chunks[i >> chunk_shift][i & chunk_mask].
+    """
+
+    __slots__ = ('chunks', '_typecode', '_length', '_own')
+
+    def __init__(self, values=(), typecode=None):
+        self._typecode = typecode
+        values = self._new_chunk(values)
+        self.chunks = [values[start:start + chunk_size] for start in range(0, len(values), chunk_size)]
+        self._length = len(values)
+        # the indices of the chunks that are not shared with a copy
+        self._own = set(range(len(self.chunks)))
+
+    def _new_chunk(self, values=()):
+        if self._typecode is None:
+            return list(values)
+        return array(self._typecode, values)
+
+    def _writable_chunk(self, chunk_index):
+        chunk = self.chunks[chunk_index]
+        if chunk_index not in self._own:
+            chunk = self.chunks[chunk_index] = chunk[:]
+            self._own.add(chunk_index)
+        return chunk
+
+    def __copy__(self):
+        copied = ChunkedList.__new__(ChunkedList)
+        copied._typecode = self._typecode
+        copied.chunks = list(self.chunks)
+        copied._length = self._length
+        copied._own = set()
+        self._own = set()
+        return copied
+
+    def __getitem__(self, index):
+        return self.chunks[index >> chunk_shift][index & chunk_mask]
+
+    def __setitem__(self, index, value):
+        if not 0 <= index < self._length:
+            raise IndexError('ChunkedList index out of range')
+        self._writable_chunk(index >> chunk_shift)[index & chunk_mask] = value
+
+    def append(self, value):
+        if self._length & chunk_mask:
+            chunk = self._writable_chunk(len(self.chunks) - 1)
+        else:
+            chunk = self._new_chunk()
+            self._own.add(len(self.chunks))
+            self.chunks.append(chunk)
+        chunk.append(value)
+        self._length += 1
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield from chunk
+
+
+class NetworkxGraphStorage(object):
+    """Stores every trustline as an attribute dict of a networkx edge"""
+
+    def __init__(self):
+        self.graph = nx.Graph()
+
+    @property
+    def adj(self):
+        return self.graph.adj
+
+    def node(self, address):
+        """returns the node used in `adj` for address, raises KeyError if address is unknown"""
+        if address not in self.graph:
+            raise KeyError(address)
+        return address
+
+    def address(self, node):
+        return node
+
+    def __contains__(self, address):
+        return address in self.graph
+
+    def nodes(self):
+        return self.graph.nodes()
+
+    def neighbors(self, address):
+        return self.graph[address].keys()
+
+    def has_edge(self, a, b):
+        return self.graph.has_edge(a, b)
+
+    def edge(self, a, b):
+        """returns the data of the edge between a and b as a mutable mapping"""
+        return self.graph[a][b]
+
+    def edges(self):
+        """iterates over all edges as (address, address, data)"""
+        return self.graph.edges(data=True)
+
+    def add_edge(self, a, b, **data):
+        """adds an edge between a and b, missing data is set to 0"""
+        edge_data = _zero_edge_data()
+        edge_data.update(data)
+        self.graph.add_edge(a, b, **edge_data)
+
+    def remove_edge(self, a, b):
+        self.graph.remove_edge(a, b)
+
+    def remove_node(self, address):
+        self.graph.remove_node(address)
+
+    def clear(self):
+        self.graph.clear()
+
+    def load_edges(self, addresses, edge_a, edge_b, columns):
+        """replaces all edges, edge i is between addresses[edge_a[i]] and addresses[edge_b[i]]
+
+        The first endpoint has to be the smaller address. columns maps a field to the
+        values of all edges, missing fields are set to 0
+        """
+        self.graph.clear()
+        add_edge = self.graph.add_edge
+        for index, (a, b) in enumerate(zip(edge_a, edge_b)):
+            edge_data = _zero_edge_data()
+            for field, column in columns.items():
+                edge_data[field] = column[index]
+            add_edge(addresses[a], addresses[b], **edge_data)
+
+    def number_of_edges(self):
+        return self.graph.number_of_edges()
+
+    def values(self, field):
+        """iterates over the value of field for all edges"""
+        return (value for _, _, value in self.graph.edges(data=field))
+
+    def fee_function(self, capacity_imbalance_fee_divisor):
+        def get_fee(b, a, data, value):
+            # this func should be as fast as possible, as it's called often
+            # don't use Account which allocs memory
+            if a < b:
+                pre_balance = data[balance_ab]
+                creditline = data[creditline_ba]
+            else:
+                pre_balance = -data[balance_ab]
+                creditline = data[creditline_ab]
+            post_balance = new_balance(capacity_imbalance_fee_divisor, pre_balance, value)
+            assert post_balance <= pre_balance
+            if -post_balance > creditline:
+                return None  # no valid path
+            cost = imbalance_fee(capacity_imbalance_fee_divisor, pre_balance, value)
+            assert cost >= 0
+            return cost
+
+        return get_fee
+
+    @staticmethod
+    def capacity(u, v, data):
+        """capacity to transfer from u to v"""
+        if u < v:
+            return data[creditline_ba] + data[balance_ab]
+        return data[creditline_ab] - data[balance_ab]
+
+    @staticmethod
+    def balance(a, b, data):
+        """balance from the view of a"""
+        if a < b:
+            return data[balance_ab]
+        return -data[balance_ab]
+
+    def to_networkx(self):
+        return self.graph
+
+    def freeze(self):
+        """returns a copy of the storage that does not change with it
+
+        All edges are copied, so this is O(number of edges) on every call.
+        """
+        frozen = NetworkxGraphStorage()
+        frozen.graph = self.graph.copy()
+        return frozen
+
+
+class EdgeView(MutableMapping):
+    """The data of one edge of a CompactGraphStorage, used like the networkx attribute dict"""
+
+    __slots__ = ('_storage', '_index')
+
+    def __init__(self, storage, index):
+        self._storage = storage
+        self._index = index
+
+    def __getitem__(self, field):
+        return self._storage._columns[field][self._index]
+
+    def __setitem__(self, field, value):
+        self._storage._writable_column(field)[self._index] = value
+
+    def __delitem__(self, field):
+        raise TypeError('Fields of an edge can not be deleted')
+
+    def __iter__(self):
+        return iter(fields)
+
+    def __len__(self):
+        return len(fields)
+
+
+class CompactGraphStorage(object):
+    """Stores the trustlines in struct-of-arrays form
+
+    Addresses are interned to integer node ids. The adjacency maps a node id to a
+    dict of neighbor id -> edge index and every edge field is a column indexed by
+    the edge index. The columns are ChunkedLists of plain lists, as the values are
+    arbitrary precision integers. The endpoints of an edge are kept in ChunkedLists
+    of unsigned int arrays, the first endpoint is always the smaller address.
+
+    Slots of removed nodes and edges are reused. The values of a free edge slot are
+    set to 0, so that sums over a column stay correct.
+
+    A frozen version shares all containers with the storage. After a freeze, the
+    storage copies a container before it changes it the first time, so only the
+    changed containers are copied: the adjacency dict of a node, or the list of the
+    adjacency, the addresses, the endpoints or one column of edge values. The columns
+    and endpoints only copy their list of chunks and the chunk that changes, so a
+    balance update after a freeze is O(number of edges / chunk_size). Adding or
+    removing an edge copies the list of the adjacency, which is O(number of nodes).
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._ids = {}  # type: Dict[str, int]
+        self._addresses = []  # type: List[Optional[str]]
+        self._free_ids = []  # type: List[int]
+        self.adj = []  # type: List[Dict[int, int]]
+        self._edge_a = ChunkedList(typecode='I')
+        self._edge_b = ChunkedList(typecode='I')
+        self._free_edges = []  # type: List[int]
+        self._number_of_edges = 0
+        self._columns = {field: ChunkedList() for field in fields}  # type: Dict[str, ChunkedList]
+        # the containers shared with the last frozen version, see freeze
+        self._shared = set()  # type: Set[str]
+        self._shared_columns = set()  # type: Set[str]
+        # the nodes with an adjacency dict of their own, None if no adjacency dict is shared
+        self._own_nodes = None  # type: Optional[Set[int]]
+        self._frozen = None  # type: Optional[CompactGraphStorage]
+
+    def freeze(self):
+        """returns a version of the storage that does not change with it
+
+        The version is shared until the storage changes, freezing it is O(1).
+        """
+        if self._frozen is None:
+            frozen = CompactGraphStorage.__new__(CompactGraphStorage)
+            for name in _shared_containers:
+                setattr(frozen, name, getattr(self, name))
+            frozen._free_ids = list(self._free_ids)
+            frozen._free_edges = list(self._free_edges)
+            frozen._number_of_edges = self._number_of_edges
+            for storage in (self, frozen):
+                storage._shared = set(_shared_containers)
+                storage._shared_columns = set(fields)
+                storage._own_nodes = set()
+                storage._frozen = frozen
+        return self._frozen
+
+    def _writable(self, name):
+        """returns the container name to change it, copies it first if it is shared"""
+        container = getattr(self, name)
+        if name in self._shared:
+            container = copy.copy(container)
+            setattr(self, name, container)
+            self._shared.discard(name)
+        self._frozen = None
+        return container
+
+    def _writable_column(self, field):
+        column = self._writable('_columns')[field]
+        if field in self._shared_columns:
+            column = self._columns[field] = copy.copy(column)
+            self._shared_columns.discard(field)
+        return column
+
+    def _writable_neighbors(self, node):
+        adj = self._writable('adj')
+        if self._own_nodes is not None and node not in self._own_nodes:
+            adj[node] = dict(adj[node])
+            self._own_nodes.add(node)
+        return adj[node]
+
+    def load_edges(self, addresses, edge_a, edge_b, columns):
+        """replaces all edges, edge i is between addresses[edge_a[i]] and addresses[edge_b[i]]
+
+        The first endpoint has to be the smaller address. columns maps a field to the
+        values of all edges, missing fields are set to 0. The values are copied into
+        chunks as a whole, only the adjacency is built edge by edge.
+        """
+        self.clear()
+        number_of_edges = len(edge_a)
+        self._addresses = list(addresses)
+        self._ids = {address: node for node, address in enumerate(self._addresses)}
+        self.adj = adj = [{} for _ in self._addresses]
+        self._edge_a = ChunkedList(edge_a, typecode='I')
+        self._edge_b = ChunkedList(edge_b, typecode='I')
+        for index, (a, b) in enumerate(zip(edge_a, edge_b)):
+            adj[a][b] = index
+            adj[b][a] = index
+        self._number_of_edges = number_of_edges
+        self._columns = {field: ChunkedList(columns[field] if field in columns else [0] * number_of_edges)
+                         for field in fields}
+
+    def node(self, address):
+        """returns the node id of address, raises KeyError if address is unknown"""
+        return self._ids[address]
+
+    def address(self, node):
+        return self._addresses[node]
+
+    def __contains__(self, address):
+        return address in self._ids
+
+    def nodes(self):
+        return self._ids.keys()
+
+    def neighbors(self, address):
+        addresses = self._addresses
+        return [addresses[neighbor] for neighbor in self.adj[self._ids[address]]]
+
+    def has_edge(self, a, b):
+        ids = self._ids
+        return a in ids and b in ids and ids[b] in self.adj[ids[a]]
+
+    def _edge_index(self, a, b):
+        return self.adj[self._ids[a]][self._ids[b]]
+
+    def edge(self, a, b):
+        """returns the data of the edge between a and b as a mutable mapping"""
+        return EdgeView(self, self._edge_index(a, b))
+
+    def edges(self):
+        """iterates over all edges as (address, address, data)
+
+        Same iteration order as networkx, every edge is reported from the node that was seen first
+        """
+        seen = set()
+        addresses = self._addresses
+        for node, neighbors in enumerate(self.adj):
+            if addresses[node] is None:
+                continue
+            for neighbor, index in neighbors.items():
+                if neighbor not in seen:
+                    yield addresses[node], addresses[neighbor], EdgeView(self, index)
+            seen.add(node)
+
+    def _add_node(self, address):
+        if address in self._ids:
+            return self._ids[address]
+        addresses = self._writable('_addresses')
+        adj = self._writable('adj')
+        if self._free_ids:
+            node = self._free_ids.pop()
+            addresses[node] = address
+            adj[node] = {}
+        else:
+            node = len(addresses)
+            addresses.append(address)
+            adj.append({})
+        if self._own_nodes is not None:
+            self._own_nodes.add(node)
+        self._writable('_ids')[address] = node
+        return node
+
+    def add_edge(self, a, b, **data):
+        """adds an edge between a and b or updates its data, missing data is set to 0 for new edges"""
+        if self.has_edge(a, b):
+            edge = self.edge(a, b)
+            for field, value in data.items():
+                edge[field] = value
+            return
+        if a > b:
+            a, b = b, a
+        node_a = self._add_node(a)
+        node_b = self._add_node(b)
+        edge_a = self._writable('_edge_a')
+        edge_b = self._writable('_edge_b')
+        if self._free_edges:
+            index = self._free_edges.pop()
+            edge_a[index] = node_a
+            edge_b[index] = node_b
+            for field in fields:
+                self._writable_column(field)[index] = data.get(field, 0)
+        else:
+            index = len(edge_a)
+            edge_a.append(node_a)
+            edge_b.append(node_b)
+            for field in fields:
+                self._writable_column(field).append(data.get(field, 0))
+        self._writable_neighbors(node_a)[node_b] = index
+        self._writable_neighbors(node_b)[node_a] = index
+        self._number_of_edges += 1
+
+    def remove_edge(self, a, b):
+        node_a = self._ids[a]
+        node_b = self._ids[b]
+        index = self._writable_neighbors(node_a).pop(node_b)
+        del self._writable_neighbors(node_b)[node_a]
+        for field in fields:
+            self._writable_column(field)[index] = 0
+        self._free_edges.append(index)
+        self._number_of_edges -= 1
+
+    def remove_node(self, address):
+        node = self._ids[address]
+        for neighbor in list(self.adj[node]):
+            self.remove_edge(address, self._addresses[neighbor])
+        del self._writable('_ids')[address]
+        self._writable('_addresses')[node] = None
+        self._writable('adj')[node] = {}
+        if self._own_nodes is not None:
+            self._own_nodes.add(node)
+        self._free_ids.append(node)
+
+    def number_of_edges(self):
+        return self._number_of_edges
+
+    def values(self, field):
+        """iterates over the value of field for all edges"""
+        return iter(self._columns[field])
+
+    def fee_function(self, capacity_imbalance_fee_divisor):
+        # the chunks are read directly, the storage does not change during a search
+        edge_a = self._edge_a.chunks
+        balances = self._columns[balance_ab].chunks
+        creditlines_ab = self._columns[creditline_ab].chunks
+        creditlines_ba = self._columns[creditline_ba].chunks
+
+        def get_fee(b, a, index, value):
+            # same as NetworkxGraphStorage.fee_function, but reads the columns
+            chunk, offset = index >> chunk_shift, index & chunk_mask
+            if edge_a[chunk][offset] == a:
+                pre_balance = balances[chunk][offset]
+                creditline = creditlines_ba[chunk][offset]
+            else:
+                pre_balance = -balances[chunk][offset]
+                creditline = creditlines_ab[chunk][offset]
+            post_balance = new_balance(capacity_imbalance_fee_divisor, pre_balance, value)
+            assert post_balance <= pre_balance
+            if -post_balance > creditline:
+                return None  # no valid path
+            cost = imbalance_fee(capacity_imbalance_fee_divisor, pre_balance, value)
+            assert cost >= 0
+            return cost
+
+        return get_fee
+
+    def capacity(self, u, v, index):
+        """capacity to transfer from u to v"""
+        if self._edge_a[index] == u:
+            return self._columns[creditline_ba][index] + self._columns[balance_ab][index]
+        return self._columns[creditline_ab][index] - self._columns[balance_ab][index]
+
+    def balance(self, a, b, index):
+        """balance from the view of a"""
+        if self._edge_a[index] == a:
+            return self._columns[balance_ab][index]
+        return -self._columns[balance_ab][index]
+
+    def to_networkx(self):
+        graph = nx.Graph()
+        graph.add_nodes_from(self._ids)
+        for a, b, data in self.edges():
+            graph.add_edge(a, b, **dict(data))
+        return graph
+
+
+# the containers of a CompactGraphStorage that are shared with its frozen versions
+_shared_containers = ('_ids', '_addresses', 'adj', '_edge_a', '_edge_b', '_columns')
+
+storage_backends = {
+    'networkx': NetworkxGraphStorage,
+    'compact': CompactGraphStorage,
+}
+
+
+def create_storage(backend='networkx'):
+    try:
+        return storage_backends[backend]()
+    except KeyError:
+        raise ValueError('Unknown graph storage backend: {}'.format(backend))
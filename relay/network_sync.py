@@ -0,0 +1,320 @@
+"""keeps a CurrencyNetworkGraph in sync with its currency network
+
+The graph is updated by the events of the filters. NetworkSync remembers the
+checkpoint, the last block of which all events are known to be processed. If a
+filter reconnects, the events it could have missed are replayed from the
+checkpoint. A full sync is only done every sync_interval seconds, or if the
+events since the checkpoint can not be replayed.
+
+The graph can be bootstrapped from the latest graph events of every trustline,
+e.g. read from ethindex in a few queries, instead of the first full sync, which
+then only checks the graph after sync_interval.
+
+With a snapshot_path, the graph is written to a snapshot every snapshot_interval
+seconds together with the checkpoint. On start the snapshot is loaded and only the
+events since its checkpoint are replayed, see relay.network_graph.snapshot.
+
+If the live events come from an event_source like relay.ethindex_tail.EventTail
+instead of the filters of the node, the checkpoint does not advance past the
+delivered_block of the event source.
+"""
+import logging
+import os
+import socket
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple  # noqa: F401
+
+import gevent
+from gevent.event import Event
+
+from relay import metrics
+from relay.blockchain.currency_network_events import (
+    BalanceUpdateEventType,
+    CreditlineUpdateEventType,
+    TrustlineUpdateEventType,
+)
+from relay.blockchain.currency_network_proxy import Trustline
+from relay.blockchain.pagination import event_position
+from relay.blockchain.proxy import reconnect_interval
+from relay.network_graph import snapshot
+from relay.network_graph.graph import Account, creditline_ab, creditline_ba, balance_ab
+from relay.logger import get_logger
+
+logger = get_logger('network sync', logging.DEBUG)
+
+graph_event_types = [BalanceUpdateEventType, CreditlineUpdateEventType, TrustlineUpdateEventType]
+
+
+def apply_event(graph, event) -> None:
+    """applies a graph event, the events only carry absolute values, so they can be applied again"""
+    if event.type == BalanceUpdateEventType:
+        graph.update_balance(event.from_, event.to, event.value)
+    elif event.type == CreditlineUpdateEventType:
+        graph.update_creditline(event.from_, event.to, event.value)
+    elif event.type == TrustlineUpdateEventType:
+        graph.update_trustline(event.from_, event.to, event.given, event.received)
+    else:
+        raise ValueError('Not a graph event: {}'.format(event.type))
+
+
+def graph_representation(events) -> Dict[str, List[Trustline]]:
+    """returns the representation of the graph that results from applying the graph events to an empty graph"""
+    trustlines = {}  # type: Dict[Tuple[str, str], Dict]
+    for event in sorted(events, key=event_position):
+        a, b = event.from_, event.to
+        account = Account(trustlines.setdefault((min(a, b), max(a, b)),
+                                                {creditline_ab: 0, creditline_ba: 0, balance_ab: 0}),
+                          a, b)
+        if event.type == BalanceUpdateEventType:
+            account.balance = event.value
+        elif event.type == CreditlineUpdateEventType:
+            account.creditline = event.value
+        elif event.type == TrustlineUpdateEventType:
+            account.creditline = event.given
+            account.reverse_creditline = event.received
+        else:
+            raise ValueError('Not a graph event: {}'.format(event.type))
+    friendsdict = {}  # type: Dict[str, List[Trustline]]
+    for (a, b), data in sorted(trustlines.items()):
+        if any(data.values()):
+            friendsdict.setdefault(a, []).append(Trustline(b,
+                                                           creditline_ab=data[creditline_ab],
+                                                           creditline_ba=data[creditline_ba],
+                                                           balance_ab=data[balance_ab]))
+    return friendsdict
+
+
+class NetworkSync(object):
+
+    def __init__(self, graph, proxy, sync_interval: float = 300, checkpoint_interval: float = 10,
+                 max_replay_blocks: int = 10000,
+                 bootstrap: Callable[[], Tuple[List[Any], int]] = None,
+                 snapshot_path: str = None, snapshot_interval: float = 600,
+                 event_source=None) -> None:
+        """bootstrap returns the latest graph events of every trustline and the block up to which they are known"""
+        self.graph = graph
+        self.proxy = proxy
+        self.event_source = event_source
+        self._get_bootstrap_events = bootstrap
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._snapshot_blocknumber = None  # type: int
+        self.sync_interval = sync_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.max_replay_blocks = max_replay_blocks
+        self.checkpoint = None  # type: int
+        self._head = None  # type: int
+        self._disconnected_filters = 0
+        self._replaying = False
+        self._replay_requested = False
+        self._holding_events = 0
+        self._held_events = []  # type: List
+        self._full_sync_requested = Event()
+
+    def start(self) -> None:
+        self.proxy.start_listen_on_reconnect(self._on_disconnect, self._on_reconnect)
+        gevent.Greenlet.spawn(self._start_syncing)
+        gevent.Greenlet.spawn(self._checkpoint_loop)
+        if self.snapshot_path is not None:
+            gevent.Greenlet.spawn(self._snapshot_loop)
+
+    def on_event(self, function):
+        """wraps the handler function of live events
+
+        The events are held back during a replay or full sync, as they are newer than the state
+        these are going to write into the graph
+        """
+        def handle(event):
+            if self._holding_events:
+                self._held_events.append((function, event))
+            else:
+                function(event)
+        return handle
+
+    @contextmanager
+    def _hold_events(self):
+        self._holding_events += 1
+        try:
+            yield
+        finally:
+            self._holding_events -= 1
+            if not self._holding_events:
+                held_events, self._held_events = self._held_events, []
+                for function, event in held_events:
+                    function(event)
+
+    def full_sync(self) -> None:
+        with self._hold_events():
+            head = self.proxy.current_blocknumber()
+            drift = self.graph.gen_network(self.proxy.gen_graph_representation())
+        if drift:
+            logger.info('Full sync of {} changed {} trustlines'.format(self.proxy.address, drift))
+        metrics.increment('full_syncs')
+        # the representation was read at or after head, so all events up to head are included
+        self._set_checkpoint(head)
+
+    def bootstrap(self) -> bool:
+        """loads the graph from the bootstrap events and replays the events since, returns whether it succeeded"""
+        try:
+            with self._hold_events():
+                events, blocknumber = self._get_bootstrap_events()
+                self.graph.gen_network(graph_representation(events))
+        except Exception as err:
+            logger.warning('Bootstrap of {} failed, doing a full sync: {}'.format(self.proxy.address, err))
+            return False
+        logger.info('Bootstrapped {} from {} events up to block {}'.format(
+            self.proxy.address, len(events), blocknumber))
+        metrics.increment('bootstraps')
+        self._set_checkpoint(blocknumber)
+        self.replay()
+        return True
+
+    def load_snapshot(self) -> bool:
+        """loads the graph from the snapshot and replays the events since, returns whether it succeeded"""
+        if not os.path.exists(self.snapshot_path):
+            logger.info('No snapshot of {} at {}'.format(self.proxy.address, self.snapshot_path))
+            return False
+        try:
+            with self._hold_events():
+                blocknumber = snapshot.load(self.graph, self.snapshot_path)
+        except (OSError, snapshot.SnapshotError) as err:
+            logger.warning('Loading the snapshot of {} failed: {}'.format(self.proxy.address, err))
+            return False
+        logger.info('Loaded snapshot of {} up to block {}'.format(self.proxy.address, blocknumber))
+        metrics.increment('snapshot_loads')
+        self._snapshot_blocknumber = blocknumber
+        self._set_checkpoint(blocknumber)
+        self.replay()
+        return True
+
+    def save_snapshot(self) -> bool:
+        """writes the graph to the snapshot if the checkpoint advanced since the last one, returns whether it did"""
+        blocknumber = self.checkpoint
+        if blocknumber is None or blocknumber == self._snapshot_blocknumber:
+            return False
+        # the graph can be ahead of the checkpoint, the events since are replayed after loading
+        snapshot.save(self.graph, blocknumber, self.snapshot_path)
+        self._snapshot_blocknumber = blocknumber
+        metrics.increment('snapshot_saves')
+        return True
+
+    def replay(self) -> None:
+        """replays the events since the checkpoint, requests a full sync if that is not possible
+
+        A replay requested while one runs is done after it, as a filter may have missed
+        events after the head the running one replays up to
+        """
+        if self._replaying:
+            self._replay_requested = True
+            return
+        self._replaying = True
+        try:
+            while True:
+                self._replay_requested = False
+                try:
+                    with self._hold_events():
+                        self._replay()
+                except (socket.error, ValueError) as err:
+                    logger.warning('Replay of events of {} failed, requesting full sync: {}'.format(
+                        self.proxy.address, err))
+                    self._full_sync_requested.set()
+                    return
+                if not self._replay_requested:
+                    return
+        finally:
+            self._replaying = False
+
+    def _replay(self) -> None:
+        head = self.proxy.current_blocknumber()
+        if self.checkpoint is None or head - self.checkpoint > self.max_replay_blocks:
+            logger.info('Can not replay events of {}, requesting full sync'.format(self.proxy.address))
+            self._full_sync_requested.set()
+            return
+        events = self.proxy.get_graph_update_events(graph_event_types, self.checkpoint + 1, head)
+        for event in events:
+            apply_event(self.graph, event)
+        logger.info('Replayed {} events of {} from block {} to {}'.format(
+            len(events), self.proxy.address, self.checkpoint + 1, head))
+        metrics.increment('replayed_events', len(events))
+        self._set_checkpoint(head)
+
+    def _set_checkpoint(self, blocknumber: int) -> None:
+        if self.checkpoint is None or blocknumber > self.checkpoint:
+            self.checkpoint = blocknumber
+        # the head seen before is not known to be processed anymore
+        self._head = None
+
+    def _on_disconnect(self) -> None:
+        self._disconnected_filters += 1
+        self._head = None
+
+    def _on_reconnect(self) -> None:
+        self._disconnected_filters -= 1
+        gevent.Greenlet.spawn(self.replay)
+
+    def _advance_checkpoint(self, head: int) -> None:
+        """advances the checkpoint to the head seen one interval ago
+
+        With all filters connected, the events of that block were delivered by now
+        """
+        if self._disconnected_filters > 0 or self._replaying:
+            return
+        if self._head is not None and self.checkpoint is not None:
+            self._set_checkpoint(self._head)
+        self._head = head
+
+    def _checkpoint_loop(self) -> None:
+        while True:
+            gevent.sleep(self.checkpoint_interval)
+            try:
+                head = self._delivered_head()
+            except (socket.error, ValueError) as err:
+                logger.warning('Could not get the current block number: ' + str(err))
+                continue
+            if head is not None:
+                self._advance_checkpoint(head)
+
+    def _delivered_head(self) -> Optional[int]:
+        """the current block number, but not after the block up to which the event source delivered the events"""
+        head = self.proxy.current_blocknumber()
+        if self.event_source is None:
+            return head
+        delivered_block = self.event_source.delivered_block
+        if delivered_block is None:
+            return None
+        return min(head, delivered_block)
+
+    def _snapshot_loop(self) -> None:
+        while True:
+            gevent.sleep(self.snapshot_interval)
+            try:
+                self.save_snapshot()
+            except OSError as err:
+                logger.warning('Saving the snapshot of {} failed: {}'.format(self.proxy.address, err))
+
+    def _start_syncing(self) -> None:
+        if ((self.snapshot_path is not None and self.load_snapshot()) or
+                (self._get_bootstrap_events is not None and self.bootstrap())):
+            # the full sync is only a check of the loaded graph
+            self._full_sync_requested.wait(self.sync_interval)
+            self._full_sync_requested.clear()
+        self._full_sync_loop()
+
+    def _full_sync_loop(self) -> None:
+        while True:
+            try:
+                self.full_sync()
+            except socket.timeout as err:
+                logger.warning('Full sync failed because of timeout, try again: ' + str(err))
+                gevent.sleep(reconnect_interval)
+                continue
+            except socket.error as err:
+                logger.warning('Full sync failed because of error, try again: ' + str(err))
+                gevent.sleep(reconnect_interval)
+                continue
+            except ValueError as err:
+                logger.warning('Full sync failed because of an error of the node, try again: ' + str(err))
+                gevent.sleep(reconnect_interval)
+                continue
+            self._full_sync_requested.wait(self.sync_interval)
+            self._full_sync_requested.clear()
@@ -6,7 +6,7 @@ import functools
 import itertools
 from collections import defaultdict
 from copy import deepcopy
-from typing import Dict, Iterable, List, Union  # noqa: F401
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union  # noqa: F401
 
 import gevent
 from eth_utils import is_checksum_address, to_checksum_address
@@ -19,6 +19,11 @@ from relay.pushservice.client import PushNotificationClient
 from relay.pushservice.pushservice import FirebaseRawPushService, InvalidClientTokenException
 from relay.pushservice.client_token_db import ClientTokenDB, ClientTokenAlreadyExistsException
 from relay import ethindex_db
+from relay import ethindex_schema
+from relay.connection_pool import ConnectionPool
+from relay.ethindex_sync_head import get_sync_head
+from relay.ethindex_tail import EventTail
+from relay.event_store import EventStore, EventStoreSync
 from .blockchain.exchange_proxy import ExchangeProxy
 from .blockchain.currency_network_proxy import CurrencyNetworkProxy
 from .blockchain import currency_network_events
@@ -26,10 +31,17 @@ from .blockchain import token_events
 from .blockchain import unw_eth_events
 from .blockchain import exchange_events
 from .blockchain.node import Node
+from .blockchain.block_cache import get_block_timestamp_cache
+from .blockchain.event_cache import get_event_cache
+from .blockchain.head_tracker import get_head_tracker
 from .blockchain.token_proxy import TokenProxy
 from .blockchain.unw_eth_proxy import UnwEthProxy
 from .blockchain.events import BlockchainEvent
+from .blockchain.pagination import Position, page_events
 from .network_graph.graph import CurrencyNetworkGraph
+from .network_graph.path_workers import PathSearchPool
+from .network_sync import NetworkSync
+from .user_networks import UserNetworks
 from .exchange.orderbook import OrderBookGreenlet
 from .logger import get_logger
 from .streams import Subject, MessagingSubject
@@ -48,6 +60,10 @@ class TrustlinesRelay:
     def __init__(self):
         self.currency_network_proxies = {}  # type: Dict[str, CurrencyNetworkProxy]
         self.currency_network_graphs = {}  # type: Dict[str, CurrencyNetworkGraph]
+        self.network_syncs = {}  # type: Dict[str, NetworkSync]
+        self.user_networks = UserNetworks()
+        # the block since which the live updates of a network are followed by its address
+        self._listening_since = {}  # type: Dict[str, int]
         self.subjects = defaultdict(Subject)
         self.messaging = defaultdict(MessagingSubject)
         self.config = {}
@@ -59,6 +75,10 @@ class TrustlinesRelay:
         self.token_proxies = {}  # type: Dict[str, TokenProxy]
         self._firebase_raw_push_service = None
         self._client_token_db = None  # type: ClientTokenDB
+        self._ethindex_pool = None  # type: ConnectionPool
+        self._event_tail = None  # type: EventTail
+        self._event_store_sync = None  # type: EventStoreSync
+        self._path_search_pool = None  # type: PathSearchPool
 
     @property
     def networks(self) -> Iterable[str]:
@@ -84,16 +104,32 @@ class TrustlinesRelay:
     def event_query_timeout(self) -> int:
         return self.config.get('eventQueryTimeout', 20)
 
+    @property
+    def graph_storage(self) -> str:
+        return self.config.get('graphStorage', 'networkx')
+
+    @property
+    def path_cache_size(self) -> int:
+        return self.config.get('pathCacheSize', 1000)
+
     @property
     def use_eth_index(self) -> bool:
         return os.environ.get("ETHINDEX", "") == "1"
 
+    @property
+    def ethindex_pool(self) -> ConnectionPool:
+        if self._ethindex_pool is None:
+            self._ethindex_pool = ethindex_db.create_pool("",
+                                                          size=self.config.get('ethindexPoolSize', 10),
+                                                          timeout=self.config.get('ethindexPoolTimeout', 10))
+        return self._ethindex_pool
+
     def get_event_selector_for_currency_network(self, network_address):
         """return either a CurrencyNetworkProxy or a EthindexDB instance
         This is being used from relay.api to query for events.
         """
         if self.use_eth_index:
-            return ethindex_db.EthindexDB(ethindex_db.connect(""),
+            return ethindex_db.EthindexDB(self.ethindex_pool,
                                           address=network_address,
                                           standard_event_types=currency_network_events.standard_event_types,
                                           event_builders=currency_network_events.event_builders,
@@ -106,7 +142,7 @@ class TrustlinesRelay:
         This is being used from relay.api to query for events.
         """
         if self.use_eth_index:
-            return ethindex_db.EthindexDB(ethindex_db.connect(""),
+            return ethindex_db.EthindexDB(self.ethindex_pool,
                                           address=address,
                                           standard_event_types=token_events.standard_event_types,
                                           event_builders=token_events.event_builders,
@@ -119,7 +155,7 @@ class TrustlinesRelay:
         This is being used from relay.api to query for events.
         """
         if self.use_eth_index:
-            return ethindex_db.EthindexDB(ethindex_db.connect(""),
+            return ethindex_db.EthindexDB(self.ethindex_pool,
                                           address=address,
                                           standard_event_types=unw_eth_events.standard_event_types,
                                           event_builders=unw_eth_events.event_builders,
@@ -132,7 +168,7 @@ class TrustlinesRelay:
         This is being used from relay.api to query for events.
         """
         if self.use_eth_index:
-            return ethindex_db.EthindexDB(ethindex_db.connect(""),
+            return ethindex_db.EthindexDB(self.ethindex_pool,
                                           address=address,
                                           standard_event_types=exchange_events.standard_event_types,
                                           event_builders=exchange_events.event_builders,
@@ -159,29 +195,90 @@ class TrustlinesRelay:
                 ssl=self.config['rpc']['ssl']
             )
         )
+        get_block_timestamp_cache(self._web3).maxsize = self.config.get('blockCacheSize', 10000)
+        get_event_cache(self._web3).maxsize = self.config.get('eventCacheSize', 100000)
+        concurrency_utils.query_limiter.size = self.config.get('maxConcurrentQueries', 20)
+        concurrency_utils.query_limiter.register_gauges()
+        get_head_tracker(self._web3).start()
+        path_search_config = self.config.get('pathSearch', {})
+        if path_search_config.get('processes', 0) > 0:
+            if self.graph_storage != 'compact':
+                raise ValueError('pathSearch.processes needs the compact graphStorage')
+            logger.info('Searching paths in {} processes'.format(path_search_config['processes']))
+            self._path_search_pool = PathSearchPool(processes=path_search_config['processes'],
+                                                    replica_interval=path_search_config.get('replicaInterval', 5),
+                                                    timeout=path_search_config.get('timeout', 10))
+            self._path_search_pool.start()
         self.node = Node(self._web3)
+        if self.use_eth_index:
+            sync_head = get_sync_head(self.ethindex_pool)
+            sync_head.start(functools.partial(ethindex_db.connect, ""))
+            gevent.spawn(self._check_ethindex_schema)
+            if self.config.get('liveEventSource', 'node') == 'ethindex':
+                logger.info('Receiving live events from ethindex')
+                self._event_tail = EventTail(self.ethindex_pool, sync_head)
+                self._event_tail.start()
+            self.user_networks.history = self._get_user_networks_from_ethindex
+        elif self.config.get('eventStore') is not None:
+            logger.info('Storing events in {}'.format(self.config['eventStore']))
+            self._event_store_sync = EventStoreSync(EventStore(self.config['eventStore']),
+                                                    confirmations=self.config.get('eventStoreConfirmations', 12))
+            self._event_store_sync.start()
+            self.user_networks.history = self._get_user_networks_from_event_store
         self._start_listen_on_new_addresses()
 
+    def _check_ethindex_schema(self):
+        if self.config.get('ethindexCreateIndexes', False):
+            conn = ethindex_db.connect("")
+            # indexes are created concurrently, which is not possible within a transaction
+            conn.autocommit = True
+            try:
+                created = ethindex_schema.migrate(conn)
+            finally:
+                conn.close()
+            logger.info('Created ethindex indexes: {}'.format(created))
+        with self.ethindex_pool.connection() as conn:
+            ethindex_schema.check_query_plans(conn)
+
     def new_network(self, address: str) -> None:
         assert is_checksum_address(address)
         if address in self.networks:
             return
         logger.info('New network: {}'.format(address))
-        self.currency_network_graphs[address] = CurrencyNetworkGraph(100)
-        self.currency_network_proxies[address] = CurrencyNetworkProxy(self._web3,
-                                                                      self.contracts['CurrencyNetwork']['abi'],
-                                                                      address)
+        path_search_config = self.config.get('pathSearch', {})
+        self.currency_network_graphs[address] = CurrencyNetworkGraph(
+            100,
+            storage=self.graph_storage,
+            bidirectional_search=path_search_config.get('bidirectional', False),
+            number_of_landmarks=path_search_config.get('landmarks', 0),
+            path_cache_size=self.path_cache_size)
+        self.currency_network_graphs[address].on_new_user(functools.partial(self.user_networks.add, address))
+        self.currency_network_proxies[address] = CurrencyNetworkProxy(
+            self._web3,
+            self.contracts['CurrencyNetwork']['abi'],
+            address,
+            sync_batch_size=self.config.get('syncBatchSize', 200),
+            sync_concurrency=self.config.get('syncConcurrency', 4))
+        if self._event_tail is not None:
+            self.currency_network_proxies[address].listen_on_event_source(self._event_tail)
+        if self._event_store_sync is not None:
+            self._event_store_sync.add_proxy(self.currency_network_proxies[address])
         self._start_listen_network(address)
 
     def new_exchange(self, address: str) -> None:
         assert is_checksum_address(address)
         if address not in self.exchange_addresses:
             logger.info('New Exchange contract: {}'.format(address))
-            self.orderbook.add_exchange(ExchangeProxy(self._web3,
-                                                      self.contracts['Exchange']['abi'],
-                                                      self.contracts['Token']['abi'],
-                                                      address,
-                                                      self))
+            exchange_proxy = ExchangeProxy(self._web3,
+                                           self.contracts['Exchange']['abi'],
+                                           self.contracts['Token']['abi'],
+                                           address,
+                                           self)
+            if self._event_tail is not None:
+                exchange_proxy.listen_on_event_source(self._event_tail)
+            if self._event_store_sync is not None:
+                self._event_store_sync.add_proxy(exchange_proxy)
+            self.orderbook.add_exchange(exchange_proxy)
 
     def new_unw_eth(self, address: str) -> None:
         assert is_checksum_address(address)
@@ -190,6 +287,8 @@ class TrustlinesRelay:
             self.unw_eth_proxies[address] = UnwEthProxy(self._web3,
                                                         self.contracts['UnwEth']['abi'],
                                                         address)
+            if self._event_store_sync is not None:
+                self._event_store_sync.add_proxy(self.unw_eth_proxies[address])
 
     def new_token(self, address: str) -> None:
         assert is_checksum_address(address)
@@ -198,14 +297,59 @@ class TrustlinesRelay:
             self.token_proxies[address] = TokenProxy(self._web3,
                                                      self.contracts['Token']['abi'],
                                                      address)
+            if self._event_store_sync is not None:
+                self._event_store_sync.add_proxy(self.token_proxies[address])
 
     def get_networks_of_user(self, user_address: str) -> List[str]:
         assert is_checksum_address(user_address)
-        networks_of_user = []  # type: List[str]
-        for network_address in self.networks:
-            if user_address in self.currency_network_graphs[network_address].users:
-                networks_of_user.append(network_address)
-        return networks_of_user
+        # every user of a graph is in the index, only the graphs of the networks of the user are looked at
+        known_networks = self.user_networks.known_networks(user_address)
+        return [network_address for network_address in self.networks
+                if network_address in known_networks and
+                user_address in self.currency_network_graphs[network_address].users]
+
+    def _get_networks_with_events_of_user(self, user_address: str) -> List[str]:
+        """returns the currency networks that can hold events of the user
+
+        These are the networks the user has events in, see relay.user_networks, and the networks
+        that are not synced yet, as their users are not known and the updates of their graphs are
+        held back until then.
+        """
+        networks = self.user_networks.networks_with_events(user_address, self.networks)
+        networks.update(address for address, sync in self.network_syncs.items() if sync.checkpoint is None)
+        return sorted(networks)
+
+    def _get_user_networks_from_ethindex(self, user_address: str, network_addresses: List[str]):
+        """the history function of user_networks with ethindex"""
+        ethindex = ethindex_db.EthindexDB(self.ethindex_pool, from_to_types=currency_network_events.from_to_types)
+        with_events, blocknumber = ethindex.get_contracts_with_user_events(user_address, network_addresses)
+        incomplete = [address for address in network_addresses
+                      if address not in self._listening_since or blocknumber < self._listening_since[address]]
+        return with_events, incomplete
+
+    def _get_user_networks_from_event_store(self, user_address: str, network_addresses: List[str]):
+        """the history function of user_networks with the event store"""
+        event_store = self._event_store_sync.event_store
+        with_events = set(event_store.get_addresses_of_user(user_address)) & set(network_addresses)
+        incomplete = []
+        for address in network_addresses:
+            synced_block = event_store.synced_block(address)
+            if synced_block is None or address not in self._listening_since or \
+                    synced_block < self._listening_since[address]:
+                incomplete.append(address)
+        return with_events, incomplete
+
+    def search_path(self, network_address: str, method: str, **kwargs) -> Tuple[Any, int]:
+        """runs the path search method of the graph of the network, in a worker process if configured
+
+        Returns the result and the version of graph.path_cache the result was found at. Raises
+        TimeoutException if the search in a worker process did not finish in time.
+        """
+        graph = self.currency_network_graphs[network_address]
+        if self._path_search_pool is not None:
+            return self._path_search_pool.search(network_address, graph, method, **kwargs)
+        version = graph.path_cache.version
+        return getattr(graph, method)(**kwargs), version
 
     def add_push_client_token(self, user_address: str, client_token: str) -> None:
         if self._firebase_raw_push_service is not None:
@@ -244,101 +388,191 @@ class TrustlinesRelay:
         if not success:
             raise TokenNotFoundException
 
+    def _get_events_page(self,
+                         query: Callable[..., Iterable[BlockchainEvent]],
+                         from_block: int = 0,
+                         after: Position = None,
+                         limit: int = None) -> Iterable[BlockchainEvent]:
+        """runs query for the page of up to limit events after the position after
+
+        The ethindex database selects the page itself, without a limit its events are
+        read while they are consumed, see EthindexDB._query_events. The events of the
+        node can only be paged after they were requested, but they are requested from
+        the block of the position on.
+        """
+        if after is not None:
+            from_block = max(from_block, after[0])
+        if self.use_eth_index:
+            return query(from_block=from_block, after=after, limit=limit)
+        events = query(from_block=from_block)
+        if after is None and limit is None:
+            return events
+        return page_events(events, after=after, limit=limit)
+
     def get_user_network_events(self,
                                 network_address: str,
                                 user_address: str,
                                 type: str = None,
-                                from_block: int = 0
-                                ) -> List[BlockchainEvent]:
+                                from_block: int = 0,
+                                after: Position = None,
+                                limit: int = None
+                                ) -> Iterable[BlockchainEvent]:
         proxy = self.get_event_selector_for_currency_network(network_address)
         if type is not None:
-            events = proxy.get_network_events(type, user_address,
-                                              from_block=from_block,
-                                              timeout=self.event_query_timeout)
+            query = functools.partial(proxy.get_network_events, type, user_address,
+                                      timeout=self.event_query_timeout)
         else:
-            events = proxy.get_all_network_events(user_address,
-                                                  from_block=from_block,
-                                                  timeout=self.event_query_timeout)
-        return events
+            query = functools.partial(proxy.get_all_network_events, user_address,
+                                      timeout=self.event_query_timeout)
+        return self._get_events_page(query, from_block=from_block, after=after, limit=limit)
 
     def get_network_events(self,
                            network_address: str,
                            type: str = None,
-                           from_block: int = 0) -> List[BlockchainEvent]:
+                           from_block: int = 0,
+                           after: Position = None,
+                           limit: int = None) -> Iterable[BlockchainEvent]:
         proxy = self.get_event_selector_for_currency_network(network_address)
         if type is not None:
-            events = proxy.get_events(type, from_block=from_block, timeout=self.event_query_timeout)
+            query = functools.partial(proxy.get_events, type, timeout=self.event_query_timeout)
         else:
-            events = proxy.get_all_events(from_block=from_block, timeout=self.event_query_timeout)
-        return events
+            query = functools.partial(proxy.get_all_events, timeout=self.event_query_timeout)
+        return self._get_events_page(query, from_block=from_block, after=after, limit=limit)
 
     def get_user_events(self,
                         user_address: str,
                         type: str=None,
                         from_block: int=0,
-                        timeout: float=None) -> List[BlockchainEvent]:
+                        timeout: float=None,
+                        after: Position = None,
+                        limit: int = None) -> Iterable[BlockchainEvent]:
+        events, timed_out = self.get_user_events_partial(user_address, type, from_block, timeout, after, limit)
+        if timed_out:
+            raise concurrency_utils.TimeoutException('Could not get the events of {} in time'.format(timed_out))
+        return events
+
+    def get_user_events_partial(self,
+                                user_address: str,
+                                type: str = None,
+                                from_block: int = 0,
+                                timeout: float = None,
+                                after: Position = None,
+                                limit: int = None) -> Tuple[Iterable[BlockchainEvent], List[str]]:
+        """returns the events of the user of all contracts that answered within timeout and the addresses
+        of the contracts that did not
+
+        The events of ethindex are read with a single query, so they are never partial.
+        """
         assert is_checksum_address(user_address)
-        network_event_queries = self._get_network_event_queries(user_address, type, from_block)
-        unw_eth_event_queries = self._get_unw_eth_event_queries(user_address, type, from_block)
-        exchange_event_queries = self._get_exchange_event_queries(user_address, type, from_block)
-        results = concurrency_utils.joinall(network_event_queries +
-                                            unw_eth_event_queries +
-                                            exchange_event_queries, timeout=timeout)
-        return sorted_events(list(itertools.chain.from_iterable(results)))
+        if after is not None:
+            from_block = max(from_block, after[0])
+        if self.use_eth_index:
+            return self._get_user_events_from_ethindex(user_address, type, from_block, timeout, after, limit), []
+        queries = {}
+        queries.update(self._get_network_event_queries(user_address, type, from_block))
+        queries.update(self._get_unw_eth_event_queries(user_address, type, from_block))
+        queries.update(self._get_exchange_event_queries(user_address, type, from_block))
+        results, timed_out = concurrency_utils.joinall_partial(queries, timeout=timeout)
+        if timed_out:
+            logger.warning('Events of {} timed out for {}'.format(user_address, timed_out))
+        events = list(itertools.chain.from_iterable(results.values()))
+        if after is None and limit is None:
+            return sorted_events(events), timed_out
+        return page_events(events, after=after, limit=limit), timed_out
+
+    def _get_user_events_from_ethindex(self,
+                                       user_address: str,
+                                       type: str = None,
+                                       from_block: int = 0,
+                                       timeout: float = None,
+                                       after: Position = None,
+                                       limit: int = None) -> Iterable[BlockchainEvent]:
+        """queries the events of the user of all contracts with a single round trip to the database"""
+        def select(addresses, events_module, event_types):
+            """selects the event type if it is one of event_types, else the standard event types"""
+            if type is not None and type in event_types:
+                selected_event_types = [type]
+            else:
+                selected_event_types = events_module.standard_event_types
+            return ethindex_db.ContractEvents(addresses=list(addresses),
+                                              event_types=selected_event_types,
+                                              event_builders=events_module.event_builders,
+                                              from_to_types=events_module.from_to_types)
+
+        contract_events = [
+            select(self._get_networks_with_events_of_user(user_address),
+                   currency_network_events,
+                   currency_network_events.event_builders),
+            select(self.unw_eth_addresses, unw_eth_events, unw_eth_events.event_builders),
+            select(self.exchange_addresses, exchange_events, exchange_events.standard_event_types),
+        ]
+        ethindex = ethindex_db.EthindexDB(self.ethindex_pool)
+        [events] = concurrency_utils.joinall([functools.partial(ethindex.get_contracts_user_events,
+                                                                user_address,
+                                                                contract_events,
+                                                                from_block=from_block,
+                                                                after=after,
+                                                                limit=limit)], timeout=timeout)
+        return events
 
     def _get_network_event_queries(self, user_address: str, type: str = None, from_block: int = 0):
+        """returns the queries of the events of the user by the addresses of the currency networks"""
         assert is_checksum_address(user_address)
-        queries = []
-        for network_address in self.networks:
+        queries = {}  # type: Dict[str, Callable[[], List[BlockchainEvent]]]
+        for network_address in self._get_networks_with_events_of_user(user_address):
             currency_network_proxy = self.get_event_selector_for_currency_network(network_address)
             if type is not None and type in currency_network_proxy.event_types:
-                queries.append(functools.partial(currency_network_proxy.get_network_events,
-                                                 type,
-                                                 user_address=user_address,
-                                                 from_block=from_block))
+                queries[network_address] = functools.partial(currency_network_proxy.get_network_events,
+                                                             type,
+                                                             user_address=user_address,
+                                                             from_block=from_block)
             else:
-                queries.append(functools.partial(currency_network_proxy.get_all_network_events,
-                                                 user_address=user_address,
-                                                 from_block=from_block))
+                queries[network_address] = functools.partial(currency_network_proxy.get_all_network_events,
+                                                             user_address=user_address,
+                                                             from_block=from_block)
         return queries
 
     def _get_unw_eth_event_queries(self, user_address: str, type: str = None, from_block: int = 0):
+        """returns the queries of the events of the user by the addresses of the unwrap eth contracts"""
         assert is_checksum_address(user_address)
-        queries = []
+        queries = {}  # type: Dict[str, Callable[[], List[BlockchainEvent]]]
         for unw_eth_address in self.unw_eth_addresses:
             unw_eth_proxy = self.get_event_selector_for_unw_eth(unw_eth_address)
             if type is not None and type in unw_eth_proxy.event_types:
-                queries.append(functools.partial(unw_eth_proxy.get_unw_eth_events,
-                                                 type,
-                                                 user_address=user_address,
-                                                 from_block=from_block))
+                queries[unw_eth_address] = functools.partial(unw_eth_proxy.get_unw_eth_events,
+                                                             type,
+                                                             user_address=user_address,
+                                                             from_block=from_block)
             else:
-                queries.append(functools.partial(unw_eth_proxy.get_all_unw_eth_events,
-                                                 user_address=user_address,
-                                                 from_block=from_block))
+                queries[unw_eth_address] = functools.partial(unw_eth_proxy.get_all_unw_eth_events,
+                                                             user_address=user_address,
+                                                             from_block=from_block)
         return queries
 
     def _get_exchange_event_queries(self, user_address: str, type: str = None, from_block: int = 0):
+        """returns the queries of the events of the user by the addresses of the exchanges"""
         assert is_checksum_address(user_address)
-        queries = []
+        queries = {}  # type: Dict[str, Callable[[], List[BlockchainEvent]]]
         for exchange_address in self.exchange_addresses:
             exchange_proxy = self.get_event_selector_for_exchange(exchange_address)
             if type is not None and type in exchange_proxy.standard_event_types:
-                queries.append(functools.partial(exchange_proxy.get_exchange_events,
-                                                 type,
-                                                 user_address=user_address,
-                                                 from_block=from_block))
+                queries[exchange_address] = functools.partial(exchange_proxy.get_exchange_events,
+                                                              type,
+                                                              user_address=user_address,
+                                                              from_block=from_block)
             else:
-                queries.append(functools.partial(exchange_proxy.get_all_exchange_events,
-                                                 user_address=user_address,
-                                                 from_block=from_block))
+                queries[exchange_address] = functools.partial(exchange_proxy.get_all_exchange_events,
+                                                              user_address=user_address,
+                                                              from_block=from_block)
         return queries
 
     def get_user_token_events(self,
                               token_address: str,
                               user_address: str,
                               type: str = None,
-                              from_block: int = 0) -> List[BlockchainEvent]:
+                              from_block: int = 0,
+                              after: Position = None,
+                              limit: int = None) -> Iterable[BlockchainEvent]:
         if token_address in self.unw_eth_addresses:
             proxy = self.get_event_selector_for_unw_eth(token_address)  # type: Union[UnwEthProxy, TokenProxy]
             func_names = ['get_unw_eth_events', 'get_all_unw_eth_events']
@@ -347,16 +581,18 @@ class TrustlinesRelay:
             func_names = ['get_token_events', 'get_all_token_events']
 
         if type is not None:
-            events = getattr(proxy, func_names[0])(type, user_address, from_block=from_block)
+            query = functools.partial(getattr(proxy, func_names[0]), type, user_address)
         else:
-            events = getattr(proxy, func_names[1])(user_address, from_block=from_block)
+            query = functools.partial(getattr(proxy, func_names[1]), user_address)
 
-        return events
+        return self._get_events_page(query, from_block=from_block, after=after, limit=limit)
 
     def get_token_events(self,
                          token_address: str,
                          type: str = None,
-                         from_block: int = 0) -> List[BlockchainEvent]:
+                         from_block: int = 0,
+                         after: Position = None,
+                         limit: int = None) -> Iterable[BlockchainEvent]:
 
         if token_address in self.unw_eth_addresses:
             proxy = self.get_event_selector_for_unw_eth(
@@ -365,39 +601,40 @@ class TrustlinesRelay:
             proxy = self.get_event_selector_for_token(token_address)
 
         if type is not None:
-            events = proxy.get_events(type, from_block=from_block)
+            query = functools.partial(proxy.get_events, type)
         else:
-            events = proxy.get_all_events(from_block=from_block)
+            query = proxy.get_all_events
 
-        return events
+        return self._get_events_page(query, from_block=from_block, after=after, limit=limit)
 
     def get_exchange_events(self,
                             exchange_address: str,
                             type: str = None,
-                            from_block: int = 0) -> List[BlockchainEvent]:
+                            from_block: int = 0,
+                            after: Position = None,
+                            limit: int = None) -> Iterable[BlockchainEvent]:
         proxy = self.get_event_selector_for_exchange(exchange_address)
         if type is not None:
-            events = proxy.get_events(type, from_block=from_block)
+            query = functools.partial(proxy.get_events, type)
         else:
-            events = proxy.get_all_events(from_block=from_block)
-        return events
+            query = proxy.get_all_events
+        return self._get_events_page(query, from_block=from_block, after=after, limit=limit)
 
     def get_user_exchange_events(self,
                                  exchange_address: str,
                                  user_address: str,
                                  type: str = None,
-                                 from_block: int = 0) -> List[BlockchainEvent]:
+                                 from_block: int = 0,
+                                 after: Position = None,
+                                 limit: int = None) -> Iterable[BlockchainEvent]:
         proxy = self.get_event_selector_for_exchange(exchange_address)
         if type is not None:
-            events = proxy.get_exchange_events(type,
-                                               user_address,
-                                               from_block=from_block,
-                                               timeout=self.event_query_timeout)
+            query = functools.partial(proxy.get_exchange_events, type, user_address,
+                                      timeout=self.event_query_timeout)
         else:
-            events = proxy.get_all_exchange_events(user_address,
-                                                   from_block=from_block,
-                                                   timeout=self.event_query_timeout)
-        return events
+            query = functools.partial(proxy.get_all_exchange_events, user_address,
+                                      timeout=self.event_query_timeout)
+        return self._get_events_page(query, from_block=from_block, after=after, limit=limit)
 
     def _load_config(self):
         with open('config.json') as data_file:
@@ -428,10 +665,28 @@ class TrustlinesRelay:
         assert is_checksum_address(address)
         graph = self.currency_network_graphs[address]
         proxy = self.currency_network_proxies[address]
-        proxy.start_listen_on_full_sync(_create_on_full_sync(graph), self.config.get('syncInterval', 300))
-        proxy.start_listen_on_balance(self._on_balance_update)
-        proxy.start_listen_on_creditline(self._on_creditline_update)
-        proxy.start_listen_on_trustline(self._on_trustline_update)
+        bootstrap = None
+        if self.use_eth_index and self.config.get('graphBootstrap', 'node') == 'ethindex':
+            bootstrap = self.get_event_selector_for_currency_network(address).get_latest_graph_update_events
+        snapshot_path = None
+        snapshot_dir = self.config.get('graphSnapshotDir')
+        if snapshot_dir is not None:
+            os.makedirs(snapshot_dir, exist_ok=True)
+            snapshot_path = os.path.join(snapshot_dir, '{}.graph'.format(address))
+        self._listening_since[address] = proxy.current_blocknumber()
+        sync = NetworkSync(graph,
+                           proxy,
+                           sync_interval=self.config.get('syncInterval', 300),
+                           max_replay_blocks=self.config.get('maxReplayBlocks', 10000),
+                           bootstrap=bootstrap,
+                           snapshot_path=snapshot_path,
+                           snapshot_interval=self.config.get('graphSnapshotInterval', 600),
+                           event_source=self._event_tail)
+        self.network_syncs[address] = sync
+        sync.start()
+        proxy.start_listen_on_balance(sync.on_event(self._on_balance_update))
+        proxy.start_listen_on_creditline(sync.on_event(self._on_creditline_update))
+        proxy.start_listen_on_trustline(sync.on_event(self._on_trustline_update))
         proxy.start_listen_on_transfer(self._on_transfer)
         proxy.start_listen_on_creditline_request(self._on_creditline_request)
         proxy.start_listen_on_trustline_request(self._on_trustline_request)
@@ -498,9 +753,13 @@ class TrustlinesRelay:
         self._publish_blockchain_event(transfer_event)
 
     def _on_creditline_request(self, creditline_request_event):
+        self.user_networks.add(creditline_request_event.network_address, creditline_request_event.from_)
+        self.user_networks.add(creditline_request_event.network_address, creditline_request_event.to)
         self._publish_blockchain_event(creditline_request_event)
 
     def _on_trustline_request(self, trustline_request_event):
+        self.user_networks.add(trustline_request_event.network_address, trustline_request_event.from_)
+        self.user_networks.add(trustline_request_event.network_address, trustline_request_event.to)
         self._publish_blockchain_event(trustline_request_event)
 
     def _on_trustline_update(self, trustline_update_event):
@@ -538,10 +797,3 @@ class TrustlinesRelay:
         graph = self.currency_network_graphs[network_address]
         summary = graph.get_account_sum(from_, to)
         self._publish_user_event(BalanceEvent(network_address, from_, to, summary))
-
-
-def _create_on_full_sync(graph):
-    def update_community(graph_rep):
-        graph.gen_network(graph_rep)
-
-    return update_community
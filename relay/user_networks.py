@@ -0,0 +1,64 @@
+"""the currency networks in which users have events
+
+The events of a user are only queried in the currency networks the user has
+events in. UserNetworks learns them from two sources:
+
+- the live updates since the relay started listening to a network, i.e. every
+  user that gets a trustline in the graph and both parties of every request
+- the history of the events before that, read once per user and network with
+  the history function, e.g. from ethindex or the event store
+
+A network is only left out for a user once its history was read up to the block
+since which the live updates are followed. Until then every network is queried.
+Without a history function, the live updates are the only source. They include
+every user with a trustline, as loading a graph, e.g. by a full sync, reports
+all of its users, so that only the networks whose graph is not synced yet have
+to be queried as well, which is left to the caller. The events of users without
+a trustline from before the start are not found then.
+
+Only the users with events are kept for good. Which histories were read is kept
+for the max_read_users least recently queried users, as any address can be
+queried; the history of the others is read again.
+"""
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Set, Tuple  # noqa: F401
+
+# history(user_address, network_addresses) returns the networks of network_addresses with events of the
+# user and the networks whose history does not reach the start of the live updates yet
+History = Callable[[str, List[str]], Tuple[Iterable[str], Iterable[str]]]
+
+
+class UserNetworks(object):
+
+    def __init__(self, history: History = None, max_read_users: int = 10000) -> None:
+        self.history = history
+        self.max_read_users = max_read_users
+        self._networks = {}  # type: Dict[str, Set[str]]
+        # the networks whose history was read by user, least recently queried first
+        self._read = OrderedDict()  # type: OrderedDict
+
+    def add(self, network_address: str, user_address: str) -> None:
+        """records a live update of the user in the network"""
+        self._networks.setdefault(user_address, set()).add(network_address)
+
+    def known_networks(self, user_address: str) -> Set[str]:
+        """returns the networks the user is known to have events in"""
+        return self._networks.get(user_address, set())
+
+    def networks_with_events(self, user_address: str, network_addresses: Iterable[str]) -> Set[str]:
+        """returns the networks of network_addresses that can hold events of the user"""
+        networks = set(network_addresses)
+        read = self._read.get(user_address, set())
+        if user_address in self._read:
+            self._read.move_to_end(user_address)
+        unread = networks - read
+        incomplete = set()  # type: Set[str]
+        if unread and self.history is not None:
+            with_events, incomplete_history = self.history(user_address, sorted(unread))
+            for network_address in with_events:
+                self.add(network_address, user_address)
+            incomplete = set(incomplete_history)
+            self._read[user_address] = read | (unread - incomplete)
+            while len(self._read) > self.max_read_users:
+                self._read.popitem(last=False)
+        return (self.known_networks(user_address) & networks) | incomplete
@@ -169,3 +169,11 @@ def test_listen_on_trustline_update(fresh_currency_network, accounts):
     assert events[0].to == accounts[1]
     assert events[0].given == 25
     assert events[0].received == 50
+
+
+def test_gen_graph_representation_in_small_batches(currency_network_with_trustlines):
+    graph_representation = currency_network_with_trustlines.gen_graph_representation()
+    currency_network_with_trustlines.sync_batch_size = 1
+    currency_network_with_trustlines.sync_concurrency = 2
+
+    assert currency_network_with_trustlines.gen_graph_representation() == graph_representation
@@ -4,9 +4,7 @@ import gevent
 from relay.network_graph.graph import CurrencyNetworkGraph
 
 
-def link_graph(proxy, graph, full_sync_interval=None):
-    if full_sync_interval is not None:
-        proxy.start_listen_on_full_sync(_create_on_full_sync(graph), full_sync_interval)
+def link_graph(proxy, graph):
     proxy.start_listen_on_balance(_create_on_balance(graph))
     proxy.start_listen_on_creditline(_create_on_creditline(graph))
     proxy.start_listen_on_trustline(_create_on_trustline(graph))
@@ -33,13 +31,6 @@ def _create_on_trustline(graph):
     return update_trustline
 
 
-def _create_on_full_sync(graph):
-    def update_community(graph_rep):
-        graph.gen_network(graph_rep)
-
-    return update_community
-
-
 @pytest.fixture()
 def community_with_trustlines(currency_network_with_trustlines):
     community = CurrencyNetworkGraph(100)
@@ -0,0 +1,61 @@
+from collections import namedtuple
+
+import pytest
+
+from relay.blockchain.block_cache import BlockTimestampCache, get_block_timestamp_cache
+
+Block = namedtuple('Block', 'number, timestamp')
+
+
+class EthMock(object):
+
+    def __init__(self):
+        self.requested_blocks = []
+
+    def getBlock(self, block_identifier):
+        self.requested_blocks.append(block_identifier)
+        return Block(block_identifier, 1000 + block_identifier)
+
+
+class Web3Mock(object):
+
+    def __init__(self):
+        self.eth = EthMock()
+
+
+@pytest.fixture
+def web3():
+    return Web3Mock()
+
+
+@pytest.fixture
+def cache(web3):
+    return BlockTimestampCache(web3, maxsize=2)
+
+
+def test_get_requests_block_once(cache, web3):
+    assert cache.get(5) == 1005
+    assert cache.get(5) == 1005
+    assert web3.eth.requested_blocks == [5]
+
+
+def test_least_recently_used_is_dropped(cache, web3):
+    cache.get(1)
+    cache.get(2)
+    cache.get(1)
+    cache.get(3)
+    assert len(cache) == 2
+    cache.get(1)
+    cache.get(2)
+    assert web3.eth.requested_blocks == [1, 2, 3, 2]
+
+
+def test_prefetch_single_block_is_left_to_get(cache, web3):
+    cache.get(1)
+    cache.prefetch([1, None, 2, 2])
+    assert web3.eth.requested_blocks == [1]
+
+
+def test_cache_is_shared(web3):
+    assert get_block_timestamp_cache(web3) is get_block_timestamp_cache(web3)
+    assert get_block_timestamp_cache(web3) is not get_block_timestamp_cache(Web3Mock())
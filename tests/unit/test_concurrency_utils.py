@@ -1,7 +1,18 @@
 import pytest
 import gevent
 
-from relay.concurrency_utils import joinall, TimeoutException
+from relay import metrics
+from relay.concurrency_utils import (
+    FairLimiter,
+    SingleFlight,
+    TaskGroup,
+    TimeoutException,
+    current_deadline,
+    deadline_after,
+    spawn,
+    joinall,
+    joinall_partial,
+)
 
 
 def test_success():
@@ -64,3 +75,154 @@ def test_no_timeout():
     result = joinall([f, g, h])
 
     assert result == [3, 4, 5]
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    metrics.reset()
+    single_flight = SingleFlight('test')
+    calls = []
+
+    def query():
+        calls.append(1)
+        gevent.sleep(0.01)
+        return [1, 2]
+
+    results = joinall([lambda: single_flight.do('key', query) for _ in range(3)] +
+                      [lambda: single_flight.do('other', query)], timeout=1.)
+
+    assert results == [[1, 2]] * 4
+    assert len(calls) == 2
+    assert len(single_flight) == 0
+    assert metrics.collect() == {'test_calls': 2, 'test_coalesced': 2}
+
+    single_flight.do('key', query)
+    assert len(calls) == 3
+
+
+def test_single_flight_shares_exceptions():
+    single_flight = SingleFlight('test')
+
+    def query():
+        gevent.sleep(0.01)
+        raise ValueError('query failed')
+
+    greenlets = [gevent.spawn(single_flight.do, 'key', query) for _ in range(2)]
+    gevent.joinall(greenlets)
+    assert all(isinstance(greenlet.exception, ValueError) for greenlet in greenlets)
+    assert len(single_flight) == 0
+
+
+def test_timeout_kills_stragglers():
+    finished = []
+
+    def slow():
+        gevent.sleep(0.2)
+        finished.append(1)
+
+    with pytest.raises(TimeoutException):
+        joinall([slow], timeout=0.05)
+    gevent.sleep(0.3)
+    assert finished == []
+
+
+def test_partial_results():
+    def f():
+        return 3
+
+    def g():
+        gevent.sleep(5.)
+        return 4
+
+    results, timed_out = joinall_partial({'f': f, 'g': g}, timeout=0.1)
+
+    assert results == {'f': 3}
+    assert timed_out == ['g']
+
+
+def test_nested_calls_inherit_deadline():
+    deadlines = []
+
+    def inner():
+        deadlines.append(current_deadline())
+        gevent.sleep(5.)
+
+    def outer():
+        return joinall([inner], timeout=10.)
+
+    group = TaskGroup(0.1)
+    greenlet = group.spawn(outer)
+    greenlet.join(timeout=1.)
+    # the outer call timed out at the deadline of the group, not after its own timeout
+    assert isinstance(greenlet.exception, TimeoutException)
+    assert deadlines == [group.deadline]
+
+
+def test_limiter_shares_slots_between_requests():
+    limiter = FairLimiter(size=1)
+    order = []
+
+    def call(name):
+        with limiter.slot():
+            gevent.sleep(0.01)
+            order.append(name)
+
+    def request(name, number_of_calls):
+        joinall([lambda: call(name) for _ in range(number_of_calls)], timeout=5.)
+
+    # every request is handled in its own greenlet, the heavy request queues its calls first
+    heavy = gevent.spawn(request, 'heavy', 4)
+    gevent.sleep(0)
+    light = gevent.spawn(request, 'light', 2)
+    gevent.joinall([heavy, light], raise_error=True)
+
+    assert order == ['heavy', 'heavy', 'light', 'heavy', 'light', 'heavy']
+    assert limiter.in_use == 0
+    assert limiter.number_of_waiting == 0
+
+
+def test_limiter_wait_times_out_at_deadline():
+    limiter = FairLimiter(size=1)
+
+    def hold():
+        with limiter.slot():
+            gevent.sleep(1.)
+
+    def wait():
+        with limiter.slot():
+            pass
+
+    holder = spawn(hold)
+    gevent.sleep(0)
+    with pytest.raises(TimeoutException):
+        joinall([wait], timeout=0.05)
+    # the waiting greenlet is killed
+    gevent.sleep(0.01)
+    assert limiter.number_of_waiting == 0
+    holder.kill()
+    assert limiter.in_use == 0
+
+
+def test_deadline_after():
+    assert current_deadline() is None
+    with deadline_after(10):
+        outer = current_deadline()
+        with deadline_after(20):
+            # the earlier deadline stays
+            assert current_deadline() == outer
+        with deadline_after(0):
+            assert current_deadline() < outer
+        assert current_deadline() == outer
+    assert current_deadline() is None
+
+
+def test_single_flight_wait_times_out_at_deadline():
+    single_flight = SingleFlight('test')
+
+    def slow():
+        gevent.sleep(1.)
+
+    with deadline_after(0.05):
+        with pytest.raises(TimeoutException):
+            single_flight.do('key', slow)
+    # the function keeps running for the other callers
+    assert len(single_flight) == 1
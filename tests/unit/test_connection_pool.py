@@ -0,0 +1,129 @@
+import gevent
+import pytest
+
+from relay.concurrency_utils import TimeoutException
+from relay.connection_pool import ConnectionPool
+
+
+class CursorMock(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query):
+        if self.conn.broken:
+            raise ValueError('connection broken')
+        self.conn.queries.append(query)
+
+
+class ConnectionMock(object):
+
+    def __init__(self):
+        self.closed = False
+        self.broken = False
+        self.queries = []
+
+    def cursor(self):
+        return CursorMock(self)
+
+    def rollback(self):
+        if self.closed:
+            raise ValueError('connection closed')
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def connections():
+    return []
+
+
+@pytest.fixture
+def pool(connections):
+    def connect():
+        conn = ConnectionMock()
+        connections.append(conn)
+        return conn
+    return ConnectionPool(connect, size=2, timeout=0.01)
+
+
+def test_connection_is_reused(pool, connections):
+    with pool.connection() as conn1:
+        pass
+    with pool.connection() as conn2:
+        pass
+    assert conn1 is conn2
+    assert len(connections) == 1
+
+
+def test_connections_up_to_size(pool, connections):
+    with pool.connection():
+        with pool.connection():
+            assert pool.in_use == 2
+    assert pool.in_use == 0
+    assert pool.number_of_connections == 2
+
+
+def test_wait_timeout(pool):
+    with pool.connection():
+        with pool.connection():
+            with pytest.raises(TimeoutException):
+                with pool.connection():
+                    pass
+
+
+def test_wait_for_returned_connection(pool):
+    def use():
+        with pool.connection():
+            gevent.sleep(0.001)
+    greenlets = [gevent.spawn(use) for _ in range(5)]
+    gevent.joinall(greenlets, raise_error=True)
+    assert pool.number_of_connections == 2
+
+
+def test_closed_connection_is_replaced(pool, connections):
+    with pool.connection() as conn:
+        conn.close()
+    with pool.connection() as conn:
+        assert not conn.closed
+    assert len(connections) == 2
+    assert pool.number_of_connections == 1
+
+
+def test_health_check_replaces_broken_connection(pool, connections):
+    pool.health_check_interval = 0
+    with pool.connection() as conn:
+        pass
+    conn.broken = True
+    with pool.connection() as conn:
+        assert not conn.broken
+    assert len(connections) == 2
+
+
+def test_waiter_opens_connection_when_returned_one_is_discarded(connections):
+    def connect():
+        conn = ConnectionMock()
+        connections.append(conn)
+        return conn
+    pool = ConnectionPool(connect, size=1, timeout=1)
+
+    def use_and_close():
+        with pool.connection() as conn:
+            gevent.sleep(0.01)
+            conn.close()
+
+    greenlet = gevent.spawn(use_and_close)
+    gevent.sleep(0.001)
+    with gevent.Timeout(0.5):
+        with pool.connection() as conn:
+            assert not conn.closed
+    greenlet.get()
+    assert len(connections) == 2
+    assert pool.number_of_connections == 1
@@ -0,0 +1,80 @@
+import pytest
+
+from relay import concurrency_utils
+from relay import ethindex_db
+from relay.connection_pool import ConnectionPool
+from relay.ethindex_db import EthindexDB, EventsQuery
+
+
+class CursorMock(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params=None):
+        self.conn.queries.append(query)
+        self.rows = list(self.conn.rows)
+
+    def fetchmany(self, size):
+        self.conn.fetches.append(size)
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def __iter__(self):
+        rows, self.rows = self.rows, []
+        return iter(rows)
+
+
+class ConnectionMock(object):
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+        self.fetches = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def cursor(self, name=None):
+        return CursorMock(self)
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def connection():
+    return ConnectionMock([{'blockNumber': blocknumber} for blocknumber in range(5)])
+
+
+@pytest.fixture
+def ethindex(connection):
+    return EthindexDB(ConnectionPool(lambda: connection, size=1))
+
+
+def test_query_without_limit_is_read_in_chunks(ethindex, connection, monkeypatch):
+    monkeypatch.setattr(ethindex_db, 'fetch_size', 2)
+    rows = ethindex._query_events(EventsQuery('address=%s', ('0x0A',)))
+    # nothing is read before the rows are consumed
+    assert connection.queries == []
+    assert [row['blockNumber'] for row in rows] == [0, 1, 2, 3, 4]
+    assert connection.fetches == [2, 2, 2, 2]
+    assert ethindex.pool.in_use == 0
+    assert concurrency_utils.query_limiter.in_use == 0
+
+
+def test_query_with_limit_returns_list(ethindex, connection):
+    rows = ethindex._query_events(EventsQuery('address=%s', ('0x0A',)), limit=10)
+    assert isinstance(rows, list)
+    assert len(rows) == 5
+    assert ethindex.pool.in_use == 0
@@ -0,0 +1,142 @@
+import collections
+import socket
+
+import gevent
+import pytest
+
+from relay.connection_pool import ConnectionPool
+from relay.ethindex_sync_head import SyncHead
+
+Notify = collections.namedtuple('Notify', 'payload')
+
+
+class Database(object):
+
+    def __init__(self):
+        self.last_block_number = 10
+        self.queries = 0
+        self.has_trigger = True
+
+
+class CursorMock(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.query = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params=None):
+        self.query = query
+        if 'from sync' in query:
+            self.conn.database.queries += 1
+
+    def fetchone(self):
+        if 'pg_trigger' in self.query:
+            return {'?column?': 1} if self.conn.database.has_trigger else None
+        return {'last_block_number': self.conn.database.last_block_number}
+
+
+class ConnectionMock(object):
+
+    def __init__(self, database):
+        self.database = database
+        self.notifies = []
+        self.autocommit = False
+        self._socket, self.peer = socket.socketpair()
+
+    def cursor(self):
+        return CursorMock(self)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self._socket.close()
+        self.peer.close()
+
+    def fileno(self):
+        return self._socket.fileno()
+
+    def poll(self):
+        self._socket.recv(1024)
+
+    def notify(self, payload):
+        self.notifies.append(Notify(payload))
+        self.peer.send(b'x')
+
+
+@pytest.fixture
+def database():
+    return Database()
+
+
+@pytest.fixture
+def listen_connection(database):
+    return ConnectionMock(database)
+
+
+@pytest.fixture
+def sync_head(database):
+    sync_head = SyncHead(ConnectionPool(lambda: ConnectionMock(database)), poll_interval=0.05, fallback_interval=0.2)
+    yield sync_head
+    sync_head.stop()
+
+
+def test_blocknumber_read_if_not_listening(sync_head, database):
+    assert sync_head.blocknumber == 10
+    database.last_block_number = 11
+    assert sync_head.blocknumber == 11
+
+
+def test_blocknumber_from_notification(sync_head, database, listen_connection):
+    sync_head.start(lambda: listen_connection)
+    gevent.sleep(0.01)
+    assert sync_head.listening
+    queries = database.queries
+    listen_connection.notify('12')
+    gevent.sleep(0.01)
+    assert sync_head.blocknumber == 12
+    assert database.queries == queries
+
+
+def test_blocknumber_polled_without_notifications(sync_head, database, listen_connection):
+    sync_head.start(lambda: listen_connection)
+    gevent.sleep(0.01)
+    database.last_block_number = 13
+    gevent.sleep(0.1)
+    # notifications are expected, the sync table is only polled after the fallback interval
+    assert sync_head.blocknumber == 10
+    gevent.sleep(0.2)
+    assert sync_head.blocknumber == 13
+
+
+def test_blocknumber_polled_without_trigger(sync_head, database, listen_connection):
+    database.has_trigger = False
+    sync_head.start(lambda: listen_connection)
+    gevent.sleep(0.01)
+    assert sync_head.listening
+    assert not sync_head.has_trigger
+    database.last_block_number = 13
+    gevent.sleep(0.1)
+    assert sync_head.blocknumber == 13
+
+
+def test_blocknumber_does_not_go_back(sync_head, listen_connection):
+    sync_head.start(lambda: listen_connection)
+    gevent.sleep(0.01)
+    listen_connection.notify('15')
+    listen_connection.notify('14')
+    gevent.sleep(0.01)
+    assert sync_head.blocknumber == 15
+
+
+def test_stop(sync_head, listen_connection):
+    sync_head.start(lambda: listen_connection)
+    gevent.sleep(0.01)
+    sync_head.stop()
+    assert not sync_head.listening
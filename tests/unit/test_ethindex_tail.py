@@ -0,0 +1,121 @@
+import pytest
+
+from relay.ethindex_tail import EventTail
+
+
+class SyncHeadMock(object):
+
+    def __init__(self, blocknumber):
+        self.blocknumber = blocknumber
+        self.listeners = []
+
+    def add_listener(self, function):
+        self.listeners.append(function)
+
+
+class EventTailMock(EventTail):
+
+    def __init__(self, events, *args, **kwargs):
+        super().__init__(None, *args, **kwargs)
+        self.events = events
+        self.fetches = 0
+
+    def _fetch(self, addresses, to_block):
+        self.fetches += 1
+        events = [event for event in self.events
+                  if event['address'] in addresses and event['blockNumber'] <= to_block and
+                  (event['blockNumber'], event['transactionIndex'], event['logIndex']) > self.cursor]
+        return events[:self.batch_size]
+
+
+def make_event(address, blocknumber, transaction_index=0, log_index=0):
+    return {'address': address,
+            'blockNumber': blocknumber,
+            'transactionIndex': transaction_index,
+            'logIndex': log_index,
+            'event': 'Transfer'}
+
+
+@pytest.fixture
+def events():
+    return [make_event('0xA', 9),
+            make_event('0xA', 11, 0, 0),
+            make_event('0xB', 11, 0, 1),
+            make_event('0xA', 11, 2, 0),
+            make_event('0xC', 12),
+            make_event('0xB', 13)]
+
+
+@pytest.fixture
+def sync_head():
+    return SyncHeadMock(10)
+
+
+def start(tail, sync_head, blocknumber):
+    """starts the tail at the sync head and lets the sync head advance to blocknumber"""
+    assert tail.poll() == 0
+    sync_head.blocknumber = blocknumber
+
+
+def test_delivers_new_events_in_order(events, sync_head):
+    tail = EventTailMock(events, sync_head, batch_size=2)
+    received = []
+    tail.add_listener('0xA', received.append)
+    tail.add_listener('0xB', received.append)
+    start(tail, sync_head, 13)
+    assert tail.delivered_block == 10
+    assert tail.poll() == 4
+    assert received == [events[1], events[2], events[3], events[5]]
+    assert tail.cursor == (13, 0, 0)
+    assert tail.delivered_block == 13
+
+
+def test_no_events_delivered_twice(events, sync_head):
+    tail = EventTailMock(events, sync_head)
+    received = []
+    tail.add_listener('0xA', received.append)
+    start(tail, sync_head, 13)
+    tail.poll()
+    events.append(make_event('0xA', 14))
+    sync_head.blocknumber = 14
+    assert tail.poll() == 1
+    assert received == [events[1], events[3], events[6]]
+
+
+def test_failing_listener_does_not_stop_delivery(events, sync_head):
+    tail = EventTailMock(events, sync_head)
+    received = []
+
+    def fail(event):
+        raise ValueError()
+    tail.add_listener('0xA', fail)
+    tail.add_listener('0xA', received.append)
+    start(tail, sync_head, 13)
+    tail.poll()
+    assert received == [events[1], events[3]]
+
+
+def test_wait_for_sync_head(events, sync_head):
+    sync_head.blocknumber = None
+    tail = EventTailMock(events, sync_head)
+    tail.add_listener('0xA', lambda event: None)
+    assert tail.poll() == 0
+    assert tail.cursor is None
+    assert tail.delivered_block is None
+    assert tail.fetches == 0
+
+
+def test_events_above_sync_head_held_back(events, sync_head):
+    tail = EventTailMock(events, sync_head)
+    received = []
+    tail.add_listener('0xA', received.append)
+    tail.add_listener('0xC', received.append)
+    start(tail, sync_head, 11)
+    assert tail.poll() == 2
+    assert received == [events[1], events[3]]
+    # ethindex is still writing block 12, a later event of it must not fall behind the cursor
+    events.insert(5, make_event('0xA', 12, 1, 0))
+    sync_head.blocknumber = 12
+    assert tail.poll() == 2
+    assert received == [events[1], events[3], events[4], events[5]]
+    assert tail.cursor == (12, 1, 0)
@@ -0,0 +1,116 @@
+import pytest
+
+from relay.blockchain.event_cache import EventRangeCache
+from relay.blockchain.events import BlockchainEvent
+
+
+def make_event(blocknumber, log_index=0):
+    return BlockchainEvent({'blockNumber': blocknumber, 'logIndex': log_index, 'event': 'Transfer'}, 100, 0)
+
+
+class Fetcher(object):
+
+    def __init__(self, blocknumbers):
+        self.events = [make_event(blocknumber) for blocknumber in blocknumbers]
+        self.calls = []
+
+    def __call__(self, from_block):
+        self.calls.append(from_block)
+        return [event for event in self.events if event.blocknumber >= from_block]
+
+
+@pytest.fixture
+def fetch():
+    return Fetcher([1, 5, 10, 18, 19])
+
+
+def blocknumbers(events):
+    return [event.blocknumber for event in events]
+
+
+def test_repeated_query_fetches_only_new_blocks(fetch):
+    cache = EventRangeCache()
+    assert blocknumbers(cache.query('key', 0, 20, fetch)) == [1, 5, 10, 18, 19]
+    # the events up to block 15 are confirmed
+    assert len(cache) == 3
+    fetch.events.append(make_event(21))
+    assert blocknumbers(cache.query('key', 0, 24, fetch)) == [1, 5, 10, 18, 19, 21]
+    assert fetch.calls == [0, 16]
+    assert len(cache) == 5
+
+
+def test_later_from_block_uses_entry(fetch):
+    cache = EventRangeCache()
+    cache.query('key', 0, 20, fetch)
+    assert blocknumbers(cache.query('key', 5, 20, fetch)) == [5, 10, 18, 19]
+    assert fetch.calls == [0, 16]
+
+
+def test_earlier_from_block_replaces_entry(fetch):
+    cache = EventRangeCache()
+    cache.query('key', 6, 20, fetch)
+    assert blocknumbers(cache.query('key', 0, 20, fetch)) == [1, 5, 10, 18, 19]
+    assert blocknumbers(cache.query('key', 0, 20, fetch)) == [1, 5, 10, 18, 19]
+    assert fetch.calls == [6, 0, 16]
+
+
+def test_from_block_after_covered_blocks(fetch):
+    cache = EventRangeCache()
+    cache.query('key', 0, 12, fetch)
+    assert blocknumbers(cache.query('key', 18, 20, fetch)) == [18, 19]
+    assert fetch.calls == [0, 18]
+    assert len(cache) == 2
+
+
+def test_evicts_least_recently_used(fetch):
+    cache = EventRangeCache(maxsize=5)
+    cache.query('a', 0, 20, fetch)
+    cache.query('b', 0, 20, fetch)
+    cache.query('a', 0, 20, fetch)
+    cache.query('c', 0, 20, fetch)
+    assert len(cache) == 3
+    fetch.calls = []
+    cache.query('b', 0, 20, fetch)
+    assert fetch.calls == [0]
+
+
+def test_disabled(fetch):
+    cache = EventRangeCache(maxsize=0)
+    cache.query('key', 0, 20, fetch)
+    cache.query('key', 0, 20, fetch)
+    assert fetch.calls == [0, 0]
+    assert len(cache) == 0
+
+
+def test_interleaved_queries_of_same_key(fetch):
+    cache = EventRangeCache()
+    cache.query('key', 0, 20, fetch)
+    fetch.events.append(make_event(21))
+
+    class InterleavingFetcher(object):
+        """runs a second query of the key while the first one fetches, like a greenlet would"""
+
+        def __init__(self):
+            self.interleaved = None
+
+        def __call__(self, from_block):
+            if self.interleaved is None:
+                self.interleaved = cache.query('key', 5, 24, fetch)
+            return fetch(from_block)
+
+    assert blocknumbers(cache.query('key', 0, 24, InterleavingFetcher())) == [1, 5, 10, 18, 19, 21]
+    assert len(cache) == 5
+    assert blocknumbers(cache.query('key', 0, 24, fetch)) == [1, 5, 10, 18, 19, 21]
+    assert len(cache) == 5
+
+
+def test_entry_evicted_while_fetching(fetch):
+    cache = EventRangeCache()
+    cache.query('key', 0, 20, fetch)
+
+    def evicting_fetch(from_block):
+        cache.clear()
+        return fetch(from_block)
+
+    assert blocknumbers(cache.query('key', 0, 24, evicting_fetch)) == [1, 5, 10, 18, 19]
+    assert len(cache) == 0
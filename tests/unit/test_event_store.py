@@ -0,0 +1,168 @@
+import pytest
+
+from relay.blockchain import currency_network_events
+from relay.blockchain.block_cache import get_block_timestamp_cache
+from relay.blockchain.currency_network_events import TransferEventType, BalanceUpdateEventType
+from relay.blockchain.proxy import Proxy
+from relay.event_store import EventStore, EventStoreSync
+
+NETWORK = '0xNetwork'
+A, B, C = '0xAa', '0xBb', '0xCc'
+
+
+def transfer(blocknumber, log_index, from_, to, value):
+    return {'event': TransferEventType,
+            'address': NETWORK,
+            'blockNumber': blocknumber,
+            'transactionIndex': 0,
+            'logIndex': log_index,
+            'transactionHash': bytes([blocknumber]) * 32,
+            'blockHash': bytes([blocknumber]) * 32,
+            'args': {'_from': from_, '_to': to, '_value': value}}
+
+
+def balance_update(blocknumber, log_index, from_, to, value):
+    event = transfer(blocknumber, log_index, from_, to, value)
+    event['event'] = BalanceUpdateEventType
+    return event
+
+
+class Block(object):
+
+    def __init__(self, number):
+        self.number = number
+        self.timestamp = 1000 + number
+
+
+class PastEvents(object):
+
+    def __init__(self, events):
+        self.events = events
+
+    def get(self, only_changes):
+        return self.events
+
+
+class ContractMock(object):
+
+    def __init__(self, logs):
+        self.logs = logs
+        self.queries = []
+
+    def pastEvents(self, event_name, params):
+        self.queries.append((event_name, params))
+        to_block = params['toBlock']
+        return PastEvents([log for log in self.logs
+                           if log['event'] == event_name and
+                           params['fromBlock'] <= log['blockNumber'] and
+                           (to_block == 'latest' or log['blockNumber'] <= to_block) and
+                           all(log['args'][name] == value for name, value in params['filter'].items())])
+
+
+class EthMock(object):
+
+    def __init__(self, contract):
+        self._contract = contract
+        self.blockNumber = 20
+
+    def contract(self, abi, address):
+        return self._contract
+
+    def getBlock(self, blocknumber):
+        if blocknumber == 'latest':
+            return Block(self.blockNumber)
+        return Block(blocknumber)
+
+
+class Web3Mock(object):
+
+    def __init__(self, contract):
+        self.eth = EthMock(contract)
+
+
+class NetworkProxy(Proxy):
+    event_builders = currency_network_events.event_builders
+    event_types = list(event_builders.keys())
+    standard_event_types = currency_network_events.standard_event_types
+
+
+@pytest.fixture
+def logs():
+    return [transfer(3, 0, A, B, 10),
+            balance_update(3, 1, A, B, -10),
+            transfer(8, 0, B, C, 5),
+            transfer(15, 0, C, A, 7),
+            transfer(19, 0, A, C, 1)]
+
+
+@pytest.fixture
+def contract(logs):
+    return ContractMock(logs)
+
+
+@pytest.fixture
+def proxy(contract):
+    web3 = Web3Mock(contract)
+    cache = get_block_timestamp_cache(web3)
+    for blocknumber in range(21):
+        cache.add(blocknumber, 1000 + blocknumber)
+    return NetworkProxy(web3, [], NETWORK)
+
+
+@pytest.fixture
+def store():
+    store = EventStore()
+    yield store
+    store.close()
+
+
+def test_store_user_events(store, proxy):
+    events = proxy.get_events(TransferEventType) + proxy.get_events(BalanceUpdateEventType)
+    store.add_events(NETWORK, events, 20)
+    assert store.synced_block(NETWORK) == 20
+    stored = store.get_events(NETWORK, [TransferEventType], user_address=A.upper())
+    assert [(event['blockNumber'], event['args']['_value']) for event in stored] == [(3, 10), (15, 7), (19, 1)]
+    assert stored[0]['transactionHash'] == '0x' + 32 * '03'
+    assert stored[0]['timestamp'] == 1003
+    assert [event['event'] for event in store.get_events(NETWORK, [TransferEventType, BalanceUpdateEventType],
+                                                         user_address=B, to_block=5)] == [TransferEventType,
+                                                                                          BalanceUpdateEventType]
+    assert len(store.get_events(NETWORK, [TransferEventType], from_block=8, to_block=15)) == 2
+
+
+def test_addresses_of_user(store, proxy):
+    store.add_events(NETWORK, proxy.get_events(TransferEventType), 20)
+    assert store.get_addresses_of_user(C.upper()) == [NETWORK]
+    assert store.get_addresses_of_user('0xDd') == []
+
+
+def test_unsynced_contract(store):
+    assert store.synced_block(NETWORK) is None
+    assert store.get_events(NETWORK, [TransferEventType]) == []
+
+
+def test_sync_in_steps(store, proxy, contract):
+    sync = EventStoreSync(store, confirmations=5, max_blocks=10)
+    sync.add_proxy(proxy)
+    sync.sync()
+    assert store.synced_block(NETWORK) == 15
+    ranges = {(params['fromBlock'], params['toBlock']) for _, params in contract.queries}
+    assert ranges == {(0, 9), (10, 15)}
+    assert len(store.get_events(NETWORK, [TransferEventType])) == 3
+
+
+def test_proxy_reads_stored_events(store, proxy, contract):
+    sync = EventStoreSync(store, confirmations=5)
+    sync.add_proxy(proxy)
+    sync.sync()
+    contract.queries = []
+
+    events = proxy.get_events(TransferEventType, {'_from': A})
+    assert [(event.blocknumber, event.to) for event in events] == [(3, B), (19, C)]
+    # only the blocks after the stored ones are read from the node
+    assert [params['fromBlock'] for _, params in contract.queries] == [16]
+    assert events[0].timestamp == 1003
+
+    contract.queries = []
+    assert len(proxy.get_events(TransferEventType, from_block=0, to_block=10)) == 2
+    assert contract.queries == []
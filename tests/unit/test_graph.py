@@ -10,6 +10,11 @@ G = '0x10'
 H = '0x11'
 
 
+@pytest.fixture(params=['networkx', 'compact'])
+def storage(request):
+    return request.param
+
+
 @pytest.fixture
 def friendsdict():
     return {A: [Trustline(B, 100, 150),
@@ -53,57 +58,57 @@ def unsymnetricfriendsdict():
 
 
 @pytest.fixture
-def community_with_trustlines(friendsdict):
-    community = CurrencyNetworkGraph()
+def community_with_trustlines(friendsdict, storage):
+    community = CurrencyNetworkGraph(storage=storage)
     community.gen_network(friendsdict)
     return community
 
 
 @pytest.fixture
-def community_with_trustlines_and_fees(friendsdict):
-    community = CurrencyNetworkGraph(100)
+def community_with_trustlines_and_fees(friendsdict, storage):
+    community = CurrencyNetworkGraph(100, storage=storage)
     community.gen_network(friendsdict)
     return community
 
 
 @pytest.fixture
-def balances_community(balances_friendsdict):
-    community = CurrencyNetworkGraph()
+def balances_community(balances_friendsdict, storage):
+    community = CurrencyNetworkGraph(storage=storage)
     community.gen_network(balances_friendsdict)
     return community
 
 
 @pytest.fixture
-def complex_community_with_trustlines_and_fees(complexfriendsdict):
-    community = CurrencyNetworkGraph(100)
+def complex_community_with_trustlines_and_fees(complexfriendsdict, storage):
+    community = CurrencyNetworkGraph(100, storage=storage)
     community.gen_network(complexfriendsdict)
     return community
 
 
 @pytest.fixture
-def complex_community_with_trustlines_and_fees_33(complexfriendsdict):
-    community = CurrencyNetworkGraph(33)
+def complex_community_with_trustlines_and_fees_33(complexfriendsdict, storage):
+    community = CurrencyNetworkGraph(33, storage=storage)
     community.gen_network(complexfriendsdict)
     return community
 
 
 @pytest.fixture
-def complex_community_with_trustlines_and_fees_202(complexfriendsdict):
-    community = CurrencyNetworkGraph(202)
+def complex_community_with_trustlines_and_fees_202(complexfriendsdict, storage):
+    community = CurrencyNetworkGraph(202, storage=storage)
     community.gen_network(complexfriendsdict)
     return community
 
 
 @pytest.fixture
-def complex_community_with_trustlines_and_fees_10(complexfriendsdict):
-    community = CurrencyNetworkGraph(10)
+def complex_community_with_trustlines_and_fees_10(complexfriendsdict, storage):
+    community = CurrencyNetworkGraph(10, storage=storage)
     community.gen_network(complexfriendsdict)
     return community
 
 
 @pytest.fixture
-def complex_community_with_trustlines(complexfriendsdict):
-    community = CurrencyNetworkGraph()
+def complex_community_with_trustlines(complexfriendsdict, storage):
+    community = CurrencyNetworkGraph(storage=storage)
     community.gen_network(complexfriendsdict)
     return community
 
@@ -645,3 +650,57 @@ def test_send_more_with_fees(community_with_trustlines_and_fees):
     assert community.find_path(B, A, 200)[1] == [B, A]
     assert community.mediated_transfer(B, A, 200) == 1
     assert community.get_account_sum(A, B).balance == 80 - 2 + 1
+
+
+def test_gen_network_without_changes(community_with_trustlines, friendsdict):
+    assert community_with_trustlines.gen_network(friendsdict) == 0
+
+
+def test_gen_network_corrects_drift(community_with_trustlines, friendsdict):
+    community_with_trustlines.update_balance(A, B, 10)
+    community_with_trustlines.update_creditline(C, D, 1)
+    assert community_with_trustlines.gen_network(friendsdict) == 2
+    assert community_with_trustlines.get_account_sum(A, B).balance == 0
+    assert community_with_trustlines.get_account_sum(C, D).creditline_given == 300
+
+
+def test_gen_network_removes_trustlines_and_users(community_with_trustlines):
+    assert community_with_trustlines.gen_network({A: [Trustline(B, 100, 150)],
+                                                  B: [Trustline(C, 200, 250)],
+                                                  C: [Trustline(F, 10, 20)]}) == 4
+    assert set(community_with_trustlines.users) == {A, B, C, F}
+    assert set(community_with_trustlines.get_friends(C)) == {B, F}
+    assert community_with_trustlines.get_account_sum(C, F).creditline_received == 20
+    assert community_with_trustlines.find_path(A, F, 10)[1] == [A, B, C, F]
+
+
+def test_gen_network_keeps_cached_paths(friendsdict, storage):
+    community = CurrencyNetworkGraph(storage=storage, path_cache_size=10)
+    community.gen_network(friendsdict)
+    community.path_cache.put('path', 'result', [A, B, C], community.path_cache.version)
+    community.path_cache.put('other path', 'result', [C, D], community.path_cache.version)
+    community.update_balance(C, D, 10)
+    community.gen_network(friendsdict)
+    assert community.path_cache.get('path') == 'result'
+    assert community.path_cache.get('other path') is None
+
+
+def test_new_users_are_notified(friendsdict, storage):
+    community = CurrencyNetworkGraph(storage=storage)
+    new_users = []
+    community.on_new_user(new_users.append)
+    community.gen_network(friendsdict)
+    assert sorted(new_users) == [A, B, C, D, E]
+    community.update_trustline(A, C, 10, 20)
+    community.update_trustline(F, A, 10, 20)
+    assert sorted(new_users) == [A, B, C, D, E, F]
+
+
+def test_pinned_version_does_not_change(community_with_trustlines):
+    pinned = community_with_trustlines.pin()
+    community_with_trustlines.update_trustline(A, C, 1000, 1000)
+    community_with_trustlines.update_balance(A, B, 100)
+    assert pinned.find_path(A, C, 10)[1] == [A, B, C]
+    assert pinned.get_account_sum(A, B).balance == 0
+    assert community_with_trustlines.find_path(A, C, 10)[1] == [A, C]
+    assert community_with_trustlines.pin().get_account_sum(A, B).balance == 100
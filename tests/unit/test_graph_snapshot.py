@@ -0,0 +1,112 @@
+import random
+
+import pytest
+
+from relay.blockchain.currency_network_proxy import Trustline
+from relay.network_graph.graph import CurrencyNetworkGraph
+from relay.network_graph.snapshot import SnapshotError, dumps, loads, load, save
+from relay.network_graph.storage import fields
+
+A, B, C = '0x0A', '0x0B', '0x0C'
+
+
+def random_friendsdict(seed, number_of_users=40, number_of_trustlines=120):
+    rnd = random.Random(seed)
+    users = ['0x{:040X}'.format(rnd.getrandbits(160)) for _ in range(number_of_users)]
+    pairs = set()
+    while len(pairs) < number_of_trustlines:
+        pairs.add(tuple(sorted(rnd.sample(users, 2))))
+    friendsdict = {}
+    for a, b in sorted(pairs):
+        friendsdict.setdefault(a, []).append(Trustline(b,
+                                                       rnd.randint(0, 1000),
+                                                       rnd.randint(0, 1000),
+                                                       balance_ab=rnd.randint(-500, 500)))
+    return friendsdict
+
+
+def edges(graph):
+    return sorted((min(a, b), max(a, b), tuple(data[field] for field in fields))
+                  for a, b, data in graph.graph.edges())
+
+
+@pytest.mark.parametrize('storage', ['networkx', 'compact'])
+def test_round_trip(storage):
+    friendsdict = random_friendsdict(3)
+    graph = CurrencyNetworkGraph(storage=storage)
+    graph.gen_network(friendsdict)
+
+    loaded = CurrencyNetworkGraph(storage=storage)
+    new_users = []
+    loaded.on_new_user(new_users.append)
+    assert loads(loaded, dumps(graph, 1234)) == 1234
+    assert edges(loaded) == edges(graph)
+    assert sorted(loaded.users) == sorted(graph.users)
+    assert sorted(new_users) == sorted(graph.users)
+
+
+@pytest.mark.parametrize('storage', ['networkx', 'compact'])
+def test_values_beyond_64_bits(storage):
+    graph = CurrencyNetworkGraph(storage=storage)
+    graph.update_trustline(B, A, 2 ** 200, 0)
+    graph.update_balance(A, B, -2 ** 100)
+    graph.update_creditline(B, C, 5)
+
+    loaded = CurrencyNetworkGraph(storage=storage)
+    loads(loaded, dumps(graph, 1))
+    assert loaded.get_account_sum(B, A).creditline_given == 2 ** 200
+    assert loaded.get_account_sum(A, B).balance == -2 ** 100
+    assert loaded.get_account_sum(B, C).creditline_given == 5
+
+
+def test_snapshot_between_storages():
+    friendsdict = random_friendsdict(4)
+    graph = CurrencyNetworkGraph(storage='networkx')
+    graph.gen_network(friendsdict)
+
+    loaded = CurrencyNetworkGraph(storage='compact')
+    loads(loaded, dumps(graph, 1))
+    assert edges(loaded) == edges(graph)
+
+
+def test_loading_replaces_graph_and_paths():
+    graph = CurrencyNetworkGraph(storage='compact', path_cache_size=10)
+    graph.update_trustline(A, B, 100, 100)
+    snapshot = dumps(graph, 1)
+    graph.update_trustline(B, C, 100, 100)
+    assert graph.find_path(A, C, 10)[1]
+
+    loads(graph, snapshot)
+    assert graph.get_friends(C) == []
+    assert graph.find_path(A, C, 10)[1] == []
+
+
+def test_empty_graph():
+    loaded = CurrencyNetworkGraph(storage='compact')
+    assert loads(loaded, dumps(CurrencyNetworkGraph(), 7)) == 7
+    assert list(loaded.users) == []
+
+
+@pytest.mark.parametrize('data', [b'', b'XXXX' + 30 * b'\0', b'TLGS\2\0' + 20 * b'\0'])
+def test_invalid_snapshot(data):
+    with pytest.raises(SnapshotError):
+        loads(CurrencyNetworkGraph(), data)
+
+
+def test_truncated_snapshot():
+    graph = CurrencyNetworkGraph()
+    graph.update_trustline(A, B, 100, 100)
+    with pytest.raises(SnapshotError):
+        loads(CurrencyNetworkGraph(), dumps(graph, 1)[:-3])
+
+
+def test_save_and_load(tmpdir):
+    path = str(tmpdir.join('network.graph'))
+    graph = CurrencyNetworkGraph()
+    graph.update_trustline(A, B, 100, 50)
+    save(graph, 12, path)
+    assert tmpdir.listdir() == [tmpdir.join('network.graph')]
+
+    loaded = CurrencyNetworkGraph()
+    assert load(loaded, path) == 12
+    assert loaded.get_account_sum(A, B).creditline_given == 100
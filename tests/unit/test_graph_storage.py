@@ -0,0 +1,188 @@
+import copy
+import random
+
+import pytest
+
+from relay.blockchain.currency_network_proxy import Trustline
+from relay.network_graph.graph import CurrencyNetworkGraph
+from relay.network_graph.storage import ChunkedList, CompactGraphStorage, chunk_size, create_storage
+
+A, B, C = '0x0A', '0x0B', '0x0C'
+
+
+def random_friendsdict(seed, number_of_users=40, number_of_trustlines=120):
+    rnd = random.Random(seed)
+    users = ['0x{:040X}'.format(rnd.getrandbits(160)) for _ in range(number_of_users)]
+    friendsdict = {}
+    pairs = set()
+    while len(pairs) < number_of_trustlines:
+        a, b = sorted(rnd.sample(users, 2))
+        pairs.add((a, b))
+    for a, b in sorted(pairs):
+        friendsdict.setdefault(a, []).append(Trustline(b,
+                                                       rnd.randint(0, 1000),
+                                                       rnd.randint(0, 1000),
+                                                       balance_ab=rnd.randint(-500, 500)))
+    return users, friendsdict
+
+
+@pytest.fixture()
+def compact():
+    return CompactGraphStorage()
+
+
+def test_unknown_storage():
+    with pytest.raises(ValueError):
+        create_storage('unknown')
+
+
+def test_add_edge_orders_endpoints(compact):
+    compact.add_edge(B, A, balance_ab=10)
+    assert compact.has_edge(A, B)
+    assert compact.has_edge(B, A)
+    assert compact.balance(compact.node(A), compact.node(B), compact._edge_index(A, B)) == 10
+    assert compact.balance(compact.node(B), compact.node(A), compact._edge_index(A, B)) == -10
+
+
+def test_add_edge_defaults_to_zero(compact):
+    compact.add_edge(A, B, creditline_ab=5)
+    assert dict(compact.edge(A, B)) == {'creditline_ab': 5,
+                                        'creditline_ba': 0,
+                                        'interest_ab': 0,
+                                        'interest_ba': 0,
+                                        'fees_outstanding_a': 0,
+                                        'fees_outstanding_b': 0,
+                                        'm_time': 0,
+                                        'balance_ab': 0}
+
+
+def test_edge_view_writes_through(compact):
+    compact.add_edge(A, B)
+    compact.edge(A, B)['balance_ab'] = 7
+    assert compact.edge(B, A)['balance_ab'] == 7
+    assert list(compact.values('balance_ab')) == [7]
+
+
+def test_remove_edge_reuses_slot(compact):
+    compact.add_edge(A, B, balance_ab=3)
+    compact.add_edge(A, C, balance_ab=4)
+    compact.remove_edge(A, B)
+    assert not compact.has_edge(A, B)
+    assert compact.number_of_edges() == 1
+    assert sum(compact.values('balance_ab')) == 4
+    compact.add_edge(B, C, balance_ab=5)
+    assert len(compact._edge_a) == 2
+    assert sum(compact.values('balance_ab')) == 9
+
+
+def test_remove_node(compact):
+    compact.add_edge(A, B)
+    compact.add_edge(A, C)
+    compact.remove_node(A)
+    assert A not in compact
+    assert compact.number_of_edges() == 0
+    assert list(compact.neighbors(B)) == []
+    compact.add_edge(A, B)
+    assert list(compact.neighbors(A)) == [B]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_compact_storage_equals_networkx(seed):
+    users, friendsdict = random_friendsdict(seed)
+    networkx_graph = CurrencyNetworkGraph(100, storage='networkx')
+    compact_graph = CurrencyNetworkGraph(100, storage='compact')
+    networkx_graph.gen_network(friendsdict)
+    compact_graph.gen_network(friendsdict)
+
+    assert set(networkx_graph.users) == set(compact_graph.users)
+    assert networkx_graph.money_created == compact_graph.money_created
+    assert networkx_graph.total_creditlines == compact_graph.total_creditlines
+    assert networkx_graph.dump() == compact_graph.dump()
+
+    rnd = random.Random(seed)
+    for _ in range(50):
+        source, target = rnd.sample(users, 2)
+        value = rnd.randint(1, 300)
+        assert networkx_graph.find_path(source, target, value) == compact_graph.find_path(source, target, value)
+        assert (networkx_graph.find_path(source, target, value, max_hops=3) ==
+                compact_graph.find_path(source, target, value, max_hops=3))
+        assert (networkx_graph.find_maximum_capacity_path(source, target) ==
+                compact_graph.find_maximum_capacity_path(source, target))
+        assert networkx_graph.get_account_sum(source).__dict__ == compact_graph.get_account_sum(source).__dict__
+
+
+def edges(storage):
+    return sorted((min(a, b), max(a, b), tuple(sorted(data.items()))) for a, b, data in storage.edges())
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_frozen_version_does_not_change(seed):
+    users, friendsdict = random_friendsdict(seed)
+    graph = CurrencyNetworkGraph(100, storage='compact')
+    never_frozen = CurrencyNetworkGraph(100, storage='compact')
+    graph.gen_network(friendsdict)
+    never_frozen.gen_network(friendsdict)
+    frozen = graph.graph.freeze()
+    assert graph.graph.freeze() is frozen
+    frozen_edges = edges(frozen)
+
+    rnd = random.Random(seed)
+    for step in range(30):
+        a, b = rnd.sample(users, 2)
+        value = rnd.randint(-500, 500)
+        c = rnd.choice(users + [A, B])
+        for community in (graph, never_frozen):
+            community.update_balance(a, b, value)
+            community.update_trustline(a, c, 10, 20)
+        if step % 10 == 0:
+            graph.graph.freeze()
+    a, b, _ = next(iter(graph.graph.edges()))
+    for community in (graph, never_frozen):
+        community.graph.remove_edge(a, b)
+        community.graph.remove_node(users[0])
+
+    assert edges(frozen) == frozen_edges
+    assert graph.graph.freeze() is not frozen
+    assert edges(graph.graph) == edges(never_frozen.graph)
+    assert edges(graph.graph.freeze()) == edges(never_frozen.graph)
+    assert graph.find_path(users[1], users[2], 10) == never_frozen.find_path(users[1], users[2], 10)
+
+
+def test_chunked_list_copy_shares_chunks():
+    values = ChunkedList(range(2 * chunk_size + 1))
+    copied = copy.copy(values)
+    copied[chunk_size + 1] = -1
+    copied.append(-2)
+    assert values[chunk_size + 1] == chunk_size + 1
+    assert len(values) == 2 * chunk_size + 1
+    assert list(values) == list(range(2 * chunk_size + 1))
+    assert copied[chunk_size + 1] == -1
+    assert list(copied)[-2:] == [2 * chunk_size, -2]
+    # only the changed chunks are copied
+    assert copied.chunks[0] is values.chunks[0]
+    assert copied.chunks[1] is not values.chunks[1]
+    assert copied.chunks[2] is not values.chunks[2]
+
+
+def test_chunked_list_appends_new_chunks():
+    values = ChunkedList(typecode='I')
+    for value in range(chunk_size + 1):
+        values.append(value)
+    assert [len(chunk) for chunk in values.chunks] == [chunk_size, 1]
+    assert values[chunk_size] == chunk_size
+    with pytest.raises(IndexError):
+        values[chunk_size + 1] = 0
+
+
+def test_write_after_freeze_copies_one_chunk(compact):
+    users = ['0x{:040X}'.format(user) for user in range(chunk_size + 2)]
+    for a, b in zip(users, users[1:]):
+        compact.add_edge(a, b, balance_ab=1)
+    frozen = compact.freeze()
+    compact.edge(users[0], users[1])['balance_ab'] = 2
+    assert frozen.edge(users[0], users[1])['balance_ab'] == 1
+    balances = compact._columns['balance_ab']
+    frozen_balances = frozen._columns['balance_ab']
+    assert balances.chunks[0] is not frozen_balances.chunks[0]
+    assert balances.chunks[1] is frozen_balances.chunks[1]
+    assert compact._columns['creditline_ab'] is frozen._columns['creditline_ab']
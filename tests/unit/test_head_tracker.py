@@ -0,0 +1,84 @@
+from collections import namedtuple
+
+import pytest
+
+from relay.blockchain import head_tracker
+from relay.blockchain.block_cache import get_block_timestamp_cache
+from relay.blockchain.events import BlockchainEvent
+from relay.blockchain.head_tracker import HeadTracker
+
+Block = namedtuple('Block', 'number, timestamp')
+
+
+class EthMock(object):
+
+    def __init__(self):
+        self.latest = 10
+        self.number_of_requests = 0
+
+    def getBlock(self, block_identifier):
+        self.number_of_requests += 1
+        if block_identifier == 'latest':
+            return Block(self.latest, 1000 + self.latest)
+        number = int(block_identifier, 16)
+        return Block(number, 1000 + number)
+
+
+class Web3Mock(object):
+
+    def __init__(self):
+        self.eth = EthMock()
+
+
+@pytest.fixture
+def web3():
+    return Web3Mock()
+
+
+@pytest.fixture
+def tracker(web3):
+    return HeadTracker(web3)
+
+
+@pytest.fixture
+def running_tracker(tracker, monkeypatch):
+    tracker.update()
+    tracker.tracking = True
+    monkeypatch.setattr(head_tracker, '_tracker', tracker)
+    return tracker
+
+
+def test_not_tracking_requests_head(tracker, web3):
+    assert tracker.blocknumber == 10
+    web3.eth.latest = 11
+    assert tracker.blocknumber == 11
+    assert tracker.timestamp == 1011
+    assert head_tracker.current_blocknumber() is None
+
+
+def test_tracking_follows_new_blocks(running_tracker, web3):
+    web3.eth.number_of_requests = 0
+    running_tracker._on_new_block('0xc')
+    assert running_tracker.blocknumber == 12
+    assert running_tracker.timestamp == 1012
+    assert web3.eth.number_of_requests == 1
+    assert head_tracker.current_blocknumber() == 12
+
+
+def test_old_blocks_do_not_move_head(running_tracker):
+    running_tracker._on_new_block('0x9')
+    assert running_tracker.blocknumber == 10
+
+
+def test_new_blocks_are_cached(running_tracker, web3):
+    running_tracker._on_new_block('0xc')
+    web3.eth.number_of_requests = 0
+    assert get_block_timestamp_cache(web3).get(12) == 1012
+    assert web3.eth.number_of_requests == 0
+
+
+def test_event_status_follows_head(running_tracker):
+    event = BlockchainEvent({'blockNumber': 10}, 10, 1010)
+    assert event.status == 'pending'
+    running_tracker._on_new_block('0xf')
+    assert event.status == 'confirmed'
@@ -0,0 +1,231 @@
+import pytest
+
+from relay.blockchain.currency_network_events import (
+    BalanceUpdateEvent,
+    CreditlineUpdateEvent,
+    TrustlineUpdateEvent,
+    BalanceUpdateEventType,
+    CreditlineUpdateEventType,
+    TrustlineUpdateEventType,
+)
+from relay.blockchain.currency_network_proxy import Trustline
+from relay.network_graph.graph import CurrencyNetworkGraph
+from relay.network_sync import NetworkSync, graph_representation
+
+A, B, C = '0x0A', '0x0B', '0x0C'
+
+
+def balance_update(blocknumber, log_index, from_, to, value):
+    return BalanceUpdateEvent({'event': BalanceUpdateEventType,
+                               'blockNumber': blocknumber,
+                               'logIndex': log_index,
+                               'args': {'_from': from_, '_to': to, '_value': value}},
+                              blocknumber, 0)
+
+
+def trustline_update(blocknumber, log_index, creditor, debtor, given, received):
+    return TrustlineUpdateEvent({'event': TrustlineUpdateEventType,
+                                 'blockNumber': blocknumber,
+                                 'logIndex': log_index,
+                                 'args': {'_creditor': creditor,
+                                          '_debtor': debtor,
+                                          '_creditlineGiven': given,
+                                          '_creditlineReceived': received}},
+                                blocknumber, 0)
+
+
+class ProxyMock(object):
+
+    address = '0x00'
+
+    def __init__(self):
+        self.blocknumber = 10
+        self.friendsdict = {A: [Trustline(B, 100, 100)]}
+        self.events = []
+        self.replayed_ranges = []
+
+    def current_blocknumber(self):
+        return self.blocknumber
+
+    def gen_graph_representation(self):
+        return self.friendsdict
+
+    def get_graph_update_events(self, event_types, from_block, to_block):
+        self.replayed_ranges.append((from_block, to_block))
+        return [event for event in self.events if from_block <= event.blocknumber <= to_block]
+
+
+@pytest.fixture
+def proxy():
+    return ProxyMock()
+
+
+@pytest.fixture
+def sync(proxy):
+    sync = NetworkSync(CurrencyNetworkGraph(), proxy, max_replay_blocks=100)
+    sync.full_sync()
+    return sync
+
+
+def test_full_sync_sets_checkpoint(sync, proxy):
+    assert sync.checkpoint == 10
+    assert sync.graph.get_account_sum(A, B).creditline_given == 100
+
+
+def test_replay_from_checkpoint(sync, proxy):
+    proxy.events = [balance_update(10, 0, A, B, 5),
+                    balance_update(12, 1, A, B, 30),
+                    trustline_update(12, 0, B, C, 10, 20),
+                    balance_update(12, 2, B, C, 3)]
+    proxy.blocknumber = 15
+    sync.replay()
+    assert proxy.replayed_ranges == [(11, 15)]
+    assert sync.checkpoint == 15
+    assert sync.graph.get_account_sum(A, B).balance == 30
+    assert sync.graph.get_account_sum(B, C).creditline_given == 10
+    assert sync.graph.get_account_sum(B, C).balance == 3
+
+
+def test_replay_too_many_blocks_requests_full_sync(sync, proxy):
+    proxy.blocknumber = 200
+    sync.replay()
+    assert proxy.replayed_ranges == []
+    assert sync._full_sync_requested.is_set()
+    assert sync.checkpoint == 10
+
+
+def test_failed_replay_requests_full_sync(sync, proxy):
+    def fail(*args):
+        raise ValueError('Node error')
+    proxy.get_graph_update_events = fail
+    proxy.blocknumber = 15
+    sync.replay()
+    assert sync._full_sync_requested.is_set()
+    assert sync.checkpoint == 10
+
+
+def test_live_events_are_held_back_during_replay(sync, proxy):
+    handled = []
+    handle = sync.on_event(handled.append)
+    live_event = balance_update(16, 0, A, B, 50)
+
+    def get_graph_update_events(event_types, from_block, to_block):
+        handle(live_event)
+        assert handled == []
+        return [balance_update(12, 0, A, B, 30)]
+    proxy.get_graph_update_events = get_graph_update_events
+    proxy.blocknumber = 15
+    sync.replay()
+    assert handled == [live_event]
+
+
+def test_reconnect_during_replay_replays_again(sync, proxy):
+    replay_events = proxy.get_graph_update_events
+
+    def get_graph_update_events(event_types, from_block, to_block):
+        if len(proxy.replayed_ranges) == 0:
+            # a filter reconnects after the head of the running replay
+            proxy.blocknumber = 18
+            proxy.events.append(balance_update(17, 0, A, B, 40))
+            sync.replay()
+        return replay_events(event_types, from_block, to_block)
+    proxy.get_graph_update_events = get_graph_update_events
+    proxy.events = [balance_update(12, 0, A, B, 30)]
+    proxy.blocknumber = 15
+    sync.replay()
+    assert proxy.replayed_ranges == [(11, 15), (16, 18)]
+    assert sync.checkpoint == 18
+    assert sync.graph.get_account_sum(A, B).balance == 40
+
+
+def test_checkpoint_advances_to_head_seen_before(sync):
+    sync._advance_checkpoint(12)
+    assert sync.checkpoint == 10
+    sync._advance_checkpoint(14)
+    assert sync.checkpoint == 12
+
+
+def test_checkpoint_does_not_advance_while_disconnected(sync):
+    sync._advance_checkpoint(12)
+    sync._on_disconnect()
+    sync._advance_checkpoint(14)
+    sync._advance_checkpoint(16)
+    assert sync.checkpoint == 10
+
+
+class EventSourceMock(object):
+
+    def __init__(self, delivered_block):
+        self.delivered_block = delivered_block
+
+
+def test_checkpoint_does_not_pass_lagging_event_source(sync, proxy):
+    event_source = sync.event_source = EventSourceMock(None)
+    proxy.blocknumber = 20
+    # the event source did not deliver any block yet
+    assert sync._delivered_head() is None
+    event_source.delivered_block = 11
+    sync._advance_checkpoint(sync._delivered_head())
+    sync._advance_checkpoint(sync._delivered_head())
+    assert sync.checkpoint == 11
+    event_source.delivered_block = 25
+    assert sync._delivered_head() == 20
+
+
+def creditline_update(blocknumber, log_index, creditor, debtor, value):
+    return CreditlineUpdateEvent({'event': CreditlineUpdateEventType,
+                                  'blockNumber': blocknumber,
+                                  'logIndex': log_index,
+                                  'args': {'_creditor': creditor, '_debtor': debtor, '_value': value}},
+                                 blocknumber, 0)
+
+
+def test_graph_representation_applies_events_in_order():
+    events = [balance_update(12, 0, B, A, 30),
+              creditline_update(11, 0, B, A, 50),
+              trustline_update(10, 0, A, B, 100, 200),
+              trustline_update(10, 1, B, C, 0, 0)]
+    assert graph_representation(events) == {A: [Trustline(B, creditline_ab=100, creditline_ba=50, balance_ab=-30)]}
+
+
+def test_bootstrap(proxy):
+    proxy.events = [balance_update(21, 0, A, B, 30)]
+    proxy.blocknumber = 25
+    sync = NetworkSync(CurrencyNetworkGraph(), proxy,
+                       bootstrap=lambda: ([trustline_update(12, 0, A, B, 100, 200)], 20))
+    assert sync.bootstrap()
+    assert proxy.replayed_ranges == [(21, 25)]
+    assert sync.checkpoint == 25
+    assert sync.graph.get_account_sum(A, B).creditline_given == 100
+    assert sync.graph.get_account_sum(A, B).balance == 30
+
+
+def test_failed_bootstrap(proxy):
+    def fail():
+        raise RuntimeError('Could not determine the block synced by ethindex')
+    sync = NetworkSync(CurrencyNetworkGraph(), proxy, bootstrap=fail)
+    assert not sync.bootstrap()
+    assert sync.checkpoint is None
+
+
+def test_restart_from_snapshot(sync, proxy, tmpdir):
+    path = str(tmpdir.join('network.graph'))
+    sync.snapshot_path = path
+    assert sync.save_snapshot()
+    # nothing changed since the last snapshot
+    assert not sync.save_snapshot()
+
+    proxy.events = [balance_update(12, 0, A, B, 30)]
+    proxy.blocknumber = 15
+    restarted = NetworkSync(CurrencyNetworkGraph(), proxy, snapshot_path=path)
+    assert restarted.load_snapshot()
+    assert proxy.replayed_ranges == [(11, 15)]
+    assert restarted.checkpoint == 15
+    assert restarted.graph.get_account_sum(A, B).creditline_given == 100
+    assert restarted.graph.get_account_sum(A, B).balance == 30
+
+
+def test_missing_snapshot(proxy, tmpdir):
+    sync = NetworkSync(CurrencyNetworkGraph(), proxy, snapshot_path=str(tmpdir.join('missing.graph')))
+    assert not sync.load_snapshot()
+    assert sync.checkpoint is None
@@ -0,0 +1,64 @@
+import pytest
+
+from relay.blockchain.events import BlockchainEvent
+from relay.blockchain.pagination import encode_cursor, decode_cursor, page_events, next_cursor
+
+
+def make_event(blocknumber, transaction_index=0, log_index=0):
+    return BlockchainEvent({'blockNumber': blocknumber,
+                            'transactionIndex': transaction_index,
+                            'logIndex': log_index}, 100, 0)
+
+
+@pytest.fixture
+def events():
+    return [make_event(2, 0, 1),
+            make_event(None),
+            make_event(1, 1, 0),
+            make_event(2, 0, 0),
+            make_event(1, 0, 3)]
+
+
+def positions(events):
+    return [(event.blocknumber, event.transaction_index, event.log_index) for event in events]
+
+
+def test_cursor_roundtrip():
+    assert decode_cursor(encode_cursor((123, 4, 5))) == (123, 4, 5)
+
+
+@pytest.mark.parametrize('cursor', ['', 'abc', encode_cursor((1, 2, 3))[:-2], 'MTox'])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_page_events_order(events):
+    assert positions(page_events(events)) == [(1, 0, 3), (1, 1, 0), (2, 0, 0), (2, 0, 1)]
+
+
+def test_page_events_after(events):
+    assert positions(page_events(events, after=(1, 1, 0), limit=2)) == [(2, 0, 0), (2, 0, 1)]
+
+
+def test_pages_cover_all_events(events):
+    paged = []
+    after = None
+    while True:
+        page = page_events(events, after=after, limit=2)
+        paged.extend(page)
+        cursor = next_cursor(page, 2)
+        if cursor is None:
+            break
+        after = decode_cursor(cursor)
+    assert positions(paged) == positions(page_events(events))
+
+
+def test_no_next_cursor_for_last_page(events):
+    assert next_cursor(page_events(events, limit=10), 10) is None
+    assert next_cursor(page_events(events), None) is None
+
+
+def test_next_cursor_after_last_mined_event():
+    page = [make_event(1, 0, 0), make_event(2, 0, 0), make_event(None)]
+    assert decode_cursor(next_cursor(page, 3)) == (2, 0, 0)
@@ -0,0 +1,96 @@
+import pytest
+
+from relay.blockchain.currency_network_proxy import Trustline
+from relay.network_graph.graph import CurrencyNetworkGraph
+from relay.network_graph.path_cache import PathCache
+
+A, B, C, D, E = ('0x0A', '0x0B', '0x0C', '0x0D', '0x0E')
+
+
+@pytest.fixture
+def cache():
+    return PathCache(3)
+
+
+@pytest.fixture
+def graph():
+    graph = CurrencyNetworkGraph(100, path_cache_size=10)
+    graph.gen_network({A: [Trustline(B, 100, 100)],
+                       B: [Trustline(C, 100, 100)],
+                       D: [Trustline(E, 100, 100)]})
+    return graph
+
+
+def test_get_put(cache):
+    assert cache.get('key') is None
+    cache.put('key', 'result', [A, B, C], cache.version)
+    assert cache.get('key') == 'result'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_is_dropped(cache):
+    for key in range(3):
+        cache.put(key, key, [A, B], cache.version)
+    cache.get(0)
+    cache.put(3, 3, [A, B], cache.version)
+    assert cache.get(1) is None
+    assert cache.get(0) == 0
+    assert len(cache) == 3
+
+
+def test_invalidate_edge_of_path(cache):
+    cache.put('path', 'result', [A, B, C], cache.version)
+    cache.invalidate_edge(C, B)
+    assert cache.get('path') is None
+    assert cache.invalidations == 1
+
+
+def test_invalidate_other_edge(cache):
+    cache.put('path', 'result', [A, B, C], cache.version)
+    cache.invalidate_edge(A, C)
+    assert cache.get('path') == 'result'
+    assert cache.invalidations == 0
+
+
+def test_invalidate_no_path(cache):
+    cache.put('no path', 'result', [], cache.version)
+    cache.invalidate_edge(D, E)
+    assert cache.get('no path') is None
+
+
+def test_outdated_result_is_not_cached(cache):
+    version = cache.version
+    cache.invalidate_edge(A, B)
+    cache.put('path', 'result', [A, B, C], version)
+    cache.put('no path', 'result', [], version)
+    cache.put('other path', 'result', [D, E], version)
+    assert cache.get('path') is None
+    assert cache.get('no path') is None
+    assert cache.get('other path') == 'result'
+
+
+def test_clear(cache):
+    version = cache.version
+    cache.put('path', 'result', [A, B], version)
+    cache.clear()
+    cache.put('other path', 'result', [D, E], version)
+    assert len(cache) == 0
+    assert cache.invalidations == 1
+
+
+@pytest.mark.parametrize('update', [
+    lambda graph: graph.update_balance(B, C, 10),
+    lambda graph: graph.update_creditline(C, B, 10),
+    lambda graph: graph.update_trustline(A, B, 10, 10),
+    lambda graph: graph.gen_network({}),
+])
+def test_graph_updates_invalidate(graph, update):
+    graph.path_cache.put('path', 'result', [A, B, C], graph.path_cache.version)
+    update(graph)
+    assert graph.path_cache.get('path') is None
+
+
+def test_graph_update_of_other_edge(graph):
+    graph.path_cache.put('path', 'result', [A, B, C], graph.path_cache.version)
+    graph.update_balance(D, E, 10)
+    assert graph.path_cache.get('path') == 'result'
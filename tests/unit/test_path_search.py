@@ -0,0 +1,115 @@
+import random
+
+import pytest
+
+from relay.blockchain.currency_network_proxy import Trustline
+from relay.network_graph.graph import CurrencyNetworkGraph
+from relay.network_graph.landmarks import Landmarks, _breadth_first_distances
+
+
+def random_network(seed, number_of_users=60, number_of_trustlines=100):
+    rnd = random.Random(seed)
+    users = ['0x{:040X}'.format(rnd.getrandbits(160)) for _ in range(number_of_users)]
+    pairs = set()
+    while len(pairs) < number_of_trustlines:
+        pairs.add(tuple(sorted(rnd.sample(users, 2))))
+    friendsdict = {}
+    for a, b in sorted(pairs):
+        friendsdict.setdefault(a, []).append(Trustline(b,
+                                                       rnd.randint(0, 1000),
+                                                       rnd.randint(0, 1000),
+                                                       balance_ab=rnd.randint(-500, 500)))
+    return users, friendsdict
+
+
+def graphs(friendsdict, storage):
+    result = []
+    for options in [{},
+                    {'bidirectional_search': True},
+                    {'number_of_landmarks': 4},
+                    {'bidirectional_search': True, 'number_of_landmarks': 2}]:
+        graph = CurrencyNetworkGraph(100, storage=storage, **options)
+        graph.gen_network(friendsdict)
+        result.append(graph)
+    return result
+
+
+@pytest.mark.parametrize('storage', ['networkx', 'compact'])
+@pytest.mark.parametrize('seed', range(4))
+def test_search_modes_find_same_paths(seed, storage):
+    users, friendsdict = random_network(seed)
+    plain, *other_graphs = graphs(friendsdict, storage)
+    rnd = random.Random(seed)
+    for _ in range(100):
+        source, target = rnd.sample(users, 2)
+        value = rnd.randint(1, 500)
+        max_hops = rnd.choice([None, 1, 2, 3, 5])
+        max_fees = rnd.choice([None, 0, 2, 10])
+        expected = plain.find_path(source, target, value, max_hops=max_hops, max_fees=max_fees)
+        for graph in other_graphs:
+            assert graph.find_path(source, target, value, max_hops=max_hops, max_fees=max_fees) == expected
+
+
+@pytest.mark.parametrize('storage', ['networkx', 'compact'])
+def test_search_modes_after_updates(storage):
+    users, friendsdict = random_network(7)
+    all_graphs = graphs(friendsdict, storage)
+    rnd = random.Random(7)
+    for _ in range(30):
+        a, b = rnd.sample(users, 2)
+        given, received = rnd.randint(0, 1000), rnd.randint(0, 1000)
+        for graph in all_graphs:
+            graph.update_trustline(a, b, given, received)
+        source, target = rnd.sample(users, 2)
+        expected = all_graphs[0].find_path(source, target, 100, max_hops=4)
+        for graph in all_graphs[1:]:
+            assert graph.find_path(source, target, 100, max_hops=4) == expected
+
+
+def test_landmarks_lower_bound():
+    users, friendsdict = random_network(3, number_of_trustlines=70)
+    graph = CurrencyNetworkGraph(storage='networkx')
+    graph.gen_network(friendsdict)
+    adj = graph.graph.adj
+    landmarks = Landmarks(adj, graph.users, 3)
+    for target in graph.users:
+        distances = _breadth_first_distances(adj, target)
+        lower_bound = landmarks.lower_bound(target)
+        for node in graph.users:
+            assert lower_bound(node) <= distances.get(node, float('inf'))
+
+
+def test_landmarks_add_edge():
+    users, friendsdict = random_network(5, number_of_trustlines=50)
+    graph = CurrencyNetworkGraph(storage='networkx')
+    graph.gen_network(friendsdict)
+    landmarks = Landmarks(graph.graph.adj, graph.users, 3)
+    rnd = random.Random(5)
+    for _ in range(20):
+        a, b = rnd.sample(users, 2)
+        graph.update_balance(a, b, 0)
+        landmarks.add_edge(graph.graph.adj, a, b)
+    for landmark, distances in zip(landmarks.landmarks, landmarks.distances):
+        assert distances == _breadth_first_distances(graph.graph.adj, landmark)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_path_respects_max_hops_and_fees(seed):
+    users, friendsdict = random_network(seed)
+    graph = CurrencyNetworkGraph(100)
+    graph.gen_network(friendsdict)
+    rnd = random.Random(seed)
+    for _ in range(100):
+        source, target = rnd.sample(users, 2)
+        max_hops = rnd.choice([2, 3, 4])
+        cost, path = graph.find_path(source, target, 300, max_hops=max_hops)
+        if path:
+            assert len(path) - 1 <= max_hops
+            fees = 0
+            value = 300
+            for sender, receiver in reversed(list(zip(path, path[1:]))):
+                fee = graph.transfer(sender, receiver, value)
+                value += fee
+                fees += fee
+            assert fees == cost
+            graph.gen_network(friendsdict)
@@ -0,0 +1,130 @@
+import time
+
+import gevent
+import pytest
+
+from relay import metrics
+from relay.blockchain.currency_network_proxy import Trustline
+from relay.concurrency_utils import TimeoutException
+from relay.network_graph.graph import CurrencyNetworkGraph
+from relay.network_graph.path_workers import PathSearchPool
+
+NETWORK = '0xNetwork'
+A, B, C, D = '0x0A', '0x0B', '0x0C', '0x0D'
+
+
+@pytest.fixture
+def graph():
+    graph = CurrencyNetworkGraph(100, storage='compact')
+    graph.gen_network({A: [Trustline(B, 100, 150)],
+                       B: [Trustline(C, 200, 250)],
+                       C: [Trustline(D, 300, 350)]})
+    return graph
+
+
+@pytest.fixture
+def pool():
+    pool = PathSearchPool(processes=1, replica_interval=0)
+    pool.start()
+    yield pool
+    pool.close()
+
+
+def test_search_in_worker(pool, graph):
+    result, version = pool.search(NETWORK, graph, 'find_path', source=A, target=D, value=10)
+    assert result == graph.find_path(A, D, 10)
+    assert version == graph.path_cache.version
+    assert pool.search(NETWORK, graph, 'find_maximum_capacity_path', source=D, target=A)[0] == \
+        graph.find_maximum_capacity_path(D, A)
+
+
+def test_worker_gets_new_replica(pool, graph):
+    assert pool.search(NETWORK, graph, 'find_path', source=A, target=D, value=10)[0][1] == [A, B, C, D]
+    graph.update_trustline(A, D, 100, 100)
+    result, version = pool.search(NETWORK, graph, 'find_path', source=A, target=D, value=10)
+    assert result[1] == [A, D]
+    assert version == graph.path_cache.version
+
+
+def test_only_path_searches(pool, graph):
+    with pytest.raises(ValueError):
+        pool.search(NETWORK, graph, 'transfer', source=A, target=D, value=10)
+
+
+def test_search_timeout_restarts_worker(graph):
+    metrics.reset()
+    pool = PathSearchPool(processes=1)
+    pool.start()
+    try:
+        # the replica is taken in time, only the search in the worker times out
+        pool.search(NETWORK, graph, 'find_path', source=A, target=D, value=10)
+        pool.timeout = 0
+        timed_out_process = pool._idle[0].process
+        with pytest.raises(TimeoutException):
+            pool.search(NETWORK, graph, 'find_path', source=A, target=D, value=10)
+        # the worker is replaced in the background, its slot stays taken until then
+        assert pool._limiter.in_use == 1
+
+        pool.timeout = None
+        assert pool.search(NETWORK, graph, 'find_path', source=A, target=D, value=10)[0][1] == [A, B, C, D]
+        assert metrics.collect()['path_workers_restarts'] == 1
+        assert not timed_out_process.is_alive()
+        assert timed_out_process.exitcode is not None
+        assert pool.search(NETWORK, graph, 'find_path', source=D, target=A, value=10)[0][1] == [D, C, B, A]
+    finally:
+        pool.close()
+
+
+def test_search_waiting_for_busy_workers_times_out(graph):
+    pool = PathSearchPool(processes=1, timeout=0.1)
+    pool.start()
+    try:
+        # the only worker is busy with another search
+        pool._limiter.acquire()
+        start = time.monotonic()
+        with gevent.Timeout(1):
+            with pytest.raises(TimeoutException):
+                pool.search(NETWORK, graph, 'find_path', source=A, target=D, value=10)
+        assert time.monotonic() - start < 0.5
+        assert pool._limiter.number_of_waiting == 0
+    finally:
+        pool.close()
+
+
+def test_compact_storage_required(pool):
+    graph = CurrencyNetworkGraph(100, storage='networkx')
+    graph.update_trustline(A, B, 10, 10)
+    with pytest.raises(ValueError):
+        pool.search(NETWORK, graph, 'find_path', source=A, target=B, value=1)
+
+
+class BrokenContext(object):
+
+    def Pipe(self):
+        raise OSError('cannot start worker')
+
+
+def test_failed_restart_fails_searches(graph):
+    metrics.reset()
+    pool = PathSearchPool(processes=1, restart_attempts=2)
+    pool.restart_interval = 0
+    pool.start()
+    try:
+        pool.search(NETWORK, graph, 'find_path', source=A, target=D, value=10)
+        pool.timeout = 0
+        pool._context = BrokenContext()
+        with pytest.raises(TimeoutException):
+            pool.search(NETWORK, graph, 'find_path', source=A, target=D, value=10)
+        pool.timeout = None
+        # waits for the slot of the worker that is being replaced
+        waiting = gevent.spawn(pool.search, NETWORK, graph, 'find_path', source=A, target=D, value=10)
+        with gevent.Timeout(5):
+            with pytest.raises(TimeoutException):
+                waiting.get()
+        assert pool.failed_workers == 1
+        assert metrics.collect()['path_workers_failures'] == 1
+        with gevent.Timeout(1):
+            with pytest.raises(TimeoutException):
+                pool.search(NETWORK, graph, 'find_path', source=A, target=D, value=10)
+    finally:
+        pool.close()
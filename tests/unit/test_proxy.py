@@ -0,0 +1,136 @@
+import pytest
+from eth_utils import encode_hex, event_abi_to_log_topic
+from web3.utils.events import get_event_data
+
+from relay.blockchain.proxy import Proxy
+
+ADDRESS = '0x' + '1' * 40
+A, B = '0x' + 'a' * 40, '0x' + 'b' * 40
+
+
+def event_abi(name):
+    return {'type': 'event',
+            'name': name,
+            'anonymous': False,
+            'inputs': [{'name': '_from', 'type': 'address', 'indexed': True},
+                       {'name': '_to', 'type': 'address', 'indexed': True},
+                       {'name': '_value', 'type': 'uint256', 'indexed': False}]}
+
+
+transfer_abi = event_abi('Transfer')
+approval_abi = event_abi('Approval')
+issuance_abi = event_abi('Issuance')
+abi = [transfer_abi, approval_abi, issuance_abi]
+
+
+def topic(abi):
+    return encode_hex(event_abi_to_log_topic(abi))
+
+
+def raw_log(topics, value=10, blocknumber=5):
+    return {'address': ADDRESS,
+            'topics': topics,
+            'data': '0x{:064x}'.format(value),
+            'blockNumber': blocknumber,
+            'blockHash': '0x' + '0' * 64,
+            'transactionHash': '0x' + '2' * 64,
+            'transactionIndex': 0,
+            'logIndex': 0}
+
+
+def address_topic(address):
+    return '0x' + '0' * 24 + address[2:]
+
+
+def log_of(event_abi, value=10):
+    return raw_log([topic(event_abi), address_topic(A), address_topic(B)], value)
+
+
+class FilterMock(object):
+
+    def __init__(self, params):
+        self.params = params
+        self.filter_id = 1
+        self.callback = None
+
+    def watch(self, callback):
+        self.callback = callback
+
+    def link_exception(self, function):
+        pass
+
+
+class ContractMock(object):
+
+    def __init__(self, abi, address):
+        self.abi = abi
+        self.address = address
+
+
+class EthMock(object):
+
+    def __init__(self):
+        self.filters = []
+
+    def contract(self, abi, address):
+        return ContractMock(abi, address)
+
+    def filter(self, params):
+        filter = FilterMock(params)
+        self.filters.append(filter)
+        return filter
+
+
+class Web3Mock(object):
+
+    def __init__(self):
+        self.eth = EthMock()
+
+
+@pytest.fixture
+def web3():
+    return Web3Mock()
+
+
+@pytest.fixture
+def proxy(web3):
+    return Proxy(web3, abi, ADDRESS)
+
+
+def test_one_filter_per_contract(proxy, web3):
+    proxy.start_listen_on('Transfer', lambda event: None)
+    proxy.start_listen_on('Approval', lambda event: None)
+    proxy.start_listen_on('Transfer', lambda event: None)
+    assert len(web3.eth.filters) == 1
+    assert web3.eth.filters[0].params['address'] == ADDRESS
+
+
+def test_log_reaches_handlers_of_its_event(proxy, web3):
+    transfers, other_transfers, approvals = [], [], []
+    proxy.start_listen_on('Transfer', transfers.append)
+    proxy.start_listen_on('Transfer', other_transfers.append)
+    proxy.start_listen_on('Approval', approvals.append)
+    callback = web3.eth.filters[0].callback
+
+    callback(log_of(transfer_abi, 10))
+    callback(log_of(approval_abi, 20))
+
+    assert transfers == [get_event_data(transfer_abi, log_of(transfer_abi, 10))]
+    assert other_transfers == transfers
+    assert approvals == [get_event_data(approval_abi, log_of(approval_abi, 20))]
+    assert transfers[0]['event'] == 'Transfer'
+    assert transfers[0]['args']['_value'] == 10
+    assert approvals[0]['args']['_value'] == 20
+
+
+def test_unknown_topic_is_ignored(proxy, web3):
+    transfers = []
+    proxy.start_listen_on('Transfer', transfers.append)
+    callback = web3.eth.filters[0].callback
+
+    callback(raw_log(['0x' + 'f' * 64, address_topic(A), address_topic(B)]))
+    # an event of the contract without listeners
+    callback(log_of(issuance_abi))
+    callback(raw_log([]))
+
+    assert transfers == []
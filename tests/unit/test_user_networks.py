@@ -0,0 +1,87 @@
+from relay.blockchain.currency_network_proxy import Trustline
+from relay.network_graph.graph import CurrencyNetworkGraph
+from relay.user_networks import UserNetworks
+
+NETWORK_A, NETWORK_B, NETWORK_C = '0xNetworkA', '0xNetworkB', '0xNetworkC'
+NETWORKS = [NETWORK_A, NETWORK_B, NETWORK_C]
+A, B, C = '0x0A', '0x0B', '0x0C'
+
+
+class History(object):
+    """the history of the events, with the networks whose history is not read up to the live updates"""
+
+    def __init__(self, networks_of_users, incomplete=()):
+        self.networks_of_users = networks_of_users
+        self.incomplete = set(incomplete)
+        self.calls = []
+
+    def __call__(self, user_address, network_addresses):
+        self.calls.append((user_address, network_addresses))
+        with_events = [address for address in network_addresses
+                       if address in self.networks_of_users.get(user_address, ())]
+        return with_events, [address for address in network_addresses if address in self.incomplete]
+
+
+def test_live_updates_without_history():
+    user_networks = UserNetworks()
+    graph = CurrencyNetworkGraph()
+    graph.on_new_user(lambda address: user_networks.add(NETWORK_B, address))
+    graph.gen_network({A: [Trustline(B, 100, 150)]})
+    user_networks.add(NETWORK_A, A)
+    assert user_networks.networks_with_events(A, NETWORKS) == {NETWORK_A, NETWORK_B}
+    assert user_networks.networks_with_events(B, NETWORKS) == {NETWORK_B}
+    assert user_networks.networks_with_events(C, NETWORKS) == set()
+
+
+def test_live_updates_and_history():
+    history = History({A: {NETWORK_B}})
+    user_networks = UserNetworks(history)
+    user_networks.add(NETWORK_A, A)
+    assert user_networks.networks_with_events(A, NETWORKS) == {NETWORK_A, NETWORK_B}
+    assert user_networks.networks_with_events(B, NETWORKS) == set()
+    # the history of a user is only read once
+    assert user_networks.networks_with_events(A, NETWORKS) == {NETWORK_A, NETWORK_B}
+    assert len(history.calls) == 2
+
+
+def test_incomplete_history_is_read_again():
+    history = History({}, incomplete={NETWORK_C})
+    user_networks = UserNetworks(history)
+    assert user_networks.networks_with_events(A, NETWORKS) == {NETWORK_C}
+    history.networks_of_users = {A: {NETWORK_C}}
+    history.incomplete = set()
+    assert user_networks.networks_with_events(A, NETWORKS) == {NETWORK_C}
+    assert history.calls[-1] == (A, [NETWORK_C])
+
+
+def test_history_of_new_network_is_read():
+    history = History({A: {NETWORK_A, NETWORK_C}})
+    user_networks = UserNetworks(history)
+    assert user_networks.networks_with_events(A, [NETWORK_A, NETWORK_B]) == {NETWORK_A}
+    assert user_networks.networks_with_events(A, NETWORKS) == {NETWORK_A, NETWORK_C}
+    assert history.calls[-1] == (A, [NETWORK_C])
+
+
+def test_user_with_removed_trustline_after_restart():
+    # the only trustline of A was closed before the restart, A only has events in the history
+    restarted_graph = CurrencyNetworkGraph()
+    user_networks = UserNetworks(History({A: {NETWORK_A}, B: {NETWORK_A}, C: {NETWORK_A}}))
+    restarted_graph.on_new_user(lambda address: user_networks.add(NETWORK_A, address))
+    restarted_graph.gen_network({B: [Trustline(C, 200, 250)]})
+
+    assert A not in restarted_graph.users
+    assert user_networks.networks_with_events(A, NETWORKS) == {NETWORK_A}
+
+
+def test_read_histories_of_least_recently_queried_users_are_dropped():
+    history = History({A: {NETWORK_A}})
+    user_networks = UserNetworks(history, max_read_users=2)
+    user_networks.networks_with_events(A, NETWORKS)
+    user_networks.networks_with_events(B, NETWORKS)
+    user_networks.networks_with_events(A, NETWORKS)
+    user_networks.networks_with_events(C, NETWORKS)
+    assert len(history.calls) == 3
+    # the history of B is read again, A still has its events
+    assert user_networks.networks_with_events(B, NETWORKS) == set()
+    assert user_networks.networks_with_events(A, NETWORKS) == {NETWORK_A}
+    assert [user_address for user_address, _ in history.calls] == [A, B, C, B, A]